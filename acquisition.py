@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Acquisition
+Runs telemetry acquisition on its own thread so dashboard rendering never stalls sampling. Each tick writes one timestamped row into a TelemetryStore; loggers and individual attributes only re-read their streams when their own sample period has elapsed.
+
+Acquisition(args) sets up the whole acquisition side from the command line: the krpc, simulated or replayed connection, the loggers, the store with its subscriptions, recorders and other vessels. The dashboard and the telemetry hub share it.
+"""
+
+import concurrent.futures
+import os
+import threading
+import time
+import numpy as np
+import alerts
+import fleet
+import flight_recorder
+import instrumentation
+import krpc_logger
+import krpc_sim
+import subscriptions
+import supervisor
+import telemetry_config
+import telemetry_store
+
+# What the scheduler does when a tick runs past the next deadline:
+#   skip      drop the missed deadlines and wait for the next one on the
+#             original grid
+#   coalesce  run one tick straight away in place of all the missed ones,
+#             then keep the period from there
+#   adaptive  coalesce, and stretch the period to fit the ticks, shrinking it
+#             back as they get faster again
+OVERRUN_POLICIES = ['skip', 'coalesce', 'adaptive']
+
+class AcquisitionScheduler:
+    def __init__(self, store, period, clock=time.monotonic, overrun='coalesce', max_period=None):
+        assert(overrun in OVERRUN_POLICIES), "Unknown overrun policy: {}".format(overrun)
+        self.store = store
+        self.period = period
+        self.clock = clock
+        self.overrun = overrun
+        # The adaptive policy keeps the period between these
+        self.base_period = period
+        self.max_period = 10*period if max_period is None else max_period
+        # Called with the scheduler clock before each tick, e.g. to advance a
+        # simulated or replayed connection
+        self.tick_hooks = []
+        # Objects with write(values, timestamp), e.g. a FlightRecorder, that
+        # receive every committed row
+        self.sinks = []
+        # An instrumentation.Metrics to time every stage of each tick, or None
+        self.metrics = None
+        # Called with (lateness, missed deadlines) after each overrun
+        self.overrun_hooks = []
+        # In event-driven acquisition, the telemetry_store.EventLog that rows
+        # are taken from instead of reading the loggers' streams
+        self.event_log = None
+        # A supervisor.Supervisor that reconnects after connection failures,
+        # or None to stop on them. Gap rows keep these columns' values.
+        self.supervisor = None
+        self.gap_columns = []
+        self._last_timestamp = -np.inf
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def tick(self):
+        if self.metrics is not None:
+            return(self.timed_tick())
+        now = self.clock()
+        for hook in self.tick_hooks:
+            hook(now)
+        timestamp = self.timestamp()
+        self.sample(now, timestamp)
+        if self.sinks:
+            # Only this thread writes to the store, so the row stays put
+            row = self.store.view(1)[0]
+            for sink in self.sinks:
+                sink.write(row, timestamp)
+
+    def timed_tick(self):
+        # tick() with each stage timed into self.metrics
+        start = time.perf_counter()
+        now = self.clock()
+        for hook in self.tick_hooks:
+            hook(now)
+        hooks_done = time.perf_counter()
+        timestamp = self.timestamp()
+        self.sample(now, timestamp)
+        sample_done = time.perf_counter()
+        if self.sinks:
+            row = self.store.view(1)[0]
+            for sink in self.sinks:
+                sink.write(row, timestamp)
+        end = time.perf_counter()
+        self.metrics.histogram("tick_hooks").record(hooks_done - start)
+        self.metrics.histogram("sample").record(sample_done - hooks_done)
+        self.metrics.histogram("sinks").record(end - sample_done)
+        self.metrics.histogram("tick").record(end - start)
+        self.metrics.count("ticks")
+
+    def sample(self, now, timestamp):
+        if self.event_log is None:
+            self.store.sample_due(now, timestamp)
+        else:
+            self.store.sample_from(self.event_log.latest_values(), timestamp)
+
+    def timestamp(self):
+        # Wall clock time for the row, held back from ever going backwards
+        # (e.g. a clock step) so the store's times stay ordered
+        timestamp = max(time.time(), self._last_timestamp + 1e-6)
+        self._last_timestamp = timestamp
+        return(timestamp)
+
+    def run(self):
+        next_tick = self.clock()
+        while not self._stop.is_set():
+            started = self.clock()
+            if self.metrics is not None:
+                # How late this tick starts against its deadline
+                self.metrics.histogram("tick_jitter").record(started - next_tick)
+            try:
+                self.tick()
+            except StopIteration:
+                # A tick hook has run out of data, e.g. the end of a replay
+                break
+            except Exception as e:
+                if self.supervisor is None or not self.supervisor.failure(e):
+                    raise
+                if not self.recover(e):
+                    break
+                next_tick = self.clock()
+                continue
+            if not self.period:
+                # As fast as possible, there is no deadline to miss
+                continue
+            next_tick += self.period
+            now = self.clock()
+            if now < next_tick:
+                if self.overrun == 'adaptive':
+                    self.relax(now - started)
+                self._stop.wait(next_tick - now)
+            else:
+                next_tick = self.overran(now, next_tick, now - started)
+                if self.overrun == 'skip':
+                    # Back onto the grid at the next deadline not yet missed
+                    self._stop.wait(next_tick - self.clock())
+
+    def recover(self, error):
+        """Mark the outage with a gap row and have the supervisor reconnect. False if stopped meanwhile."""
+        print("Acquisition interrupted: {}".format(error))
+        self.gap(self.timestamp())
+        reconnects = self.supervisor.reconnects
+        recovered = self.supervisor.recover(error, self._stop)
+        if recovered:
+            print("Acquisition resumed")
+            if self.metrics is not None:
+                self.metrics.count("reconnects", self.supervisor.reconnects - reconnects)
+        return(recovered)
+
+    def gap(self, timestamp):
+        self.store.gap(timestamp, self.gap_columns)
+        row = self.store.view(1)[0]
+        for sink in self.sinks:
+            sink.write(row, timestamp)
+        if self.metrics is not None:
+            self.metrics.count("gaps")
+
+    def overran(self, now, next_tick, duration):
+        """Apply the overrun policy once a tick has run past the next deadline, returning the new deadline."""
+        lateness = now - next_tick
+        # The deadlines already passed, the one at next_tick included
+        missed = int(lateness // self.period) + 1
+        if self.overrun == 'skip':
+            next_tick += missed*self.period
+            dropped = missed
+        else:
+            # The tick about to run stands in for all of them
+            if self.overrun == 'adaptive':
+                self.stretch(duration)
+            next_tick = now
+            dropped = missed - 1
+        if self.metrics is not None:
+            self.metrics.count("late_ticks")
+            self.metrics.count("dropped_ticks", dropped)
+            self.metrics.histogram("overrun").record(lateness)
+        for hook in self.overrun_hooks:
+            hook(lateness, missed)
+        return(next_tick)
+
+    def stretch(self, duration):
+        # Some headroom over the tick that overran
+        self.period = min(max(1.5*duration, self.period), self.max_period)
+        self.report_period()
+
+    def relax(self, duration):
+        # Back towards the configured period while the ticks have headroom
+        target = max(1.5*duration, self.base_period)
+        if self.period > target:
+            self.period = max(target, 0.9*self.period)
+            self.report_period()
+
+    def report_period(self):
+        if self.metrics is not None:
+            self.metrics.set("period", self.period)
+
+    def running(self):
+        # False once stopped or out of data, e.g. at the end of a replay
+        return(self._thread is not None and self._thread.is_alive())
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="ktydid_acquisition", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        for sink in self.sinks:
+            sink.close()
+
+def open_recorder(path, column_labels, rotate_interval=None, metadata=None):
+    """A recording sink for the path: Parquet or Arrow by extension, otherwise a binary flight recording."""
+    if flight_recorder.is_columnar_path(path):
+        # pyarrow is only needed for columnar recordings
+        import columnar_recorder
+        return(columnar_recorder.ColumnarRecorder(path, column_labels, rotate_interval=rotate_interval, metadata=metadata))
+    return(flight_recorder.FlightRecorder(path, column_labels, metadata=metadata))
+
+class ProjectedSink:
+    """A sink that only passes some columns of each row on to another, e.g. a recorder of a profile's sink."""
+    def __init__(self, sink, columns):
+        self.sink = sink
+        self.columns = np.asarray(columns)
+
+    def write(self, values, timestamp):
+        self.sink.write(values[self.columns], timestamp)
+
+    def close(self):
+        self.sink.close()
+
+def vessel_path(path, name):
+    # Another vessel's recording goes next to the main one, keeping the extension
+    root, extension = os.path.splitext(path)
+    return("{}.{}{}".format(root, "".join(c if c.isalnum() else "_" for c in name), extension))
+
+def add_arguments(parser):
+    parser.add_argument(
+        "-s",
+        "--simulate_krpc",
+        help="simulate connection to KSP/krpc",
+        type=bool,
+        default=False
+    )
+    parser.add_argument(
+        "--seed",
+        help="Random seed for the simulated vessel",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--sim_loggers",
+        help="Extra synthetic loggers to simulate, for load testing",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--sim_attributes",
+        help="Attributes per synthetic logger",
+        type=int,
+        default=10
+    )
+    parser.add_argument(
+        "--sim_vessels",
+        help="Extra simulated vessels to launch alongside the active one",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--all_vessels",
+        help="Also log every other vessel, attaching and detaching them as they come and go",
+        action="store_true"
+    )
+    parser.add_argument(
+        "-p",
+        "--period",
+        help="Data polling period in seconds (default the profile's period)",
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        "--overrun",
+        help="What to do when sampling falls behind the polling period: skip the missed ticks, coalesce them into one, or adapt the period",
+        choices=OVERRUN_POLICIES,
+        default="coalesce"
+    )
+    parser.add_argument(
+        "--max_period",
+        help="Longest period the adaptive overrun policy may stretch to, in seconds (default 10 polling periods)",
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        "--events",
+        help="Event-driven acquisition: record every stream update as it arrives rather than polling, -p only sets the dashboard's sample grid",
+        action="store_true"
+    )
+    parser.add_argument(
+        "-o",
+        "--record",
+        help="Record all telemetry to this file: a binary flight recording, or Parquet/Arrow for a .parquet/.arrow path",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        "--rotate",
+        help="Start a new Parquet/Arrow recording file every this many seconds",
+        type=float,
+        default=None
+    )
+
+    parser.add_argument(
+        "--replay",
+        help="Drive the dashboard from a binary flight recording instead of krpc",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        "--speed",
+        help="Replay speed as a multiple of real time, 0 replays as fast as possible",
+        type=float,
+        default=1.0
+    )
+
+    parser.add_argument(
+        "-c",
+        "--config",
+        help="Telemetry profile declaring the loggers, recordings and dashboard panels (default profiles/default.json)",
+        type=str,
+        default=None
+    )
+
+    parser.add_argument(
+        "--shape_cache",
+        help="File caching the column layout of each logger between launches",
+        type=str,
+        default=os.path.join(os.path.expanduser("~"), ".ktydid", "stream_shapes.json")
+    )
+
+    parser.add_argument(
+        "--metrics",
+        help="Dump pipeline timing statistics to this JSON file on exit",
+        type=str,
+        default=None
+    )
+
+    parser.add_argument(
+        "--max_backoff",
+        help="Longest wait between reconnection attempts after the krpc connection drops, in seconds",
+        type=float,
+        default=30.0
+    )
+
+    parser.add_argument(
+        "-a",
+        "--address",
+        help="ip address",
+        type=str,
+        default="localhost"
+    )
+
+class Acquisition:
+    def __init__(self, args):
+        self.args = args
+        self.period = args.period
+
+        # The profile declares the loggers and what they stream. The loggers
+        # of other vessels pick it up too.
+        self.profile = telemetry_config.load(args.config)
+        if self.period is None:
+            self.period = self.profile.period
+        self.time_columns = self.profile.time_columns
+
+        # Set up krpc connection and objects
+        self.shape_cache = None
+        if args.replay is not None:
+            print("Replaying recording:", args.replay)
+            conn = flight_recorder.ReplayConnection(flight_recorder.open_recording(args.replay), args.speed)
+            objects = lambda spec: conn.object(spec.name)
+            if not args.speed:
+                self.period = 0
+        else:
+            if args.simulate_krpc:
+                # Each tick advances the simulation by one polling period, or
+                # by the periods of the ticks it stands in for after an overrun
+                print("Simulating krpc connection")
+                conn = krpc_sim.SimulatedConnection(seed=args.seed, step=self.period or 0.1)
+                for i in range(args.sim_vessels):
+                    conn.launch()
+            else:
+                print("Setting up krpc connection")
+                conn = self.connect()
+            space_center = conn.space_center
+            vessel = space_center.active_vessel
+            objects = lambda spec: spec.resolve(space_center, vessel)
+            self.shape_cache = krpc_logger.ShapeCache(args.shape_cache, vessel.name)
+        self.connection = conn
+
+        # Only attributes that are plotted or recorded are streamed, see the
+        # subscriptions below. Loggers set up their streams concurrently, so
+        # their waits for the first stream values overlap.
+        with concurrent.futures.ThreadPoolExecutor(max(1, len(self.profile.loggers))) as executor:
+            self.loggable_list = self.profile.build_loggers(conn, objects, executor, lazy=True, shape_cache=self.shape_cache)
+        synthetic_list = krpc_sim.synthetic_loggers(conn, args.sim_loggers, args.sim_attributes, lazy=True, shape_cache=self.shape_cache) if args.simulate_krpc else []
+        self.loggable_list += synthetic_list
+        self.store = telemetry_store.TelemetryStore.from_loggables(self.loggable_list, capacity=10000)
+        self.registry = subscriptions.SubscriptionRegistry(self.store)
+        self.registry.subscribe('time', self.time_columns)
+        # Synthetic loggers exist to load the pipeline, so they always stream
+        self.registry.subscribe('synthetic', [label for loggable in synthetic_list for label in loggable.column_labels])
+
+        # Acquisition runs on its own thread; consumers pick up whatever rows
+        # were committed since they last looked.
+        self.scheduler = AcquisitionScheduler(self.store, self.period, overrun=args.overrun, max_period=args.max_period)
+        self.metrics = instrumentation.Metrics()
+        self.store.metrics = self.metrics
+        self.scheduler.metrics = self.metrics
+        if args.replay is not None or args.simulate_krpc:
+            self.scheduler.tick_hooks.append(conn.advance)
+
+        # Stream updates are logged as they arrive, and each tick only copies
+        # the latest values into a row. A replay has no updates to call back.
+        self.event_log = None
+        if args.events and args.replay is None:
+            self.event_log = telemetry_store.EventLog(self.store.column_labels)
+            for loggable, columns in self.store.loggable_slices:
+                loggable.watch(self.event_log.watcher(columns.start))
+            self.scheduler.event_log = self.event_log
+        # The active vessel's recordings, among the scheduler's other sinks
+        self.recorders = []
+        if args.record is not None:
+            print("Recording telemetry to:", args.record)
+            recorder = open_recorder(args.record, self.store.column_labels, args.rotate)
+            self.registry.subscribe_all(recorder)
+            self.recorders.append(recorder)
+            self.scheduler.sinks.append(recorder)
+        # Recordings the profile asks for, each of its own columns
+        for sink in self.profile.sinks:
+            columns = sink.get('columns', self.store.column_labels)
+            missing = [label for label in columns if label not in self.store.column_index]
+            if missing:
+                raise telemetry_config.ProfileError("{}: sink {} records unknown columns {}".format(self.profile.path, sink['path'], missing))
+            print("Recording telemetry to:", sink['path'])
+            recorder = ProjectedSink(open_recorder(sink['path'], columns, sink.get('rotate')), [self.store.column_index[label] for label in columns])
+            self.registry.subscribe(recorder, columns)
+            self.recorders.append(recorder)
+            self.scheduler.sinks.append(recorder)
+
+        # Limit checks run on every row, ahead of the recorders, and their
+        # events are logged next to the recording. Their columns are streamed
+        # like any other consumer's.
+        self.alerts = None
+        if self.profile.alerts:
+            recordings = [args.record] if args.record is not None else [sink['path'] for sink in self.profile.sinks]
+            self.alerts = alerts.AlertEngine(
+                self.profile.alerts,
+                self.store.column_labels,
+                self.time_columns,
+                alerts.log_path(recordings[0]) if recordings else None
+            )
+            print("Checking {} alert limits".format(len(self.alerts.checks)))
+            self.registry.subscribe(self.alerts, self.alerts.columns)
+            self.scheduler.sinks.insert(0, self.alerts)
+
+        # The other vessels each get their own loggers and store, and a
+        # recording next to the active vessel's one.
+        self.fleet = None
+        if args.all_vessels and args.replay is None:
+            self.fleet = fleet.Fleet(conn, space_center, ignore=[vessel], loggable_options={'profile': self.profile, 'shape_cache': self.shape_cache})
+            if args.record is not None:
+                self.fleet.on_attach.append(lambda telemetry: telemetry.sinks.append(open_recorder(
+                    vessel_path(args.record, telemetry.name),
+                    telemetry.store.column_labels,
+                    args.rotate,
+                    metadata={'vessel': telemetry.name}
+                )))
+            if self.profile.alerts:
+                self.fleet.on_attach.append(lambda telemetry: telemetry.sinks.append(alerts.AlertEngine(
+                    self.profile.alerts,
+                    telemetry.store.column_labels,
+                    self.time_columns,
+                    None if args.record is None else alerts.log_path(vessel_path(args.record, telemetry.name)),
+                    vessel=telemetry.name
+                )))
+            self.scheduler.tick_hooks.append(self.fleet.tick)
+
+        # A live connection is watched and re-established when it drops, and
+        # the loggers follow the active vessel. Gaps keep the time columns.
+        self.supervisor = None
+        if args.replay is None and not args.simulate_krpc:
+            self.supervisor = supervisor.Supervisor(
+                conn, self.connect, self.rebuild, lambda connection: connection.space_center.active_vessel,
+                max_backoff=args.max_backoff
+            )
+            self.scheduler.supervisor = self.supervisor
+            self.scheduler.tick_hooks.insert(0, self.supervisor.check)
+        self.scheduler.gap_columns = [label for label in self.time_columns if label in self.store.column_index]
+
+    def connect(self):
+        # Simulated and replayed runs never load krpc
+        import krpc
+        return(krpc.connect(name='ksp_telemetry_server', address=self.args.address))
+
+    def rebuild(self, connection):
+        """Set every logger up again on a new connection, or on a new active vessel. Returns the active vessel."""
+        space_center = connection.space_center
+        vessel = space_center.active_vessel
+        print("Logging vessel:", vessel.name)
+        self.shape_cache = krpc_logger.ShapeCache(self.args.shape_cache, vessel.name)
+        for loggable, spec in zip(self.loggable_list, self.profile.loggers.values()):
+            loggable.shape_cache = self.shape_cache
+            try:
+                loggable.rebind(connection, spec.resolve(space_center, vessel))
+            except ValueError as e:
+                # The store's columns are fixed, so wait for a vessel that fits them
+                raise supervisor.RebuildFailed("{}: {}".format(vessel.name, e))
+        if self.fleet is not None:
+            self.fleet.reconnect(connection, space_center, ignore=[vessel])
+        self.connection = connection
+        return(vessel)
+
+    def start(self):
+        self.scheduler.start()
+
+    def stop(self):
+        self.scheduler.stop()
+        if self.args.metrics is not None:
+            self.metrics.dump(self.args.metrics)
+        self.registry.close()
+        if self.fleet is not None:
+            self.fleet.close()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Alerts
+Limit checking on every sampled row. Rules are thresholds on a column (above or below a limit) or on its rate of change, each with hysteresis so a value hovering at the limit raises one alert rather than one every tick:
+
+    {"name": "high_g", "column": "flight_g_force", "above": 4.0, "hysteresis": 0.5, "severity": "critical"}
+    {"name": "fuel_low", "column": "*_amount", "below": 50.0}
+    {"name": "pitch_rate", "column": "flight_pitch", "rate_above": 10.0}
+
+A column may be a glob pattern or a list of them, giving one check per matching column. All checks are compiled into arrays over the row, so a tick costs a handful of NumPy operations however many there are, plus a little Python only for the checks that change state. Raised and cleared alerts are kept as events, passed to hooks (e.g. dashboard annotations) and appended to a JSON-lines event log next to the recording.
+"""
+
+import collections
+import fnmatch
+import json
+import os
+import threading
+import numpy as np
+
+SEVERITIES = ['info', 'warning', 'critical']
+CHECKS = ['above', 'below', 'rate_above']
+
+class AlertError(ValueError):
+    pass
+
+def compile_rules(rules, column_labels, where='alerts'):
+    """Check rule declarations, expanding column patterns against the column labels. Patterns that match nothing are left out."""
+    checks = []
+    for rule in rules:
+        if 'name' not in rule or 'column' not in rule:
+            raise AlertError("{}: every rule needs a 'name' and a 'column'".format(where))
+        unknown = set(rule) - {'name', 'column', 'hysteresis', 'severity'} - set(CHECKS)
+        kinds = [kind for kind in CHECKS if kind in rule]
+        if unknown or len(kinds) != 1:
+            raise AlertError("{}: rule {} needs exactly one of {}{}".format(
+                where, rule['name'], CHECKS, ", unknown keys {}".format(sorted(unknown)) if unknown else ""
+            ))
+        if rule.get('severity', 'warning') not in SEVERITIES:
+            raise AlertError("{}: rule {} severity must be one of {}".format(where, rule['name'], SEVERITIES))
+        patterns = rule['column'] if isinstance(rule['column'], list) else [rule['column']]
+        matched = [label for label in column_labels if any(fnmatch.fnmatchcase(label, pattern) for pattern in patterns)]
+        for label in matched:
+            checks.append({
+                'name': rule['name'],
+                'column': label,
+                'check': kinds[0],
+                'limit': float(rule[kinds[0]]),
+                'hysteresis': float(rule.get('hysteresis', 0.0)),
+                'severity': rule.get('severity', 'warning'),
+            })
+    return(checks)
+
+class AlertEngine:
+    """
+    Evaluates compiled rules against rows of a store. It is an
+    AcquisitionScheduler sink: write() is called with every committed row.
+    Rates are per unit of the time column (sc_ut by default), falling back to
+    the row timestamp.
+    """
+    def __init__(self, rules, column_labels, time_columns=('sc_ut', 'vessel_met'), log_path=None, capacity=1000, vessel=None):
+        column_labels = list(column_labels)
+        # Events name the vessel when several are checked
+        self.vessel = vessel
+        self.checks = compile_rules(rules, column_labels)
+        index = {label: i for i, label in enumerate(column_labels)}
+        self.columns = [check['column'] for check in self.checks]
+        self.column_index = np.array([index[label] for label in self.columns], dtype=np.intp)
+        # Every check is "metric > threshold": a below check is an above check
+        # of the negated value, a rate check one of the absolute rate
+        self.sign = np.array([-1.0 if check['check'] == 'below' else 1.0 for check in self.checks])
+        self.rate = np.array([check['check'] == 'rate_above' for check in self.checks], dtype=bool)
+        self.threshold = self.sign*np.array([check['limit'] for check in self.checks])
+        self.release = self.threshold - np.array([check['hysteresis'] for check in self.checks])
+        self.active = np.zeros(len(self.checks), dtype=bool)
+
+        self.time_columns = [label for label in time_columns if label in index]
+        self.time_index = [index[label] for label in self.time_columns]
+        self.rate_time = index.get(self.time_columns[0]) if self.time_columns else None
+        self.last_values = None
+        self.last_time = None
+
+        # The newest `capacity` events, and a count of all of them
+        self.events = collections.deque(maxlen=capacity)
+        self.total_events = 0
+        self.lock = threading.Lock()
+        # Called with each event as it happens
+        self.hooks = []
+        self.log = None if log_path is None else open(log_path, 'a')
+
+    def write(self, values, timestamp):
+        if not len(self.checks):
+            return
+        current = values[self.column_index]
+        t = timestamp if self.rate_time is None or np.isnan(values[self.rate_time]) else values[self.rate_time]
+        metric = self.sign*current
+        if self.rate.any():
+            rate = np.full(len(current), np.nan)
+            if self.last_values is not None and t > self.last_time:
+                rate = np.abs(current - self.last_values)/(t - self.last_time)
+            metric = np.where(self.rate, rate, metric)
+            self.last_values, self.last_time = current.copy(), t
+        # NaNs (e.g. an unstreamed column) compare False, so they change nothing
+        raised = ~self.active & (metric > self.threshold)
+        cleared = self.active & (metric < self.release)
+        if not (raised.any() or cleared.any()):
+            return
+        self.active ^= raised | cleared
+        times = {label: float(values[i]) for label, i in zip(self.time_columns, self.time_index)}
+        # The value checked: the column's, or its rate for a rate check
+        checked = self.sign*metric
+        for i in np.flatnonzero(raised | cleared):
+            self.emit(i, 'raised' if raised[i] else 'cleared', float(checked[i]), timestamp, times)
+
+    def emit(self, i, state, value, timestamp, times):
+        check = self.checks[i]
+        event = dict(
+            time=timestamp,
+            name=check['name'],
+            column=check['column'],
+            state=state,
+            severity=check['severity'],
+            value=value,
+            check=check['check'],
+            limit=check['limit'],
+            **times
+        )
+        if self.vessel is not None:
+            event['vessel'] = self.vessel
+        with self.lock:
+            self.events.append(event)
+            self.total_events += 1
+        if self.log is not None:
+            self.log.write(json.dumps(event) + "\n")
+            self.log.flush()
+        for hook in self.hooks:
+            hook(event)
+
+    def events_since(self, total_events):
+        """Retained events after the engine had seen `total_events` of them."""
+        with self.lock:
+            n = min(self.total_events - total_events, len(self.events))
+            return(list(self.events)[len(self.events) - n:] if n > 0 else [])
+
+    def active_alerts(self):
+        return([self.checks[i] for i in np.flatnonzero(self.active)])
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+def log_path(recording_path):
+    """Where the event log of a recording goes, e.g. flight.alerts.jsonl next to flight.ktr."""
+    return(os.path.splitext(recording_path)[0] + '.alerts.jsonl')
+
+def read_log(path):
+    with open(path) as f:
+        return([json.loads(line) for line in f if line.strip()])
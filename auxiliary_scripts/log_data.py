@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
-# A simple logging script for kRPC
+# A simple logging script for kRPC. The configfile is a telemetry profile
+# (see telemetry_config.py and profiles/log_data.json) listing the objects
+# and attributes to log. Its sample periods set how often the server sends
+# each stream. If the connection drops it reconnects, leaving a gap row in
+# the log.
 
 # Ian Dahlke, 2019
 #    credit Alexander Korsunsky, 2016
@@ -10,47 +14,149 @@ import argparse
 import csv
 import krpc
 import numpy as np
+import os
 import sys
+import threading
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import flight_recorder
+import supervisor
+import telemetry_config
+
 # Parse Arguments
 parser = argparse.ArgumentParser()
 parser.add_argument("outfile", help="Output filename")
-parser.add_argument("configfile", help="Config filename")
+parser.add_argument("configfile", help="Telemetry profile, e.g. profiles/log_data.json")
 parser.add_argument("-i", "--interval", help="Interval", type=float, default=1.0)
+parser.add_argument("-b", "--binary", help="Write a binary flight recording instead of CSV", action="store_true")
+parser.add_argument("-e", "--events", help="Log a line whenever the server sends new values instead of every interval", action="store_true")
+parser.add_argument("--rotate", help="Start a new file every this many seconds (Parquet/Arrow only)", type=float, default=None)
 args = parser.parse_args()
 
 outfilename = args.outfile
 config_filename = args.configfile
 interval = args.interval
+binary = args.binary
+# A .parquet or .arrow outfile is written as a compressed columnar recording
+columnar = flight_recorder.is_columnar_path(outfilename)
+
+# Load logging items, checked before connecting
+profile = telemetry_config.load(config_filename)
+for spec in profile.loggers.values():
+    if spec.attributes is None:
+        parser.error("{}: logger {} must list its attributes".format(config_filename, spec.name))
+
+def connect():
+    print("Setting up connection")
+    connection = krpc.connect(name='log_launch_telemetry')
+    print(connection.krpc.get_status().version)
+    return(connection)
 
-# Get Connection
-print("Setting up connection")
-conn = krpc.connect(name='log_launch_telemetry')
-print(conn.krpc.get_status().version)
-
-space_center = conn.space_center
-vessel = space_center.active_vessel
-flight = vessel.flight(vessel.orbit.body.reference_frame)
-orbit = vessel.orbit
-auto_pilot = vessel.auto_pilot
-
-# Define/load logging items
-log_items = {
-    'space_center':['ut'],
-    'vessel':['met', 'thrust', 'mass'],
-    'flight':['mean_altitude', 'speed', 'dynamic_pressure', 'lift', 'drag', 'angle_of_attack', 'pitch', 'heading'],
-    'orbit':['apoapsis_altitude', 'periapsis_altitude']
-    }
-
-# Set up streams for telemetry
+log_items = {name: list(spec.attributes) for name, spec in profile.loggers.items()}
+
+conn = None
 stream_list = []
 
-print("Logging items:")
-for category in log_items:
-    for log_name in log_items[category]:
-        print("...", category, log_name)
-        stream_list += [conn.add_stream(getattr, globals()[category], log_name)]
+def setup_streams(connection):
+    # Streams for every logged item, on a new connection or active vessel.
+    # On a vessel switch the old vessel's streams are removed from the server.
+    global conn, stream_list
+    if connection is conn:
+        for stream in stream_list:
+            stream.remove()
+    conn = connection
+    space_center = conn.space_center
+    vessel = space_center.active_vessel
+    stream_list = []
+    print("Logging items:")
+    for category, spec in profile.loggers.items():
+        loggable_object = spec.resolve(space_center, vessel)
+        for log_name, options in spec.attributes.items():
+            print("...", category, log_name)
+            stream = conn.add_stream(getattr, loggable_object, log_name)
+            sample_period = options.get('sample_period', spec.sample_period)
+            if sample_period:
+                stream.rate = 1/sample_period
+            stream_list += [stream]
+    return(vessel)
+
+# A dropped connection or a vessel switch sets the streams up again, with a
+# gap row in the log in between
+connection = connect()
+setup_streams(connection)
+watchdog = supervisor.Supervisor(connection, connect, setup_streams, lambda connection: connection.space_center.active_vessel)
+stopped = threading.Event()
+# Gap rows keep these, so the log's time columns stay in order
+kept_columns = ['ut', 'met']
+
+def wait():
+    # kRPC only sends values that changed, so an update is something new
+    if args.events:
+        with conn.stream_update_condition:
+            conn.wait_for_stream_update(watchdog.check_period)
+    else:
+        time.sleep(interval)
+
+def read_line():
+    """The next line of stream values, or None after an outage, once a gap row is due."""
+    try:
+        watchdog.check(time.monotonic())
+        return([stream() for stream in stream_list])
+    except Exception as e:
+        if not watchdog.failure(e):
+            raise
+        print("Logging interrupted: {}".format(e))
+        if not watchdog.recover(e, stopped):
+            raise
+        print("Logging resumed")
+        return(None)
+
+def log_recording():
+    # Tuple values are split into one column per element, like krpc_logger
+    header = [item for category in log_items for item in log_items[category]]
+    first = [stream() for stream in stream_list]
+    column_labels = []
+    for name, value in zip(header, first):
+        if type(value) is tuple:
+            column_labels += ["{}_{}".format(name, i) for i in range(len(value))]
+        else:
+            column_labels.append(name)
+    row = np.empty(len(column_labels))
+    # Columns a gap row leaves NaN
+    gap_columns = [i for i, label in enumerate(column_labels) if label not in kept_columns]
+
+    if columnar:
+        import columnar_recorder
+        print("Logging columnar data to: ", outfilename)
+        recorder = columnar_recorder.ColumnarRecorder(outfilename, column_labels, rotate_interval=args.rotate)
+    else:
+        print("Logging binary data to: ", outfilename)
+        recorder = flight_recorder.FlightRecorder(outfilename, column_labels)
+    with recorder:
+        print("Starting log. Please stop it by pressing Control-C")
+        try:
+            while True:
+                line = read_line()
+                if line is None:
+                    row[gap_columns] = np.nan
+                else:
+                    i = 0
+                    for value in line:
+                        if type(value) is tuple:
+                            row[i:i + len(value)] = value
+                            i += len(value)
+                        else:
+                            row[i] = value
+                            i += 1
+                recorder.write(row)
+                wait()
+        except KeyboardInterrupt:
+            print("\nThanks for logging. Bye!")
+
+if binary or columnar:
+    log_recording()
+    sys.exit()
 
 # Set up output file and log
 print("Logging CSV data to: ", outfilename)
@@ -63,10 +169,15 @@ with open(outfilename, 'w') as out_file:
     # Main Logging Loop
     print("Starting log. Please stop it by pressing Control-C")
     try:
+        last = [np.nan]*len(header)
         while True:
-            line = [stream() for stream in stream_list]
+            line = read_line()
+            if line is None:
+                line = [value if name in kept_columns else np.nan for name, value in zip(header, last)]
+            else:
+                last = line
             csv_writer.writerow(line)
             out_file.flush()
-            time.sleep(interval)
-    except KeyboardInterrupt as e:
+            wait()
+    except KeyboardInterrupt:
         print("\nThanks for logging. Bye!")
\ No newline at end of file
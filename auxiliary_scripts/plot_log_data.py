@@ -1,11 +1,38 @@
 #!/usr/bin/env python3
 
+import argparse
 import matplotlib.pyplot as plt
+import os
 import pandas as pd
-
-df = pd.read_csv('test.csv', sep=' ', quotechar='|')
-df.loc[:,'ut']=pd.to_datetime(df.loc[:,'ut'], unit='s')
-df = df.set_index('ut')
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import flight_recorder
+import telemetry_query
+
+parser = argparse.ArgumentParser()
+parser.add_argument("logfile", help="CSV log, binary flight recording or Parquet/Arrow recording", nargs='?', default='test.csv')
+parser.add_argument("--start", help="First ut to plot", type=float, default=None)
+parser.add_argument("--end", help="Last ut to plot", type=float, default=None)
+parser.add_argument("--resample", help="Average into bins of this many seconds", type=float, default=None)
+parser.add_argument("-o", "--outfile", help="Output image", default='test.png')
+args = parser.parse_args()
+
+log_filename = args.logfile
+plotted = ['ut', 'thrust', 'mean_altitude', 'angle_of_attack', 'pitch', 'apoapsis_altitude', 'periapsis_altitude']
+
+if flight_recorder.is_columnar_path(log_filename) or os.path.isdir(log_filename):
+    # Columnar recordings are read a column at a time, only the plotted ones
+    import columnar_recorder
+    source = columnar_recorder.open_columnar(log_filename)
+elif flight_recorder.is_recording(log_filename):
+    # Binary recordings are memory mapped, nothing is parsed
+    source = flight_recorder.open_recording(log_filename)
+else:
+    source = pd.read_csv(log_filename, sep=' ', quotechar='|', usecols=plotted)
+# Only the rows in the window are read
+df = telemetry_query.query_dataframe(source, plotted, args.start, args.end, key='ut', resample=args.resample)
+df.index = pd.to_datetime(df.index, unit='s')
 
 fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(16,10), sharex=True)
 
@@ -22,4 +49,4 @@ df4 = df.loc[:,['apoapsis_altitude', 'periapsis_altitude']]
 df4.plot(ax=axes[1,1])
 
 plt.tight_layout()
-fig.savefig('test.png')
\ No newline at end of file
+fig.savefig(args.outfile)
\ No newline at end of file
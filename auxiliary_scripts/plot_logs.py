@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+# Renders a report figure for every flight log in a directory, in parallel.
+# The figure is described by a JSON spec, by default the four panels of
+# plot_log_data.py:
+#     {
+#         "key": "ut",
+#         "resample": null,
+#         "layout": [2, 2],
+#         "figsize": [16, 10],
+#         "panels": [
+#             {"title": "Thrust", "columns": ["thrust"]},
+#             ...
+#         ]
+#     }
+# Logs can be CSV, binary flight recordings or Parquet/Arrow recordings
+# (rotated files count as one log). Only the columns the panels use are
+# decoded, a chunk at a time. A manifest in the output directory records
+# each log's size, modification time and the spec, so re-runs only render
+# new or changed logs.
+#
+# python plot_logs.py <logdir> [-s spec.json] [-o outdir] [-j jobs]
+
+# Ian Dahlke, 2020
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import flight_recorder
+import telemetry_query
+
+DEFAULT_SPEC = {
+    'key': 'ut',
+    'resample': None,
+    'layout': [2, 2],
+    'figsize': [16, 10],
+    'panels': [
+        {'title': "Thrust", 'columns': ['thrust']},
+        {'title': "Altitude", 'columns': ['mean_altitude']},
+        {'title': "Attitude", 'columns': ['angle_of_attack', 'pitch']},
+        {'title': "Orbit", 'columns': ['apoapsis_altitude', 'periapsis_altitude']},
+    ],
+}
+MANIFEST = 'plot_manifest.json'
+# Rotated columnar recordings, e.g. flight.0003.parquet
+ROTATED = re.compile(r'^(.*)\.\d{4}(\.[^.]+)$')
+
+def find_logs(directory):
+    """Log paths in a directory, with the files of a rotated recording as one log."""
+    logs = set()
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        if flight_recorder.is_columnar_path(path):
+            rotated = ROTATED.match(path)
+            logs.add(rotated.expand(r'\1\2') if rotated else path)
+        elif name.lower().endswith('.csv') or flight_recorder.is_recording(path):
+            logs.add(path)
+    return(sorted(logs))
+
+def log_files(path):
+    if flight_recorder.is_columnar_path(path):
+        import columnar_recorder
+        return(columnar_recorder.recording_paths(path))
+    return([path])
+
+def signature(path, spec):
+    # Changes when any file of the log or the spec changes
+    digest = hashlib.sha1(json.dumps(spec, sort_keys=True).encode('utf-8'))
+    for file in log_files(path):
+        stat = os.stat(file)
+        digest.update("{}:{}:{}".format(os.path.basename(file), stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+    return(digest.hexdigest())
+
+def read_chunks(path, columns, chunk_rows=65536):
+    """Yield dicts of the columns present in a log, chunk_rows rows at a time."""
+    if flight_recorder.is_columnar_path(path):
+        import columnar_recorder
+        recording = columnar_recorder.open_columnar(path)
+        columns = [label for label in columns if label in recording.column_index]
+        for batch in recording.dataset.to_batches(columns=columns, batch_size=chunk_rows):
+            yield({label: batch.column(label).to_numpy() for label in columns})
+    elif flight_recorder.is_recording(path):
+        recording = flight_recorder.open_recording(path)
+        columns = [label for label in columns if label in recording.column_index]
+        index = [recording.column_index[label] for label in columns]
+        for start in range(0, len(recording), chunk_rows):
+            block = recording.data[start:start + chunk_rows, index]
+            yield({label: block[:, i] for i, label in enumerate(columns)})
+    else:
+        import pandas as pd
+        for chunk in pd.read_csv(path, sep=' ', quotechar='|', usecols=lambda label: label in columns, chunksize=chunk_rows):
+            yield({label: chunk[label].to_numpy(dtype=float) for label in columns if label in chunk})
+
+def load(path, spec):
+    """The columns the spec plots, resampled a chunk at a time if it asks to be. A bin spanning two chunks is aggregated once."""
+    key = spec['key']
+    columns = [key] + [label for panel in spec['panels'] for label in panel['columns'] if label != key]
+    interval = spec.get('resample')
+    chunks = []
+    # Rows of the last bin read so far, which may carry on in the next chunk
+    held = None
+    for chunk in read_chunks(path, columns):
+        if key not in chunk:
+            raise KeyError("{} has no {} column".format(path, key))
+        if interval:
+            if held is not None:
+                chunk = {label: np.concatenate([held[label], values]) for label, values in chunk.items()}
+            bins = np.floor(chunk[key]/interval)
+            last = bins[~np.isnan(bins)][-1:]
+            in_last = bins == last[0] if len(last) else np.zeros(len(bins), dtype=bool)
+            held = {label: values[in_last] for label, values in chunk.items()}
+            chunk = telemetry_query.resample_columns({label: values[~in_last] for label, values in chunk.items()}, key, interval)
+        chunks.append(chunk)
+    if held is not None:
+        chunks.append(telemetry_query.resample_columns(held, key, interval))
+    if not chunks:
+        return({})
+    return({label: np.concatenate([chunk[label] for chunk in chunks]) for label in chunks[0]})
+
+def render(path, spec, output):
+    # Imported here so each worker process sets up its own non-interactive backend
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    df = pd.DataFrame(load(path, spec))
+    if len(df):
+        df[spec['key']] = pd.to_datetime(df[spec['key']], unit='s')
+        df = df.set_index(spec['key'])
+    rows, cols = spec['layout']
+    fig, axes = plt.subplots(nrows=rows, ncols=cols, figsize=spec['figsize'], sharex=True, squeeze=False)
+    for ax, panel in zip(axes.flat, spec['panels']):
+        present = [label for label in panel['columns'] if label in df]
+        if present:
+            df.loc[:, present].plot(ax=ax)
+        ax.set_title(panel.get('title', ", ".join(panel['columns'])))
+    fig.suptitle(os.path.basename(path))
+    plt.tight_layout()
+    fig.savefig(output)
+    plt.close(fig)
+    return(output)
+
+def output_path(path, outdir):
+    return(os.path.join(outdir, os.path.basename(path) + '.png'))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("logdir", help="Directory of flight logs")
+    parser.add_argument("-s", "--spec", help="JSON figure spec", type=str, default=None)
+    parser.add_argument("-o", "--outdir", help="Output directory (default <logdir>/plots)", type=str, default=None)
+    parser.add_argument("-j", "--jobs", help="Worker processes (default one per core)", type=int, default=None)
+    parser.add_argument("-f", "--force", help="Render every log, even unchanged ones", action="store_true")
+    args = parser.parse_args()
+
+    spec = DEFAULT_SPEC
+    if args.spec is not None:
+        with open(args.spec) as f:
+            spec = json.load(f)
+    outdir = os.path.join(args.logdir, 'plots') if args.outdir is None else args.outdir
+    os.makedirs(outdir, exist_ok=True)
+    manifest_path = os.path.join(outdir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path) and not args.force:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    logs = find_logs(args.logdir)
+    signatures = {path: signature(path, spec) for path in logs}
+    todo = [
+        path for path in logs
+        if manifest.get(path) != signatures[path] or not os.path.exists(output_path(path, outdir))
+    ]
+    print("{} logs, {} unchanged, rendering {}".format(len(logs), len(logs) - len(todo), len(todo)))
+
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+        futures = {executor.submit(render, path, spec, output_path(path, outdir)): path for path in todo}
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            try:
+                print("...", future.result())
+                manifest[path] = signatures[path]
+            except Exception as e:
+                print("... failed", path, e)
+                failed += 1
+
+    # Logs that are gone are dropped from the manifest
+    manifest = {path: manifest[path] for path in logs if path in manifest}
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+# Microbenchmark for the alert engine: the cost it adds to each acquisition
+# tick for a growing number of limit checks, events included. Every check is
+# an above/below or rate limit with hysteresis on one of a wide store's
+# columns, which random walk across their limits now and then.
+# Runs on synthetic data, so KSP is not needed.
+
+# Ian Dahlke, 2020
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import alerts
+import numpy as np
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-n", "--rows", help="Rows to check per measurement", type=int, default=20000)
+parser.add_argument("-c", "--columns", help="Columns in each row", type=int, default=1000)
+args = parser.parse_args()
+
+rng = np.random.default_rng(0)
+labels = ['sc_ut', 'vessel_met'] + ["channel_{}".format(i) for i in range(args.columns)]
+rows = np.cumsum(rng.normal(size=(args.rows, len(labels))), axis=0)
+rows[:, 0] = rows[:, 1] = 0.1*np.arange(args.rows)
+
+print("{:>8} {:>12} {:>10}".format("checks", "us per row", "events"))
+for n_checks in [10, 100, 1000, 3000]:
+    rules = []
+    for i in range(n_checks):
+        column = labels[2 + i % args.columns]
+        kind = ['above', 'below', 'rate_above'][i % 3]
+        rules.append({'name': "rule{}".format(i), 'column': column, kind: 30.0 if kind != 'rate_above' else 25.0, 'hysteresis': 2.0})
+    engine = alerts.AlertEngine(rules, labels)
+    start = time.perf_counter()
+    for i, row in enumerate(rows):
+        engine.write(row, rows[i, 0])
+    seconds = time.perf_counter() - start
+    print("{:>8} {:>12.1f} {:>10}".format(len(engine.checks), 1e6*seconds/args.rows, engine.total_events))
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+# Scaling benchmark for multi-vessel logging. A simulated connection launches
+# N vessels, a Fleet attaches all of them, and the acquisition tick is timed
+# for growing N. The cost per vessel should stay roughly flat.
+
+# Ian Dahlke, 2020
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fleet
+import krpc_sim
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-n", "--vessels", help="Largest fleet size", type=int, default=16)
+parser.add_argument("-t", "--ticks", help="Ticks timed per fleet size", type=int, default=200)
+args = parser.parse_args()
+
+n = 1
+while n <= args.vessels:
+    conn = krpc_sim.SimulatedConnection(seed=0, step=0.02)
+    for i in range(n - 1):
+        conn.launch()
+    vessel_fleet = fleet.Fleet(conn, conn.space_center, capacity=args.ticks + 1, discovery_period=float('inf'))
+    vessel_fleet.tick(0.0)
+    columns = sum(len(telemetry.store.column_labels) for telemetry in vessel_fleet.vessels.values())
+
+    elapsed = 0.0
+    for i in range(args.ticks):
+        # The simulation itself is not part of the acquisition cost
+        conn.advance()
+        start = time.perf_counter()
+        vessel_fleet.tick(i*0.02)
+        elapsed += time.perf_counter() - start
+    tick = 1e6*elapsed/args.ticks
+    print("{:3d} vessels, {:5d} columns: {:9.1f} us per tick, {:7.1f} us per vessel".format(n, columns, tick, tick/n))
+    vessel_fleet.close()
+    n *= 2
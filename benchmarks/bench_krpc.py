@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Benchmark of the live krpc code paths against the simulated krpc server.
+# The server runs in its own process, and the unchanged Loggable classes
+# connect to it through the real krpc client. Reports the connect time, the
+# cost of creating every logger's streams, and the stream update latency
+# (server wall clock to client callback) as percentiles.
+
+# Ian Dahlke, 2020
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import krpc
+import krpc_logger
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-d", "--duration", help="Seconds to measure stream latency for", type=float, default=10.0)
+parser.add_argument("--rate", help="Server stream updates per second", type=float, default=50.0)
+parser.add_argument("--latency", help="Seconds of latency the server adds to every message", type=float, default=0.0)
+args = parser.parse_args()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return(s.getsockname()[1])
+
+def connect(rpc_port, stream_port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return(krpc.connect(name='bench_krpc', address='127.0.0.1', rpc_port=rpc_port, stream_port=stream_port))
+        except (ConnectionRefusedError, krpc.error.ConnectionError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+rpc_port, stream_port = free_port(), free_port()
+server = subprocess.Popen([
+    sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'krpc_sim_server.py'),
+    '--rpc_port', str(rpc_port), '--stream_port', str(stream_port),
+    '--rate', str(args.rate), '--latency', str(args.latency), '--wall_clock_ut'
+], stdout=subprocess.DEVNULL)
+
+try:
+    connect(rpc_port, stream_port).close()
+    start = time.perf_counter()
+    conn = connect(rpc_port, stream_port)
+    print("connect:               {:8.1f} ms".format(1000*(time.perf_counter() - start)))
+
+    space_center = conn.space_center
+    vessel = space_center.active_vessel
+    loggers = [
+        (krpc_logger.LoggableSpaceCenter, space_center, "sc"),
+        (krpc_logger.LoggableAutopilot, vessel.auto_pilot, "autopilot"),
+        (krpc_logger.LoggableVessel, vessel, "vessel"),
+        (krpc_logger.LoggableOrbit, vessel.orbit, "orbit"),
+        (krpc_logger.LoggableFlight, vessel.flight(vessel.orbital_reference_frame), "flight"),
+    ]
+    n_streams = 0
+    start = time.perf_counter()
+    for cls, obj, name in loggers:
+        logger_start = time.perf_counter()
+        try:
+            logger = cls(conn, obj, name)
+        except AttributeError as e:
+            # The attribute lists follow one krpc version, newer clients drop some
+            print("stream setup {:10s} skipped, {}".format(name, e))
+            continue
+        n_streams += len(logger.slot_map)
+        print("stream setup {:10s} {:8.1f} ms for {} streams".format(name, 1000*(time.perf_counter() - logger_start), len(logger.slot_map)))
+    elapsed = time.perf_counter() - start
+    print("stream setup total:    {:8.1f} ms, {:.2f} ms per stream".format(1000*elapsed, 1000*elapsed/max(n_streams, 1)))
+
+    # UT is served as the server's wall clock, so each update carries its send time
+    latencies = []
+    lock = threading.Lock()
+    def on_update(value):
+        with lock:
+            latencies.append(time.time() - value)
+    ut = conn.add_stream(getattr, space_center, 'ut')
+    ut.add_callback(on_update)
+    ut.start()
+    time.sleep(args.duration)
+    ut.remove()
+    with lock:
+        latencies = 1000*np.array(latencies)
+
+    print("stream updates:        {:8d} in {:.0f} s".format(len(latencies), args.duration))
+    if len(latencies):
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print("stream latency:        p50 {:.2f} ms, p90 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms".format(p50, p90, p99, latencies.max()))
+    conn.close()
+finally:
+    server.terminate()
+    server.wait()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Throughput benchmark for the whole acquisition -> store -> Bokeh pipeline.
+# A flight recording is replayed as fast as possible through the unchanged
+# Loggable classes, and new rows are streamed into a Bokeh document and
+# serialized the way the server would send them to a browser.
+# Without a recording, one is made from simulated loggers first.
+
+# Ian Dahlke, 2020
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import acquisition
+import dashboard
+import flight_recorder
+import krpc_logger
+import telemetry_store
+
+from bokeh.document import Document
+from bokeh.models import ColumnDataSource
+from bokeh.protocol import Protocol
+
+parser = argparse.ArgumentParser()
+parser.add_argument("recording", help="Flight recording made with ktydid.py -o", nargs='?', default=None)
+parser.add_argument("-n", "--rows", help="Rows to simulate when no recording is given", type=int, default=20000)
+parser.add_argument("-b", "--batch", help="Acquisition ticks per dashboard refresh", type=int, default=10)
+args = parser.parse_args()
+
+loggers = [
+    (krpc_logger.LoggableSpaceCenter, "sc"),
+    (krpc_logger.LoggableAutopilot, "autopilot"),
+    (krpc_logger.LoggableVessel, "vessel"),
+    (krpc_logger.LoggableOrbit, "orbit"),
+    (krpc_logger.LoggableFlight, "flight"),
+]
+dashboard_columns = [
+    'vessel_met', 'flight_pitch', 'flight_heading', 'flight_roll',
+    'autopilot_target_pitch', 'autopilot_target_heading', 'autopilot_target_roll',
+    'flight_longitude', 'flight_latitude',
+    'autopilot_pitch_error', 'autopilot_heading_error', 'autopilot_roll_error',
+]
+
+recording_path = args.recording
+if recording_path is None:
+    recording_path = os.path.join(tempfile.mkdtemp(), "bench.ktr")
+    print("Simulating {} rows into {}".format(args.rows, recording_path))
+    loggable_list = [cls(None, None, name) for cls, name in loggers]
+    store = telemetry_store.TelemetryStore.from_loggables(loggable_list, capacity=1)
+    with flight_recorder.FlightRecorder(recording_path, store.column_labels) as recorder:
+        for i in range(args.rows):
+            store.sample(timestamp=i*0.01)
+            recorder.write(store.view(1)[0], i*0.01)
+
+def run(with_bokeh):
+    conn = flight_recorder.ReplayConnection(flight_recorder.open_recording(recording_path), speed=None)
+    loggable_list = [cls(conn, conn.object(name), name) for cls, name in loggers]
+    store = telemetry_store.TelemetryStore.from_loggables(loggable_list)
+    scheduler = acquisition.AcquisitionScheduler(store, 0)
+    scheduler.tick_hooks.append(conn.advance)
+
+    if with_bokeh:
+        document = Document()
+        source = ColumnDataSource()
+        document.add_root(source)
+        pusher = dashboard.SourcePusher(source, store, dashboard_columns, scales={'vessel_met': 1000}, max_in_flight=float('inf'))
+        source.data = pusher.initial_data()
+        protocol = Protocol()
+        patches = []
+        document.on_change(lambda event: patches.append(event))
+
+    rows = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            scheduler.tick()
+            rows += 1
+            if with_bokeh and rows % args.batch == 0:
+                pusher.push()
+                if patches:
+                    protocol.create("PATCH-DOC", patches)
+                    patches.clear()
+    except StopIteration:
+        pass
+    return(rows / (time.perf_counter() - start))
+
+print("acquisition -> store:          {:10.0f} rows/s".format(run(False)))
+print("acquisition -> store -> Bokeh: {:10.0f} rows/s".format(run(True)))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# Microbenchmark for the Loggable sampling paths: the DataFrame-per-tick
+# update() against the compiled slot map in update_into().
+# Runs on simulated streams, so KSP is not needed.
+
+# Ian Dahlke, 2020
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import krpc_logger
+import numpy as np
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-d", "--duration", help="Seconds to run each path for", type=float, default=2.0)
+parser.add_argument(
+    "-c",
+    "--constant",
+    help="Replace the random simulated values with constants to isolate sampling overhead",
+    action="store_true"
+)
+args = parser.parse_args()
+
+def rows_per_second(fun, duration):
+    rows = 0
+    start = time.perf_counter()
+    stop = start + duration
+    while time.perf_counter() < stop:
+        for _ in range(100):
+            fun()
+        rows += 100
+    return(rows / (time.perf_counter() - start))
+
+loggable_classes = [
+    krpc_logger.LoggableSpaceCenter,
+    krpc_logger.LoggableVessel,
+    krpc_logger.LoggableOrbit,
+    krpc_logger.LoggableFlight,
+    krpc_logger.LoggableAutopilot,
+]
+
+print("{:<24} {:>8} {:>14} {:>17} {:>8}".format("logger", "columns", "update() r/s", "update_into() r/s", "speedup"))
+for loggable_class in loggable_classes:
+    loggable = loggable_class(None, None, loggable_class.__name__[8:].lower())
+    if args.constant:
+        for i, (attribute, stream, offset, width) in enumerate(loggable.slot_map):
+            value = stream()
+            loggable.slot_map[i] = (attribute, (lambda v: lambda: v)(value), offset, width)
+        loggable.stream_list = [stream if width else (lambda x: lambda: [x()])(stream) for _, stream, _, width in loggable.slot_map]
+        loggable.compile_slots()
+
+    row = np.full(len(loggable.column_labels), np.nan)
+    old = rows_per_second(loggable.update, args.duration)
+    new = rows_per_second(lambda: loggable.update_into(row), args.duration)
+    print("{:<24} {:>8} {:>14.0f} {:>17.0f} {:>7.1f}x".format(loggable_class.__name__, len(loggable.column_labels), old, new, new/old))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# Startup-time benchmark. Each module is imported in a fresh interpreter and
+# timed, best of a few runs, along with which heavy dependencies it pulled
+# in. The headless recorder is then run end to end on a simulated vessel.
+# Exits non-zero if a module loads a dependency it should not, or if
+# --max_ms is given and the recorder takes longer, so it can guard against
+# startup regressions.
+
+# Ian Dahlke, 2020
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-n", "--runs", help="Runs per measurement, the best is reported", type=int, default=5)
+parser.add_argument("--max_ms", help="Fail if the headless recorder takes longer than this to run", type=float, default=None)
+args = parser.parse_args()
+
+HEAVY = ['krpc', 'pandas', 'bokeh', 'pyarrow', 'matplotlib']
+# Module -> heavy dependencies it must not load by itself
+modules = [
+    ('numpy', []),
+    ('krpc', None),
+    ('pandas', None),
+    ('bokeh.plotting', None),
+    ('krpc_logger', HEAVY),
+    ('acquisition', HEAVY),
+    ('telemetry_hub', HEAVY),
+    ('dashboard', ['krpc', 'pyarrow', 'matplotlib']),
+]
+
+IMPORT = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(' '.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+def import_time(module):
+    best, loaded = None, ''
+    for _ in range(args.runs):
+        result = subprocess.run(
+            [sys.executable, '-W', 'ignore', '-c', IMPORT.format(root=root, module=module, heavy=HEAVY)],
+            capture_output=True, text=True, check=True
+        )
+        lines = result.stdout.splitlines()
+        seconds = float(lines[-2])
+        loaded = lines[-1]
+        best = seconds if best is None else min(best, seconds)
+    return(best, loaded.split())
+
+failures = []
+print("{:<16} {:>9}  {}".format("import", "ms", "heavy dependencies loaded"))
+for module, forbidden in modules:
+    seconds, loaded = import_time(module)
+    print("{:<16} {:>9.1f}  {}".format(module, 1000*seconds, " ".join(loaded) or "-"))
+    for name in loaded:
+        if forbidden is not None and name in forbidden:
+            failures.append("{} loads {}".format(module, name))
+
+# The whole headless recorder, from interpreter start to the recording closed
+directory = tempfile.mkdtemp()
+best = None
+for _ in range(args.runs):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, '-W', 'ignore', os.path.join(root, 'record.py'), '-s', '1', '-p', '0.1', '--duration', '0',
+         '-o', os.path.join(directory, 'startup.ktr'), '--shape_cache', os.path.join(directory, 'shapes.json')],
+        capture_output=True, check=True
+    )
+    seconds = time.perf_counter() - start
+    best = seconds if best is None else min(best, seconds)
+print("{:<16} {:>9.1f}  (record.py -s 1 --duration 0, whole process)".format("record.py", 1000*best))
+if args.max_ms is not None and 1000*best > args.max_ms:
+    failures.append("record.py took {:.0f} ms, over the {:.0f} ms budget".format(1000*best, args.max_ms))
+
+for failure in failures:
+    print("FAIL:", failure)
+sys.exit(1 if failures else 0)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Microbenchmark for vector channels: the norm and vessel-frame velocity of
+# a full store, computed on (N, k) views of the vector columns against
+# stacking the split scalar columns of a DataFrame row by row.
+# Runs on simulated streams, so KSP is not needed.
+
+# Ian Dahlke, 2020
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import krpc_logger
+import krpc_sim
+import numpy as np
+import telemetry_store
+import vectors
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-n", "--rows", help="Rows in the store", type=int, default=10000)
+parser.add_argument("-r", "--runs", help="Runs per measurement, the best is reported", type=int, default=5)
+args = parser.parse_args()
+
+def best(fun):
+    times = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        result = fun()
+        times.append(time.perf_counter() - start)
+    return(min(times), result)
+
+conn = krpc_sim.SimulatedConnection(seed=0, step=0.1)
+vessel = conn.space_center.active_vessel
+flight = krpc_logger.LoggableFlight(conn, vessel.flight(vessel.orbital_reference_frame), "flight")
+store = telemetry_store.TelemetryStore.from_loggables([flight], capacity=args.rows)
+for _ in range(args.rows):
+    conn.advance(0)
+    store.sample()
+df = store.to_dataframe()
+
+def split_columns():
+    # What a scalar-column consumer has to do: gather the elements back
+    # together, one row at a time
+    velocity = [np.array([row['flight_velocity_{}'.format(i)] for i in range(3)]) for _, row in df.iterrows()]
+    rotation = [np.array([row['flight_rotation_{}'.format(i)] for i in range(4)]) for _, row in df.iterrows()]
+    return(np.array([vectors.to_frame(v, q) for v, q in zip(velocity, rotation)]))
+
+def vector_views():
+    return(vectors.to_frame(store.vector('flight_velocity'), store.vector('flight_rotation')))
+
+print("{} rows, {} columns, {} vector channels".format(len(store), len(store.column_labels), len(store.vector_index)))
+split_seconds, expected = best(split_columns) if args.rows <= 20000 else (np.nan, None)
+vector_seconds, result = best(vector_views)
+norm_seconds, _ = best(lambda: vectors.norm(store.vector('flight_velocity')))
+print("to_frame, DataFrame rows  {:>10.2f} ms".format(1000*split_seconds))
+print("to_frame, vector views    {:>10.2f} ms".format(1000*vector_seconds))
+print("norm, vector views        {:>10.2f} ms".format(1000*norm_seconds))
+if expected is not None:
+    assert(np.allclose(expected, result, equal_nan=True)), "Vector and scalar paths disagree"
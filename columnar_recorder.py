@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Columnar Recorder
+Records telemetry to compressed Parquet or Arrow IPC files for analysis, alongside the binary flight recorder that serves replay. The schema is the loggers' column labels as float64 columns behind a leading host_time column, so values round-trip exactly. Rows are batched in memory and every batch is written as one row group (Parquet) or record batch (Arrow), when it is full, every few seconds and on close. A file can only be read once it is closed, and a recording can be rotated into a new file every so many seconds so finished files can be read while the flight goes on.
+
+ColumnarRecording opens a recording, a directory or a glob of files as one dataset and reads only the columns and time range asked for. In Parquet the row group statistics let groups outside the range be skipped without being read or decompressed.
+
+Needs pyarrow.
+"""
+
+import glob
+import json
+import os
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.ipc
+import pyarrow.parquet as pq
+
+from flight_recorder import TIME_COLUMN
+
+FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+
+def recording_format(path):
+    """'parquet' or 'arrow' from the file extension, or None for anything else."""
+    return(FORMATS.get(os.path.splitext(path)[1].lower()))
+
+def rotated_path(path, index):
+    root, extension = os.path.splitext(path)
+    return("{}.{:04d}{}".format(root, index, extension))
+
+class ColumnarRecorder:
+    def __init__(self, path, column_labels, batch_rows=4096, flush_interval=5.0, rotate_interval=None, compression='zstd', metadata=None):
+        self.path = path
+        self.format = recording_format(path)
+        if self.format is None:
+            raise ValueError("{} is not a .parquet or .arrow path".format(path))
+        self.column_labels = [TIME_COLUMN] + list(column_labels)
+        self.schema = pa.schema(
+            [pa.field(label, pa.float64()) for label in self.column_labels],
+            metadata={'ktydid': json.dumps({
+                'created': time.time(),
+                'metadata': {} if metadata is None else metadata,
+            })}
+        )
+        # Seconds between row groups when the batch does not fill up sooner
+        self.flush_interval = flush_interval
+        # Seconds of host_time per file, or None for a single file
+        self.rotate_interval = rotate_interval
+        self.compression = compression
+        self.rows_written = 0
+        # Files written so far, the last one still open
+        self.paths = []
+
+        # Column-major, so each column of a batch goes to pyarrow without a copy
+        self._batch = np.empty((len(self.column_labels), batch_rows))
+        self._batch_rows = 0
+        self._last_flush = time.monotonic()
+        self._writer = None
+        self._file_start = None
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, values, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.rotate_interval is not None and self._file_start is not None and timestamp - self._file_start >= self.rotate_interval:
+            self.rotate()
+        if self._file_start is None:
+            self._file_start = timestamp
+        self._batch[0, self._batch_rows] = timestamp
+        self._batch[1:, self._batch_rows] = values
+        self._batch_rows += 1
+        if self._batch_rows == self._batch.shape[1] or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def open_writer(self):
+        path = self.path if self.rotate_interval is None else rotated_path(self.path, len(self.paths))
+        if self.format == 'parquet':
+            self._writer = pq.ParquetWriter(path, self.schema, compression=self.compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=self.compression)
+            self._writer = pa.ipc.new_file(path, self.schema, options=options)
+        self.paths.append(path)
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if self._batch_rows == 0:
+            return
+        if self._writer is None:
+            self.open_writer()
+        n = self._batch_rows
+        batch = pa.RecordBatch.from_arrays([pa.array(column[:n]) for column in self._batch], schema=self.schema)
+        self._writer.write_batch(batch)
+        self.rows_written += n
+        self._batch_rows = 0
+
+    def rotate(self):
+        """Finish the current file, the next row starts a new one."""
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._file_start = None
+
+    def close(self):
+        self.rotate()
+
+def recording_paths(path):
+    """The files of a recording: a file, its rotated files, a directory or a glob."""
+    if os.path.isdir(path):
+        paths = [p for p in glob.glob(os.path.join(path, '*')) if recording_format(p) is not None]
+    elif glob.has_magic(path):
+        paths = glob.glob(path)
+    elif os.path.exists(path):
+        paths = [path]
+    else:
+        root, extension = os.path.splitext(path)
+        paths = glob.glob(glob.escape(root) + ".[0-9][0-9][0-9][0-9]" + extension)
+    if not paths:
+        raise FileNotFoundError("No columnar recording at {}".format(path))
+    return(sorted(paths))
+
+def is_columnar(path):
+    return(recording_format(path) is not None or os.path.isdir(path))
+
+class ColumnarRecording:
+    """A columnar recording, read a projection and time range at a time."""
+    def __init__(self, path):
+        self.paths = recording_paths(path)
+        formats = set(recording_format(p) for p in self.paths)
+        if len(formats) != 1:
+            raise ValueError("{} mixes recording formats".format(path))
+        self.format = formats.pop()
+        self.dataset = ds.dataset(self.paths, format='parquet' if self.format == 'parquet' else 'ipc')
+        self.column_labels = self.dataset.schema.names
+        self.column_index = {label: i for i, label in enumerate(self.column_labels)}
+        header = json.loads((self.dataset.schema.metadata or {}).get(b'ktydid', b'{}'))
+        self.metadata = header.get('metadata', {})
+        self.created = header.get('created')
+
+    def __len__(self):
+        return(self.dataset.count_rows())
+
+    def read(self, labels=None, start=None, end=None, time_column=TIME_COLUMN):
+        """A pyarrow Table of some columns (default all) for start <= time_column < end."""
+        condition = None
+        if start is not None:
+            condition = ds.field(time_column) >= start
+        if end is not None:
+            before_end = ds.field(time_column) < end
+            condition = before_end if condition is None else condition & before_end
+        return(self.dataset.to_table(columns=labels, filter=condition))
+
+    def columns(self, labels=None, start=None, end=None, time_column=TIME_COLUMN):
+        table = self.read(labels, start, end, time_column)
+        return({label: table.column(label).to_numpy() for label in table.column_names})
+
+    def to_dataframe(self, labels=None, start=None, end=None, time_column=TIME_COLUMN):
+        return(self.read(labels, start, end, time_column).to_pandas())
+
+def open_columnar(path):
+    return(ColumnarRecording(path))
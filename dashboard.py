@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Dashboard
+Helpers for feeding Bokeh figures from a TelemetryStore. Only the columns that glyphs actually reference are sent to the browser, rows that repeat the previous values are dropped, and new rows are held back and sent as one batch while the browser is still applying earlier updates.
+"""
+
+import time
+import numpy as np
+
+from bokeh import events
+from bokeh.core.property.descriptors import UnsetValueError
+from bokeh.models import ColumnDataSource, CustomJS, FactorRange, Span
+from bokeh.plotting import figure
+
+def spec_field(spec):
+    # Glyph dataspecs may be a bare column name, a {'field': ...} dict or a Field
+    if isinstance(spec, str):
+        return(spec)
+    if isinstance(spec, dict):
+        return(spec.get('field'))
+    return(getattr(spec, 'field', None))
+
+def referenced_columns(figures, source):
+    """Column names used by the glyphs of `figures` that draw from `source`, in first-use order."""
+    columns = []
+    for fig in figures:
+        for renderer in fig.renderers:
+            if getattr(renderer, 'data_source', None) is not source:
+                continue
+            for name in renderer.glyph.dataspecs():
+                field = spec_field(getattr(renderer.glyph, name))
+                if field is not None and field not in columns:
+                    columns.append(field)
+    return(columns)
+
+def panel_figure(spec, source, follow_interval=30, tools="xpan,xwheel_zoom,xbox_zoom,reset"):
+    """
+    A figure for a telemetry_config panel, drawing its lines from `source`.
+    Time panels follow the live end over `follow_interval` seconds, xy
+    panels keep their fixed ranges.
+    """
+    if spec.get('kind', 'time') == 'time':
+        fig = figure(tools=tools, x_axis_type='datetime', title=spec.get('title'))
+        fig.xaxis.axis_label = spec.get('x_label', "Time")
+        fig.x_range.follow = "end"
+        # Datetime axes are in milliseconds
+        fig.x_range.follow_interval = 1000*follow_interval
+        fig.x_range.range_padding = 0
+    else:
+        ranges = {name: tuple(spec[name]) for name in ('x_range', 'y_range') if name in spec}
+        fig = figure(title=spec.get('title'), **ranges)
+        fig.xaxis.axis_label = spec.get('x_label')
+        if 'x_range' in ranges:
+            fig.x_range.bounds = ranges['x_range']
+        if 'y_range' in ranges:
+            fig.y_range.bounds = ranges['y_range']
+    if 'y_label' in spec:
+        fig.yaxis.axis_label = spec['y_label']
+    fig.toolbar.logo = None
+    fig.toolbar.autohide = True
+
+    labelled = False
+    for line in spec.get('lines', []):
+        options = {name: value for name, value in line.items() if name not in ('y', 'label')}
+        if 'label' in line:
+            options['legend_label'] = line['label']
+            labelled = True
+        fig.line(x=spec['x'], y=line['y'], source=source, **options)
+    if labelled:
+        fig.legend.click_policy = 'hide'
+    return(fig)
+
+class SourcePusher:
+    def __init__(self, source, store, columns, rollover=None, scales=None, max_in_flight=2, ack_timeout=5.0):
+        self.source = source
+        self.store = store
+        self.columns = list(columns)
+        self.column_index = np.array([store.column_index[label] for label in self.columns], dtype=np.intp)
+        self.rollover = store.capacity if rollover is None else rollover
+        # Per-column multipliers applied on the way out, e.g. seconds to the
+        # milliseconds Bokeh datetime axes expect
+        self.scales = {} if scales is None else scales
+
+        self.pushed_rows = store.total_rows
+        self.last_row = None
+        self.paused = False
+
+        # The browser bumps the source's tags each time it has applied a
+        # stream. Pushes stop while too many are unacknowledged, so rows pile
+        # up in the store and go out together once the browser catches up.
+        self.max_in_flight = max_in_flight
+        self.ack_timeout = ack_timeout
+        self.sent = 0
+        self.acked = 0
+        self.last_send = 0.0
+        source.js_on_change('streaming', CustomJS(code="cb_obj.tags = [(cb_obj.tags.length ? cb_obj.tags[0] : 0) + 1]"))
+        source.on_change('tags', self._on_ack)
+
+    def _on_ack(self, attr, old, new):
+        if new:
+            self.acked = new[0]
+
+    def format(self, block):
+        data = {}
+        for i, label in enumerate(self.columns):
+            column = block[:, i]
+            if label in self.scales:
+                column = column*self.scales[label]
+            data[label] = column
+        return(data)
+
+    def initial_data(self, n=None):
+        with self.store.lock:
+            self.pushed_rows = self.store.total_rows
+            block = self.store.view(n)[:, self.column_index]
+        if len(block):
+            self.last_row = block[-1].copy()
+        return(self.format(block))
+
+    def behind(self):
+        in_flight = self.sent - self.acked
+        return(in_flight >= self.max_in_flight and time.monotonic() - self.last_send < self.ack_timeout)
+
+    def push(self):
+        if self.paused or self.behind():
+            return(0)
+        with self.store.lock:
+            # Rows the browser would roll straight out again are skipped, so a
+            # push after falling behind costs no more than one live window
+            n = min(self.store.rows_since(self.pushed_rows), self.rollover)
+            self.pushed_rows = self.store.total_rows
+            if n == 0:
+                return(0)
+            # Fancy indexing copies, so Bokeh never sees a store view
+            block = self.store.view(n)[:, self.column_index]
+
+        # Coalesce rows where none of the pushed columns changed
+        previous = np.empty_like(block)
+        previous[1:] = block[:-1]
+        previous[0] = np.nan if self.last_row is None else self.last_row
+        changed = (block != previous) & ~(np.isnan(block) & np.isnan(previous))
+        block = block[changed.any(axis=1)]
+        if len(block) == 0:
+            return(0)
+
+        self.last_row = block[-1].copy()
+        self.source.stream(self.format(block), self.rollover)
+        self.sent += 1
+        self.last_send = time.monotonic()
+        return(len(block))
+
+class LevelOfDetail:
+    """
+    Serves a time-series figure from a HistoryStore when it is zoomed or
+    panned away from the live window. The source is then filled with about
+    two points per pixel of the requested range and live pushes are paused
+    until the figure is back at the live end, e.g. after a reset.
+    """
+    def __init__(self, fig, pusher, history, live_interval, live_rows):
+        self.fig = fig
+        self.pusher = pusher
+        self.history = history
+        self.live_interval = live_interval
+        self.live_rows = live_rows
+        self.x_scale = pusher.scales.get(history.key, 1)
+        self.snapshot_end = None
+        pusher.rollover = live_rows
+        fig.on_event(events.RangesUpdate, self.on_ranges_update)
+
+    def pixel_width(self):
+        # inner_width is only known once the browser has laid the figure out
+        try:
+            width = self.fig.inner_width
+        except UnsetValueError:
+            width = self.fig.width
+        return(width if width else 600)
+
+    def on_ranges_update(self, event):
+        if event.x0 is None or event.x1 is None or len(self.history) == 0:
+            return
+        x0, x1 = event.x0/self.x_scale, event.x1/self.x_scale
+        latest = self.history.rows.view()[-1, self.history.key_index]
+        # While paused the figure can only reach the end of its snapshot
+        data_end = self.snapshot_end if self.pusher.paused else latest
+        live = x1 >= data_end - 0.1*self.live_interval and x1 - x0 <= 1.5*self.live_interval
+        if live:
+            if self.pusher.paused:
+                self.go_live()
+        else:
+            self.pusher.paused = True
+            self.snapshot_end = latest
+            self.pusher.source.data = self.pusher.format(self.history.query(x0, x1, self.pixel_width()))
+
+    def go_live(self):
+        self.pusher.source.data = self.pusher.format(self.history.tail(self.live_rows))
+        self.pusher.pushed_rows = self.history.pulled_rows
+        self.pusher.last_row = None
+        self.pusher.paused = False
+
+class AlertAnnotations:
+    """
+    Marks alerts.AlertEngine events on time-series figures: a vertical line
+    where each alert was raised, coloured by severity, on every figure (the
+    ones plotting the alert's column keep a solid line). Each figure keeps
+    its newest `max_spans` marks. `figures` is a list of (figure, x column,
+    x scale) tuples.
+    """
+    COLORS = {'info': 'gray', 'warning': 'orange', 'critical': 'red'}
+
+    def __init__(self, engine, figures, max_spans=50):
+        self.engine = engine
+        # Each figure with the columns it plots
+        self.figures = [
+            (fig, x, scale, {label for renderer in fig.renderers for label in referenced_columns([fig], renderer.data_source)})
+            for fig, x, scale in figures
+        ]
+        self.max_spans = max_spans
+        self.seen = 0
+
+    def update(self):
+        events = self.engine.events_since(self.seen)
+        self.seen = self.engine.total_events
+        for event in events:
+            if event['state'] != 'raised':
+                continue
+            for fig, x, scale, columns in self.figures:
+                if x not in event:
+                    continue
+                plotted = event['column'] in columns
+                span = Span(
+                    location=scale*event[x],
+                    dimension='height',
+                    line_color=self.COLORS[event['severity']],
+                    line_dash='solid' if plotted else 'dashed',
+                    line_width=2 if plotted else 1,
+                )
+                spans = [renderer for renderer in fig.center if isinstance(renderer, Span)]
+                if len(spans) >= self.max_spans:
+                    fig.center.remove(spans[0])
+                fig.add_layout(span)
+
+class HealthFigure:
+    """
+    Pipeline health: the median and 99th percentile duration of every timed
+    stage in an instrumentation.Metrics, with the tick counters and jitter
+    against the requested period in the title.
+    """
+    def __init__(self, metrics, period=None):
+        self.metrics = metrics
+        self.period = period
+        self.source = ColumnDataSource(data=dict(stage=[], p50=[], p99=[]))
+        self.figure = figure(y_range=FactorRange(), title="Pipeline Health")
+        self.figure.xaxis.axis_label = "Duration (ms)"
+        self.figure.toolbar.logo = None
+        self.figure.toolbar.autohide = True
+        self.figure.hbar(y='stage', left=0, right='p99', height=0.8, source=self.source, color='lightsteelblue', legend_label="p99")
+        self.figure.hbar(y='stage', left=0, right='p50', height=0.8, source=self.source, color='steelblue', legend_label="p50")
+        self.figure.legend.location = 'bottom_right'
+
+    def update(self):
+        summaries = {name: histogram.summary() for name, histogram in sorted(self.metrics.histograms.items()) if name not in ('tick_jitter', 'overrun')}
+        stages = list(summaries)
+        if list(self.figure.y_range.factors) != stages:
+            self.figure.y_range.factors = stages
+        self.source.data = dict(
+            stage=stages,
+            p50=[1000*summaries[stage]['p50'] for stage in stages],
+            p99=[1000*summaries[stage]['p99'] for stage in stages],
+        )
+        counters = self.metrics.counters
+        title = "Pipeline Health: {} ticks, {} late, {} dropped".format(
+            counters.get('ticks', 0), counters.get('late_ticks', 0), counters.get('dropped_ticks', 0)
+        )
+        if 'tick_jitter' in self.metrics.histograms:
+            jitter = self.metrics.histograms['tick_jitter']
+            title += ", jitter p99 {:.1f} ms".format(1000*jitter.percentile(99))
+            # The adaptive overrun policy reports the period it has settled on
+            period = self.metrics.gauges.get('period', self.period)
+            if period:
+                title += " at {:g} ms period".format(1000*period)
+        self.figure.title.text = title
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Derived
+Incremental operators for derived channels: values computed from other columns as each row is sampled, such as rates, filters and integrals. Every operator keeps a constant amount of state (WindowedRMS amortized), so a derived channel costs O(1) per sample regardless of how much history the store keeps.
+
+Loggers declare derived channels in a derived_config next to their attribute_config, and their columns follow the logger's raw columns in the store. Operators get the sample time and their source values as float arrays (length 1 for scalar attributes). A source value that is NaN, e.g. an attribute that is not being streamed, gives NaN without touching the operator's state.
+"""
+
+import collections
+import numpy as np
+import vectors
+
+class Operator:
+    # Elementwise operators give one output per source column, the others one column in total
+    elementwise = True
+
+    def update(self, t, x):
+        raise NotImplementedError
+
+    @staticmethod
+    def missing(*values):
+        return(any(np.isnan(value).any() for value in values))
+
+class Difference(Operator):
+    """Finite difference, the rate of change per unit of time."""
+    def __init__(self):
+        self.t = None
+        self.x = None
+        self.value = np.nan
+
+    def update(self, t, x):
+        if self.missing(x):
+            return(np.nan)
+        if self.x is not None and t > self.t:
+            self.value = (x - self.x)/(t - self.t)
+        if self.x is None or t > self.t:
+            self.t, self.x = t, x.copy()
+        return(self.value)
+
+class EMA(Operator):
+    """Exponential moving average with a time constant, correct for uneven sample spacing."""
+    def __init__(self, time_constant):
+        self.time_constant = time_constant
+        self.t = None
+        self.value = None
+
+    def update(self, t, x):
+        if self.missing(x):
+            return(np.nan)
+        if self.value is None:
+            self.value = x.copy()
+        elif t > self.t:
+            self.value += (1 - np.exp(-(t - self.t)/self.time_constant))*(x - self.value)
+        self.t = t
+        return(self.value)
+
+class RunningMin(Operator):
+    def __init__(self):
+        self.value = np.nan
+
+    def update(self, t, x):
+        if self.missing(x):
+            return(np.nan)
+        self.value = np.fmin(self.value, x)
+        return(self.value)
+
+class RunningMax(Operator):
+    def __init__(self):
+        self.value = np.nan
+
+    def update(self, t, x):
+        if self.missing(x):
+            return(np.nan)
+        self.value = np.fmax(self.value, x)
+        return(self.value)
+
+class WindowedRMS(Operator):
+    """Root mean square over the samples of the last `window` units of time."""
+    def __init__(self, window):
+        self.window = window
+        self.samples = collections.deque()
+        self.total = 0.0
+
+    def update(self, t, x):
+        if self.missing(x):
+            return(np.nan)
+        square = x*x
+        self.samples.append((t, square))
+        self.total = self.total + square
+        while t - self.samples[0][0] > self.window:
+            self.total = self.total - self.samples.popleft()[1]
+        return(np.sqrt(np.maximum(self.total, 0)/len(self.samples)))
+
+class Integral(Operator):
+    """Cumulative trapezoidal integral over time."""
+    def __init__(self):
+        self.t = None
+        self.x = None
+        self.value = 0.0
+
+    def update(self, t, x):
+        if self.missing(x):
+            return(np.nan)
+        if self.x is not None and t > self.t:
+            self.value = self.value + 0.5*(x + self.x)*(t - self.t)
+        if self.x is None or t > self.t:
+            self.t, self.x = t, x.copy()
+        return(self.value)
+
+class Norm(Operator):
+    """Magnitude of a vector channel, e.g. of aerodynamic_force."""
+    elementwise = False
+
+    def update(self, t, x):
+        return(vectors.norm(x))
+
+class ToFrame(Operator):
+    """A vector channel in the frame of an object, given that object's rotation channel, e.g. velocity in the vessel's frame."""
+    def update(self, t, x, rotation):
+        if self.missing(x, rotation):
+            return(np.nan)
+        return(vectors.to_frame(x, rotation))
+
+class Formula(Operator):
+    """Any function of the current values of several sources, e.g. the rocket equation."""
+    elementwise = False
+
+    def __init__(self, function):
+        self.function = function
+
+    def update(self, t, *values):
+        if self.missing(*values):
+            return(np.nan)
+        return(self.function(*values))
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Fleet
+Logs any number of vessels over a single connection. Each vessel gets its own loggers and its own TelemetryStore, so vessels can be attached and detached while acquisition is running and sampling cost grows linearly with the number of vessels. A vessel's columns come from vessel_objects(): the active vessel's loggers plus control, comms, resource and maneuver node loggers, so they differ from the active vessel's and from vessel to vessel. Vessels are discovered from space_center.vessels as they appear, stage or are destroyed.
+"""
+
+import threading
+import time
+import numpy as np
+import krpc_logger
+import telemetry_store
+
+class VesselTelemetry:
+    def __init__(self, connection, space_center, vessel, name, capacity=10000, resource_names=(), loggable_options=None):
+        self.vessel = vessel
+        self.name = name
+        # The vessel's own name, name may have been made unique
+        self.vessel_name = vessel.name
+        self.loggables = vessel_loggers(connection, space_center, vessel, resource_names, **(loggable_options or {}))
+        # Every attribute of every vessel is logged
+        for loggable in self.loggables:
+            loggable.subscribe(list(loggable.attribute_config))
+        self.store = telemetry_store.TelemetryStore.from_loggables(self.loggables, capacity)
+        # Objects with write(values, timestamp) and close(), fed every row of this vessel
+        self.sinks = []
+
+    def sample_due(self, now, timestamp=None):
+        self.store.sample_due(now, timestamp)
+        if self.sinks:
+            row = self.store.view(1)[0]
+            for sink in self.sinks:
+                sink.write(row, timestamp)
+
+    def gap(self, timestamp=None):
+        # A gap marker in the store and every sink where data is missing
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.store.lock:
+            self.store.gap(timestamp, [label for label in ('sc_ut', 'vessel_met') if label in self.store.column_index])
+            row = self.store.view(1)[0]
+        for sink in self.sinks:
+            sink.write(row, timestamp)
+
+    def rebind(self, connection, space_center, vessel, resource_names=()):
+        """Carry on logging this vessel on a new connection, see Loggable.rebind(). Fails if its loggers are not the same."""
+        objects = vessel_objects(space_center, vessel, resource_names)
+        if [name for cls, loggable_object, name in objects] != [loggable.name for loggable in self.loggables]:
+            raise ValueError("{} has different parts".format(self.name))
+        for loggable, (cls, loggable_object, name) in zip(self.loggables, objects):
+            loggable.rebind(connection, loggable_object)
+        self.vessel = vessel
+
+    def close(self):
+        try:
+            for loggable in self.loggables:
+                loggable.close()
+        finally:
+            # Recordings are finished even when the streams cannot be removed
+            for sink in self.sinks:
+                sink.close()
+
+def vessel_objects(space_center, vessel, resource_names=()):
+    """(Loggable class, object, name) for each logger of one vessel: its parts' resources and its maneuver nodes get a logger each."""
+    objects = [
+        (krpc_logger.LoggableSpaceCenter, space_center, "sc"),
+        (krpc_logger.LoggableVessel, vessel, "vessel"),
+        (krpc_logger.LoggableOrbit, vessel.orbit, "orbit"),
+        (krpc_logger.LoggableFlight, vessel.flight(vessel.orbital_reference_frame), "flight"),
+        (krpc_logger.LoggableAutopilot, vessel.auto_pilot, "autopilot"),
+        (krpc_logger.LoggableControl, vessel.control, "control"),
+        (krpc_logger.LoggableCommunications, vessel.comms, "comms"),
+    ]
+    for resource_name in resource_names:
+        for i, resource in enumerate(vessel.resources.with_resource(resource_name)):
+            objects.append((krpc_logger.LoggableResource, resource, "{}{}".format(resource_name.lower(), i)))
+    for i, node in enumerate(vessel.control.nodes):
+        objects.append((krpc_logger.LoggableNode, node, "node{}".format(i)))
+    return(objects)
+
+def vessel_loggers(connection, space_center, vessel, resource_names=(), **options):
+    """The loggers for one vessel, see vessel_objects(). Options, e.g. a profile, go to every logger."""
+    return([cls(connection, loggable_object, name, **options) for cls, loggable_object, name in vessel_objects(space_center, vessel, resource_names)])
+
+class Fleet:
+    """
+    VesselTelemetry for every vessel in space_center.vessels. tick() is meant
+    to be an AcquisitionScheduler tick hook: it samples every attached vessel
+    and every discovery_period re-reads the vessel list, attaching new vessels
+    (e.g. from staging) and detaching the ones that are gone. Discovery and
+    the stream setup of new vessels run on the tick that is due for it, so
+    that tick runs late. A vessel whose streams start failing, e.g. because
+    it was destroyed, is detached and not retried for retry_period seconds.
+    loggable_options, e.g. a profile or a shape cache, go to every vessel's
+    loggers.
+    """
+    def __init__(self, connection, space_center, capacity=10000, discovery_period=5.0,
+                 retry_period=30.0, resource_names=('LiquidFuel', 'Oxidizer'), ignore=(), loggable_options=None):
+        self.connection = connection
+        self.space_center = space_center
+        self.capacity = capacity
+        self.discovery_period = discovery_period
+        self.retry_period = retry_period
+        self.resource_names = resource_names
+        # Vessels logged elsewhere, e.g. the active vessel behind the dashboard
+        self.ignore = list(ignore)
+        self.loggable_options = {} if loggable_options is None else dict(loggable_options)
+
+        self.vessels = {}
+        self.failed = {}
+        # Called with the VesselTelemetry after it is attached or detached
+        self.on_attach = []
+        self.on_detach = []
+        self.next_discovery = -np.inf
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return(len(self.vessels))
+
+    def unique_name(self, vessel):
+        name = vessel.name
+        names = {telemetry.name for telemetry in self.vessels.values()}
+        i = 2
+        while name in names:
+            name = "{} ({})".format(vessel.name, i)
+            i += 1
+        return(name)
+
+    def attach(self, vessel, name=None):
+        if vessel in self.vessels:
+            return(self.vessels[vessel])
+        # Streams are set up on the calling thread, from tick() the
+        # acquisition thread, which waits for them. The lock only guards the
+        # vessel list, e.g. against reconnect().
+        telemetry = VesselTelemetry(
+            self.connection, self.space_center, vessel,
+            self.unique_name(vessel) if name is None else name,
+            self.capacity, self.resource_names, self.loggable_options
+        )
+        with self.lock:
+            self.vessels[vessel] = telemetry
+        for callback in self.on_attach:
+            callback(telemetry)
+        return(telemetry)
+
+    def detach(self, vessel):
+        with self.lock:
+            telemetry = self.vessels.pop(vessel, None)
+        if telemetry is None:
+            return(None)
+        try:
+            telemetry.close()
+        except (RuntimeError, ValueError, OSError):
+            # The server may already have dropped the streams of a destroyed
+            # vessel, or the connection may be gone
+            pass
+        for callback in self.on_detach:
+            callback(telemetry)
+        return(telemetry)
+
+    def close(self):
+        for vessel in list(self.vessels):
+            self.detach(vessel)
+
+    def reconnect(self, connection, space_center, ignore=()):
+        """
+        Carry on over a new connection, e.g. after a reconnect. Vessels are
+        matched to the new connection's by name and keep their stores and
+        sinks, with a gap row marking the outage. The rest are detached.
+        """
+        vessels = {}
+        for vessel in space_center.vessels:
+            if vessel not in ignore:
+                vessels.setdefault(vessel.name, vessel)
+        self.connection = connection
+        self.space_center = space_center
+        self.ignore = list(ignore)
+        self.failed = {}
+        with self.lock:
+            attached = list(self.vessels.items())
+            self.vessels = {}
+        for vessel, telemetry in attached:
+            try:
+                if telemetry.vessel_name not in vessels:
+                    # Gone, or now the active vessel
+                    raise KeyError("not among the vessels to log")
+                telemetry.rebind(connection, space_center, vessels[telemetry.vessel_name], self.resource_names)
+            except (KeyError, RuntimeError, ValueError) as e:
+                e = e.args[0] if isinstance(e, KeyError) else e
+                print("Detaching vessel {}: {}".format(telemetry.name, e))
+                # Streams still on an old connection are let go of, the ones
+                # already on this one are removed by detach()
+                for loggable in telemetry.loggables:
+                    if loggable.connection is not connection:
+                        loggable.forget_streams()
+                with self.lock:
+                    self.vessels[vessel] = telemetry
+                self.detach(vessel)
+                continue
+            telemetry.gap()
+            with self.lock:
+                self.vessels[telemetry.vessel] = telemetry
+        self.next_discovery = -np.inf
+
+    def discover(self, now):
+        vessels = [vessel for vessel in self.space_center.vessels if vessel not in self.ignore]
+        for vessel in [vessel for vessel in self.vessels if vessel not in vessels]:
+            self.detach(vessel)
+        for vessel in vessels:
+            if vessel in self.vessels or now - self.failed.get(vessel, -np.inf) < self.retry_period:
+                continue
+            try:
+                self.attach(vessel)
+            except (RuntimeError, ValueError) as e:
+                print("Could not attach vessel {}: {}".format(vessel.name, e))
+                self.failed[vessel] = now
+
+    def tick(self, now):
+        if now >= self.next_discovery:
+            self.next_discovery = now + self.discovery_period
+            self.discover(now)
+        with self.lock:
+            attached = list(self.vessels.items())
+        timestamp = time.time()
+        for vessel, telemetry in attached:
+            try:
+                telemetry.sample_due(now, timestamp)
+            except (RuntimeError, ValueError) as e:
+                print("Detaching vessel {}: {}".format(telemetry.name, e))
+                self.failed[vessel] = now
+                self.detach(vessel)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Flight Recorder
+An append-only binary recording format for telemetry. A file starts with a magic string and a JSON schema header built from the loggers' column labels, followed by fixed-width little-endian float64 records. Rows are written in batches and fsync'd on an interval, and recordings open for replay as a numpy.memmap without any parsing.
+"""
+
+import json
+import os
+import struct
+import time
+import numpy as np
+
+MAGIC = b'KTYDREC1'
+DTYPE = np.dtype('<f8')
+TIME_COLUMN = 'host_time'
+# Paths recorded as Parquet or Arrow by columnar_recorder instead, which needs pyarrow
+COLUMNAR_EXTENSIONS = ['.parquet', '.arrow', '.feather']
+
+class FlightRecorder:
+    def __init__(self, path, column_labels, batch_rows=256, fsync_interval=5.0, metadata=None):
+        self.path = path
+        self.column_labels = [TIME_COLUMN] + list(column_labels)
+        self.fsync_interval = fsync_interval
+        self.rows_written = 0
+
+        self._batch = np.empty((batch_rows, len(self.column_labels)), dtype=DTYPE)
+        self._batch_rows = 0
+        self._last_sync = time.monotonic()
+
+        self.file = open(path, 'wb')
+        self.file.write(encode_header(self.column_labels, metadata))
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, values, timestamp=None):
+        row = self._batch[self._batch_rows]
+        row[0] = time.time() if timestamp is None else timestamp
+        row[1:] = values
+        self._batch_rows += 1
+        if self._batch_rows == len(self._batch):
+            self.flush()
+
+    def flush(self, sync=False):
+        if self._batch_rows:
+            self.file.write(memoryview(self._batch[:self._batch_rows]).cast('B'))
+            self.rows_written += self._batch_rows
+            self._batch_rows = 0
+        now = time.monotonic()
+        if sync or now - self._last_sync >= self.fsync_interval:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self._last_sync = now
+
+    def close(self):
+        if not self.file.closed:
+            self.flush(sync=True)
+            self.file.close()
+
+def encode_header(column_labels, metadata=None):
+    header = json.dumps({
+        'columns': list(column_labels),
+        'dtype': DTYPE.str,
+        'created': time.time(),
+        'metadata': {} if metadata is None else metadata,
+    }).encode('utf-8')
+    # Pad so the records start on an 8 byte boundary
+    length = len(MAGIC) + 4 + len(header)
+    header += b' '*(-length % DTYPE.itemsize)
+    return(MAGIC + struct.pack('<I', len(header)) + header)
+
+def is_columnar_path(path):
+    return(os.path.splitext(path)[1].lower() in COLUMNAR_EXTENSIONS)
+
+def is_recording(path):
+    with open(path, 'rb') as f:
+        return(f.read(len(MAGIC)) == MAGIC)
+
+class Recording:
+    """A recorded flight opened read-only through numpy.memmap."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not a ktydid flight recording".format(path))
+            header_length, = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_length).decode('utf-8'))
+        self.column_labels = header['columns']
+        self.column_index = {label: i for i, label in enumerate(self.column_labels)}
+        self.metadata = header['metadata']
+        self.created = header['created']
+
+        offset = len(MAGIC) + 4 + header_length
+        row_bytes = DTYPE.itemsize*len(self.column_labels)
+        # A partly written trailing record from an interrupted run is ignored
+        rows = (os.path.getsize(path) - offset) // row_bytes
+        if rows > 0:
+            self.data = np.memmap(path, dtype=DTYPE, mode='r', offset=offset, shape=(rows, len(self.column_labels)))
+        else:
+            self.data = np.empty((0, len(self.column_labels)), dtype=DTYPE)
+
+    def __len__(self):
+        return(len(self.data))
+
+    def column(self, label):
+        return(self.data[:, self.column_index[label]])
+
+    def columns(self, labels=None):
+        labels = self.column_labels if labels is None else labels
+        return({label: self.column(label) for label in labels})
+
+    def to_dataframe(self, labels=None):
+        import pandas as pd
+        return(pd.DataFrame(self.columns(labels), copy=False))
+
+def open_recording(path):
+    return(Recording(path))
+
+class ReplayObject:
+    """Stands in for a kRPC object; its name is the logger name used when recording."""
+    def __init__(self, name):
+        self.name = name
+
+class ReplayConnection:
+    """
+    Serves a recording through the same add_stream() interface as a kRPC
+    connection, so the Loggable classes replay it unchanged. advance() is
+    meant to be an AcquisitionScheduler tick hook: with a speed the replay
+    follows the recorded host_time at speed times real time, without one it
+    steps one record per tick, as fast as the pipeline can take them.
+    """
+    def __init__(self, recording, speed=1.0):
+        self.recording = recording
+        if not len(recording):
+            raise ValueError("{} has no records to replay".format(recording.path))
+        # A plain ndarray view of the map avoids memmap overhead per read
+        self.data = np.asarray(recording.data)
+        self.speed = speed if speed else None
+        self.time = self.data[:, recording.column_index[TIME_COLUMN]]
+        self.position = 0
+        self.row = self.data[0]
+        self._start = None
+        # Labels asked for that the recording does not have
+        self.missing = set()
+
+    def object(self, name):
+        return(ReplayObject(name))
+
+    def add_stream(self, fun, obj, attribute):
+        label = "{}_{}".format(obj.name, attribute)
+        index = self.recording.column_index
+        if label in index:
+            i = index[label]
+            return(lambda: self.row[i])
+        width = 0
+        while "{}_{}".format(label, width) in index:
+            width += 1
+        if width == 0:
+            # Recorded with another profile: the column replays as NaN
+            if label not in self.missing:
+                self.missing.add(label)
+                print("Not in recording {}: {}, replaying it as NaN".format(self.recording.path, label))
+            return(lambda: np.nan)
+        start = index["{}_0".format(label)]
+        return(lambda: tuple(self.row[start:start + width]))
+
+    def finished(self):
+        return(self._start is not None and self.position >= len(self.data) - 1)
+
+    def advance(self, now):
+        if self.finished():
+            raise StopIteration
+        # The first tick replays the first record
+        if self._start is None:
+            self._start = now
+        elif self.speed is None:
+            self.position += 1
+        if self.speed is not None:
+            target = self.time[0] + (now - self._start)*self.speed
+            self.position = max(int(np.searchsorted(self.time, target, 'right')) - 1, 0)
+        self.row = self.data[self.position]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Instrumentation
+Low-overhead timing histograms and counters for the acquisition and dashboard hot paths. Recording a duration is a log10 and a list increment, with no locks: counts from concurrent threads can very occasionally be lost, which is fine for health statistics. Snapshots can be shown in the dashboard's pipeline health figure or dumped to a JSON file.
+"""
+
+import json
+import math
+import time
+import numpy as np
+
+class Histogram:
+    """Log-spaced histogram of durations in seconds, by default 1 us to 100 s at 20 bins per decade."""
+    def __init__(self, low=1e-6, high=100.0, bins_per_decade=20):
+        self.low = math.log10(low)
+        self.bins_per_decade = bins_per_decade
+        # One underflow bin in front and one overflow bin at the end
+        self.n_bins = int(round((math.log10(high) - self.low)*bins_per_decade)) + 2
+        self.counts = [0]*self.n_bins
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        if value > 0:
+            i = min(max(int((math.log10(value) - self.low)*self.bins_per_decade) + 1, 0), self.n_bins - 1)
+        else:
+            i = 0
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def upper_edges(self):
+        edges = 10**(self.low + np.arange(self.n_bins)/self.bins_per_decade)
+        edges[-1] = np.inf
+        return(edges)
+
+    def percentile(self, q):
+        """Upper edge of the bin holding the q-th percentile, capped at the largest value seen."""
+        if self.count == 0:
+            return(np.nan)
+        i = int(np.searchsorted(np.cumsum(self.counts), q/100*self.count))
+        return(min(self.upper_edges()[min(i, self.n_bins - 1)], self.max))
+
+    def summary(self):
+        return({
+            'count': self.count,
+            'mean': self.total/self.count if self.count else np.nan,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+        })
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.record(time.perf_counter() - self.start)
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        # Latest values, e.g. the current polling period
+        self.gauges = {}
+        self.created = time.time()
+
+    def histogram(self, name):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+        return(self.histograms[name])
+
+    def time(self, name):
+        """Context manager recording the duration of its block, for code that is not per-tick hot."""
+        return(Timer(self.histogram(name)))
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self):
+        return({
+            'created': self.created,
+            'time': time.time(),
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'histograms': {name: histogram.summary() for name, histogram in list(self.histograms.items())},
+        })
+
+    def dump(self, path):
+        # NaN is not valid JSON, empty statistics are written as null
+        snapshot = self.snapshot()
+        for summary in snapshot['histograms'].values():
+            for key, value in summary.items():
+                if value != value:
+                    summary[key] = None
+        with open(path, 'w') as f:
+            json.dump(snapshot, f, indent=1, sort_keys=True)
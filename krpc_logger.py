@@ -6,76 +6,557 @@ KRPC Logger
 This module is a handler for streaming data from krpc objects. It creates update methods for gathering and formatting data for many relevant object types.
 """
 
-import datetime
-import krpc
+import derived
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
 import numpy as np
-import pandas as pd
 
 class Loggable:
-    def __init__(self, connection, loggable_object, name):
+    def __init__(self, connection, loggable_object, name, profile=None, lazy=False, shape_cache=None):
         self.connection = connection
         self.loggable_object = loggable_object
         self.name = name
+        # A telemetry_config.Profile that narrows the logger down to the
+        # attributes, sample periods and derived channels it lists
+        self.profile = profile
+        # Lazy loggers only stream the attributes that have been subscribe()d
+        self.lazy = lazy
+        # A ShapeCache, None probes every stream at setup
+        self.shape_cache = shape_cache
         
         self.column_labels = []
         self.stream_list = []
+        self.slot_map = []
+        self.remote_streams = {}
+        # Event-driven acquisition, see watch()
+        self.on_change = None
+        self.stream_callbacks = {}
         
+        if self.profile is not None:
+            self.profile.configure(self)
         if self.attribute_config is None:
             print("No attributes to stream. Assign attribute_config and call setup_streams().")
         else:
             self.setup_streams()
     
     def setup_streams(self):
-        for attribute, config in self.attribute_config.items():
-            if self.connection is None:
-                stream = config['sim_fun']
+        attributes = list(self.attribute_config)
+        self.subscribers = dict.fromkeys(attributes, 0)
+        streams = self.open_streams(attributes)
+        
+        # Tuple widths come from the shape cache when this logger was seen
+        # before, otherwise every stream is probed once. Lazy loggers probe
+        # through temporary streams.
+        key = None if self.shape_cache is None else self.shape_cache.key(self)
+        widths = None if key is None else self.shape_cache.get(key)
+        if widths is None:
+            probes = streams if not self.lazy else self.open_streams(attributes, force=True)
+            widths = {}
+            for attribute, stream in zip(attributes, probes):
+                # An attribute the krpc client does not know has no stream, see add_streams()
+                example_return = stream() if stream is not None else None
+                widths[attribute] = len(example_return) if type(example_return) is tuple else None
+            if self.lazy:
+                self.close_streams(attributes)
+            if key is not None and None not in probes:
+                self.shape_cache.put(key, widths)
+        
+        for attribute, stream in zip(attributes, streams):
+            width = widths[attribute]
+            self.slot_map.append((attribute, stream, len(self.column_labels), width))
+            base_label = "{}_{}".format(self.name, attribute)
+            if width is not None:
+                self.column_labels += ["{}_{}".format(base_label, i) for i in range(width)]
             else:
-                stream = self.connection.add_stream(*(config['stream_params'](self.loggable_object, attribute)))
-            
+                self.column_labels += [ base_label ]
+        
+        self.setup_derived()
+        self.compile_slots()
+    
+    def setup_derived(self):
+        # Derived channel columns follow the raw ones. A channel's sources are
+        # attributes or derived channels declared before it.
+        columns = {attribute: slice(offset, offset + (width or 1)) for attribute, stream, offset, width in self.slot_map}
+        self.derived_channels = []
+        # Derived channel -> its columns, and the attributes it is ultimately computed from
+        self.derived_columns = {}
+        self.derived_sources = {}
+        for name, config in self.derived_config.items():
+            sources = config['source'] if type(config['source']) in (list, tuple) else [config['source']]
+            operator = config['operator'](*config.get('params', ()))
+            width = columns[sources[0]].stop - columns[sources[0]].start if operator.elementwise else 1
+            base_label = "{}_{}".format(self.name, name)
+            columns[name] = slice(len(self.column_labels), len(self.column_labels) + width)
+            if width > 1:
+                self.column_labels += ["{}_{}".format(base_label, i) for i in range(width)]
+            else:
+                self.column_labels += [ base_label ]
+            self.derived_channels.append((operator, [columns[source] for source in sources], columns[name]))
+            self.derived_columns[name] = columns[name]
+            self.derived_sources[name] = [attribute for source in sources for attribute in self.derived_sources.get(source, [source])]
+    
+    def update_derived(self, out, t):
+        # Called once the raw columns of `out` hold the new sample, with its time
+        for operator, sources, target in self.derived_channels:
+            out[target] = operator.update(t, *[out[source] for source in sources])
+    
+    def vector_columns(self):
+        # Vector channel label -> its columns, for tuple attributes and
+        # elementwise derived channels of them
+        columns = {"{}_{}".format(self.name, attribute): slice(offset, offset + width) for attribute, stream, offset, width in self.slot_map if width is not None}
+        columns.update({"{}_{}".format(self.name, name): target for name, target in self.derived_columns.items() if target.stop - target.start > 1})
+        return(columns)
+
+    def open_streams(self, attributes, force=False):
+        # Create and decorate the streams of some attributes. Lazy loggers
+        # leave this to subscribe() and return None for each attribute.
+        if self.lazy and not force:
+            return([None]*len(attributes))
+        if self.connection is None:
+            streams = [self.attribute_config[attribute]['sim_fun'] for attribute in attributes]
+        else:
+            streams = add_streams(self.connection, [
+                self.attribute_config[attribute]['stream_params'](self.loggable_object, attribute) for attribute in attributes
+            ])
+        self.remote_streams.update(zip(attributes, streams))
+        for i, attribute in enumerate(attributes):
+            if streams[i] is None:
+                continue
             try:
-                dec = config['stream_decorator']
-                stream = dec(stream)
+                dec = self.attribute_config[attribute]['stream_decorator']
+                streams[i] = dec(streams[i])
             except KeyError: pass
-            example_return = stream()
-            base_label = "{}_{}".format(self.name, attribute)
-            if type(example_return) is tuple:
-                # print("Tuple:", attribute, example_return)
-                column_labels = ["{}_{}".format(base_label, i) for i in range(len(example_return))]
-                self.stream_list.append(stream)
-            else:
-                # print("Float:", attribute, example_return)
-                column_labels = [ base_label ]
-                enlist = lambda x: lambda: [x()]
-                self.stream_list.append(enlist(stream))
-                
-            self.column_labels += column_labels
+        return(streams)
+    
+    def close_streams(self, attributes):
+        for attribute in attributes:
+            self.remove_callback(attribute)
+            remove_stream(self.remote_streams.pop(attribute, None))
+    
+    def subscribe(self, attributes):
+        """
+        Count a consumer of each attribute. A lazy logger creates the streams
+        of attributes that had no consumers and starts sampling them.
+        """
+        opened = [attribute for attribute in attributes if self.subscribers[attribute] == 0]
+        for attribute in attributes:
+            self.subscribers[attribute] += 1
+        if self.lazy and opened:
+            self.set_streams(dict(zip(opened, self.open_streams(opened, force=True))))
+    
+    def unsubscribe(self, attributes):
+        """Drop a consumer of each attribute. A lazy logger removes the streams nobody reads anymore."""
+        closed = []
+        for attribute in attributes:
+            self.subscribers[attribute] -= 1
+            if self.subscribers[attribute] == 0:
+                closed.append(attribute)
+        if self.lazy and closed:
+            self.set_streams(dict.fromkeys(closed))
+            self.close_streams(closed)
     
-    def update(self):
+    def set_streams(self, streams):
+        self.slot_map = [
+            (attribute, streams.get(attribute, stream), offset, width) for attribute, stream, offset, width in self.slot_map
+        ]
+        self.compile_slots()
+        if self.on_change is not None:
+            for attribute, stream in streams.items():
+                if stream is not None:
+                    self.add_callback(attribute)
+                else:
+                    # Its columns go NaN, as they would when polled
+                    self.remove_callback(attribute)
+                    offset, width = self.slot_index[attribute][1:]
+                    self.on_change(slice(offset, offset + (width or 1)), np.nan)
+    
+    def watch(self, on_change):
+        """
+        Event-driven acquisition: call on_change(columns, value) from the
+        stream's update thread whenever a stream gets a new value, rather than
+        waiting to be polled. `columns` is the column offset of a scalar or the
+        slice of a tuple. The server sends each stream at most once per the
+        attribute's sample period.
+        """
+        self.on_change = on_change
+        for attribute, stream, offset, width in self.slot_map:
+            if stream is not None:
+                self.add_callback(attribute)
+    
+    def add_callback(self, attribute):
+        remote = self.remote_streams.get(attribute)
+        if remote is None or not hasattr(remote, 'add_callback') or attribute in self.stream_callbacks:
+            return
+        period = self.attribute_config[attribute].get('sample_period')
+        if period is None: period = self.sample_period
+        if period:
+            remote.rate = 1/period
+        callback = lambda value: self.stream_changed(attribute)
+        self.stream_callbacks[attribute] = callback
+        remote.add_callback(callback)
+        # The value the stream already has
+        self.stream_changed(attribute)
+    
+    def remove_callback(self, attribute):
+        callback = self.stream_callbacks.pop(attribute, None)
+        if callback is not None:
+            self.remote_streams[attribute].remove_callback(callback)
+    
+    def stream_changed(self, attribute):
+        # Read through the decorated stream, e.g. NaN for a disengaged autopilot
+        stream, offset, width = self.slot_index[attribute]
+        if stream is None or self.on_change is None:
+            return
+        self.on_change(offset if width is None else slice(offset, offset + width), stream())
+    
+    def compile_slots(self):
+        # Group the slot map by sample period. Each group writes its scalar
+        # streams with one fancy-indexed assignment and its tuple streams as
+        # contiguous slices.
+        # Columns of attributes without a stream are written as NaN.
+        periods = {}
+        idle_columns = []
+        self.stream_list = []
+        self.slot_index = {attribute: (stream, offset, width) for attribute, stream, offset, width in self.slot_map}
+        for attribute, stream, offset, width in self.slot_map:
+            if stream is None:
+                idle_columns += range(offset, offset + (width or 1))
+                self.stream_list.append((lambda n: lambda: [np.nan]*n)(width or 1))
+                continue
+            self.stream_list.append(stream if width is not None else (lambda x: lambda: [x()])(stream))
+            period = self.attribute_config[attribute].get('sample_period')
+            if period is None: period = self.sample_period
+            periods.setdefault(period, []).append((stream, offset, width))
+        self.slot_groups = [SlotGroup(slots, period) for period, slots in periods.items()]
+        self.idle_columns = np.array(idle_columns, dtype=np.intp)
+        if len(getattr(self, 'row', ())) != len(self.column_labels):
+            self.row = np.full(len(self.column_labels), np.nan)
+    
+    def update(self, t=None):
+        # Derived channels are computed at t, which should be the time the
+        # store would give them (sc_ut or the row timestamp), by default now
         line = [stream() for stream in self.stream_list]
         line = [li for sublist in line for li in sublist]
+        if self.derived_channels:
+            # Derived channel columns follow the raw ones
+            line = np.array(line + [np.nan]*(len(self.column_labels) - len(line)))
+            self.update_derived(line, time.time() if t is None else t)
         assert(len(line) == len(self.column_labels))
+        # Imported here so the acquisition and recorder, which only use
+        # update_into(), start without pandas
+        import pandas as pd
         df_new = pd.DataFrame([line], columns=self.column_labels)
         return(df_new)
+
+    def update_into(self, out=None):
+        # Write one sample straight into a float64 row slice, e.g. from a
+        # TelemetryStore, or into the logger's own preallocated row buffer.
+        out = self.row if out is None else out
+        for group in self.slot_groups:
+            group.sample(out)
+        if len(self.idle_columns):
+            out[self.idle_columns] = np.nan
+        return(out)
+
+    def update_due(self, out, now):
+        # Only sample the groups whose sample period has elapsed; the other
+        # columns of `out` are left holding their previous values.
+        for group in self.slot_groups:
+            if now >= group.next_due:
+                group.sample(out)
+                group.schedule(now)
+        if len(self.idle_columns):
+            out[self.idle_columns] = np.nan
+    
+    def close(self):
+        # Remove the logger's streams from the server, e.g. when its vessel is gone
+        self.close_streams(list(self.remote_streams))
+    
+    def forget_streams(self):
+        # Let go of the logger's streams without contacting the server, e.g. when the connection is gone
+        for attribute, stream in self.remote_streams.items():
+            remove_stream(stream, server=False)
+        self.remote_streams = {}
+        self.stream_callbacks = {}
+    
+    def rebind(self, connection, loggable_object):
+        """
+        Set the logger up again on a new connection or object, e.g. after a
+        reconnect or a vessel switch. The old streams are removed from the
+        server when the connection is the same, otherwise they are let go of
+        without contacting it. Subscriptions and watch() carry over and the
+        columns stay the same. Derived channels start over.
+
+        Raises ValueError, with the logger left streaming nothing, when the
+        new object would give other columns.
+        """
+        if connection is self.connection:
+            self.close()
+        else:
+            self.forget_streams()
+        saved = (self.column_labels, self.slot_map, self.derived_channels, self.derived_columns, self.derived_sources)
+        column_labels, subscribers = self.column_labels, self.subscribers
+        self.connection = connection
+        self.loggable_object = loggable_object
+        self.column_labels = []
+        self.slot_map = []
+        self.setup_streams()
+        if self.column_labels != column_labels:
+            # Back to the old layout without streams, so the store's columns
+            # read NaN and another rebind() compares against the same columns
+            self.close()
+            self.column_labels, slot_map, self.derived_channels, self.derived_columns, self.derived_sources = saved
+            self.slot_map = [(attribute, None, offset, width) for attribute, stream, offset, width in slot_map]
+            self.subscribers = subscribers
+            self.compile_slots()
+            raise ValueError("{} changed its columns when set up again".format(self.name))
+        self.subscribers = subscribers
+        opened = [attribute for attribute, count in subscribers.items() if count > 0]
+        if self.lazy and opened:
+            self.set_streams(dict(zip(opened, self.open_streams(opened, force=True))))
+        if self.on_change is not None:
+            self.watch(self.on_change)
+    
+    # Seconds between samples for the whole logger. None samples on every
+    # acquisition tick. Attributes override it with a 'sample_period' entry.
+    sample_period = None
+    
+    # Derived channels, e.g. {'acceleration': derived_template('speed', derived.Difference)}
+    derived_config = {}
+    derived_template = lambda self, source, operator, *params: {
+                'source': source,
+                'operator': operator,
+                'params': params
+            }
     
     stream_params_attribute = lambda self, x, y: [getattr, x, y]
     stream_params_method = None
-    attribute_template_ranf = lambda self, n: {
-                'sim_fun': np.random.ranf if (n is 1) else (lambda: tuple(np.random.ranf(n))),
-                'stream_params': self.stream_params_attribute
+    attribute_template_ranf = lambda self, n, sample_period=None: {
+                'sim_fun': np.random.ranf if (n == 1) else (lambda: tuple(np.random.ranf(n))),
+                'stream_params': self.stream_params_attribute,
+                'sample_period': sample_period
             }
 
+def add_streams(connection, stream_params, timeout=10.0):
+    """
+    Register a list of streams, each given as add_stream() arguments. With a
+    krpc client the AddStream and StartStream calls each go out as a single
+    request and the first values are waited for once, rather than paying a
+    round-trip and a server frame per stream. Other connections (simulation,
+    replay), and krpc clients without the internals this relies on, register
+    them one at a time. Attributes the krpc client does not know get None
+    instead of a stream. If registering fails, the streams already created
+    are removed again.
+    """
+    # krpc is only loaded once something has connected with it
+    client = sys.modules.get('krpc.client')
+    if client is None or not isinstance(connection, client.Client):
+        return([connection.add_stream(*params) for params in stream_params])
+    if not batch_supported(connection):
+        return(add_streams_each(connection, stream_params))
+    import krpc.error
+    import krpc.stream
+    from krpc.decoder import Decoder
+    
+    streams = [None]*len(stream_params)
+    calls = {}
+    for i, params in enumerate(stream_params):
+        try:
+            calls[i] = (connection._get_return_type(*params), connection.get_call(*params))
+        except AttributeError:
+            unknown_attribute(params)
+    if not calls:
+        return(streams)
+    created = []
+    try:
+        results = batch_invoke(connection, [
+            connection.krpc._build_call_add_stream(call, False) for return_type, call in calls.values()
+        ], check=False)
+        for i, (return_type, call), result in zip(calls, calls.values(), results):
+            if not result.HasField('error'):
+                stream_id = Decoder.decode(connection, result.value, connection._types.stream_type).id
+                streams[i] = krpc.stream.Stream.from_stream_id(connection, stream_id, return_type)
+                created.append(streams[i])
+        errors = [result.error for result in results if result.HasField('error')]
+        if errors:
+            raise connection._build_error(errors[0])
+        
+        # Streams are only started once the client knows their ids, kRPC sends
+        # a value once and then only when it changes.
+        batch_invoke(connection, [connection.krpc._build_call_start_stream(stream._stream._stream_id) for stream in created])
+        for stream in created:
+            stream._stream._started = True
+        
+        deadline = time.monotonic() + timeout
+        with connection.stream_update_condition:
+            while not all(stream._stream.updated for stream in created):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise krpc.error.StreamError("Timed out waiting for the first stream updates")
+                connection.wait_for_stream_update(remaining)
+    except Exception:
+        discard_streams(created)
+        raise
+    add_references(created)
+    return(streams)
+
+def batch_supported(connection):
+    # The client internals add_streams() batches with, which krpc may change
+    import krpc.stream
+    return(
+        all(hasattr(connection, name) for name in ['_get_return_type', 'get_call', '_types', '_build_error', '_rpc_connection', '_rpc_connection_lock'])
+        and all(hasattr(connection.krpc, name) for name in ['_build_call_add_stream', '_build_call_start_stream'])
+        and hasattr(krpc.stream.Stream, 'from_stream_id')
+    )
+
+def add_streams_each(connection, stream_params):
+    # add_streams() one add_stream() at a time
+    streams = []
+    try:
+        for params in stream_params:
+            try:
+                stream = connection.add_stream(*params)
+            except AttributeError:
+                unknown_attribute(params)
+                stream = None
+            streams.append(stream)
+    except Exception:
+        discard_streams([stream for stream in streams if stream is not None])
+        raise
+    add_references([stream for stream in streams if stream is not None])
+    return(streams)
+
+# (class, attribute) of the attributes the krpc client does not know
+unknown_attributes = set()
+
+def unknown_attribute(params):
+    # Attributes of other krpc versions, e.g. AutoPilot.roll_threshold, are
+    # reported once
+    attribute = (type(params[1]).__name__, params[2])
+    if attribute not in unknown_attributes:
+        unknown_attributes.add(attribute)
+        print("The krpc client has no {}.{}, it is logged as NaN".format(*attribute))
+
+def add_references(streams):
+    with stream_references_lock:
+        for stream in streams:
+            stream_references[stream._stream] = stream_references.get(stream._stream, 0) + 1
+
+def discard_streams(streams):
+    # Remove the streams a failed add_streams() created, unless another
+    # logger shares them. The connection may be what failed.
+    for stream in streams:
+        with stream_references_lock:
+            shared = stream._stream in stream_references
+        if not shared:
+            try:
+                stream.remove()
+            except Exception:
+                pass
+
+# The krpc client shares one stream between identical calls, e.g. UT for
+# several vessels, so it is only removed when its last logger lets go.
+stream_references = {}
+stream_references_lock = threading.Lock()
+
+def remove_stream(stream, server=True):
+    # server=False only lets go of the stream, e.g. when its connection is gone
+    if not hasattr(stream, 'remove'):
+        return
+    shared = getattr(stream, '_stream', None)
+    with stream_references_lock:
+        count = stream_references.pop(shared, 1) - 1
+        if count > 0:
+            stream_references[shared] = count
+            return
+    if server:
+        stream.remove()
+
+def batch_invoke(connection, calls, check=True):
+    # Several procedure calls in one kRPC request. check=False leaves errors
+    # in the results to the caller.
+    import krpc.schema.KRPC_pb2 as KRPC
+    request = KRPC.Request()
+    request.calls.extend(calls)
+    with connection._rpc_connection_lock:
+        connection._rpc_connection.send_message(request)
+        response = connection._rpc_connection.receive_message(KRPC.Response)
+    if response.HasField('error'):
+        raise connection._build_error(response.error)
+    for result in response.results if check else ():
+        if result.HasField('error'):
+            raise connection._build_error(result.error)
+    return(response.results)
+
+class ShapeCache:
+    """
+    Column layouts of loggers (the tuple width of each streamed attribute)
+    saved to a JSON file, so later launches skip probing every stream.
+    Entries are keyed by the context (e.g. the vessel name), the logger
+    class and name, and its attribute set.
+    """
+    def __init__(self, path, context=''):
+        self.path = path
+        self.context = context
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.shapes = json.load(f)
+        except (OSError, ValueError):
+            self.shapes = {}
+    
+    def key(self, loggable):
+        attributes = hashlib.sha1(','.join(loggable.attribute_config).encode('utf-8')).hexdigest()[:16]
+        return("{}/{}/{}/{}".format(self.context, type(loggable).__name__, loggable.name, attributes))
+    
+    def get(self, key):
+        return(self.shapes.get(key))
+    
+    def put(self, key, widths):
+        with self.lock:
+            self.shapes[key] = widths
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.shapes, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+class SlotGroup:
+    def __init__(self, slots, period=None):
+        self.period = period
+        self.next_due = -np.inf
+        scalar_slots = [(stream, offset) for stream, offset, width in slots if width is None]
+        self.scalar_streams = [stream for stream, _ in scalar_slots]
+        self.scalar_offsets = np.array([offset for _, offset in scalar_slots], dtype=np.intp)
+        self.vector_slots = [(stream, offset, offset + width) for stream, offset, width in slots if width is not None]
+    
+    def sample(self, out):
+        out[self.scalar_offsets] = [stream() for stream in self.scalar_streams]
+        for stream, start, stop in self.vector_slots:
+            out[start:stop] = stream()
+    
+    def schedule(self, now):
+        if self.period is not None:
+            # Stay on the period grid but never queue up missed samples
+            self.next_due = max(self.next_due + self.period, now)
+
 class LoggableSpaceCenter(Loggable):
-    def __init__(self, connection, loggable_object, name):
+    def __init__(self, connection, loggable_object, name, **options):
         self.attribute_config = {
             'ut': {
-                'sim_fun': datetime.datetime.now,
+                'sim_fun': time.time,
                 'stream_params': self.stream_params_attribute
             }
         }
-        Loggable.__init__(self, connection, loggable_object, name)
+        Loggable.__init__(self, connection, loggable_object, name, **options)
 
 class LoggableFlight(Loggable):
-    def __init__(self, connection, loggable_object, name):
+    def __init__(self, connection, loggable_object, name, **options):
         self.attribute_config = {
             'g_force': self.attribute_template_ranf(1),
             'mean_altitude': self.attribute_template_ranf(1),
@@ -122,38 +603,52 @@ class LoggableFlight(Loggable):
             # 'ballistic_coefficient': self.attribute_template_ranf(1), # requires FAR
             # 'thrust_specific_fuel_consumption': self.attribute_template_ranf(1), # requires FAR
         }
-        Loggable.__init__(self, connection, loggable_object, name)
+        self.derived_config = {
+            'acceleration': self.derived_template('speed', derived.Difference),
+            'max_dynamic_pressure': self.derived_template('dynamic_pressure', derived.RunningMax),
+        }
+        Loggable.__init__(self, connection, loggable_object, name, **options)
 
     
 class LoggableVessel(Loggable):
-    def __init__(self, connection, loggable_object, name):
+    def __init__(self, connection, loggable_object, name, **options):
         self.attribute_config = {
             'met': {
-                'sim_fun': datetime.datetime.now,
+                'sim_fun': lambda start=time.time(): time.time() - start,
                 'stream_params': self.stream_params_attribute
             },
             'mass': self.attribute_template_ranf(1),
-            'dry_mass': self.attribute_template_ranf(1),
+            'dry_mass': self.attribute_template_ranf(1, sample_period=5.0),
             'thrust': self.attribute_template_ranf(1),
             'available_thrust': self.attribute_template_ranf(1),
             'max_thrust': self.attribute_template_ranf(1),
-            'max_vacuum_thrust': self.attribute_template_ranf(1),
+            'max_vacuum_thrust': self.attribute_template_ranf(1, sample_period=5.0),
             'specific_impulse': self.attribute_template_ranf(1),
-            'vacuum_specific_impulse': self.attribute_template_ranf(1),
+            'vacuum_specific_impulse': self.attribute_template_ranf(1, sample_period=5.0),
             'moment_of_inertia': self.attribute_template_ranf(3),
             # 'inertia_tensor': self.attribute_template_ranf(1),
             
         }
-        Loggable.__init__(self, connection, loggable_object, name)
+        self.derived_config = {
+            # Negative while burning propellant
+            'mass_flow': self.derived_template('mass', derived.Difference),
+            'total_impulse': self.derived_template('thrust', derived.Integral),
+            'delta_v': self.derived_template(
+                ['specific_impulse', 'mass', 'dry_mass'],
+                derived.Formula,
+                lambda isp, mass, dry_mass: isp*9.80665*np.log(mass/dry_mass)
+            ),
+        }
+        Loggable.__init__(self, connection, loggable_object, name, **options)
         
 class LoggableAutopilot(Loggable):
-    def __init__(self, connection, loggable_object, name):
+    def __init__(self, connection, loggable_object, name, **options):
         self.attribute_config = {
             'error': {
-                'sim_fun': np.random.ranf if (n is 1) else (lambda: tuple(np.random.ranf(n))),
+                'sim_fun': np.random.ranf,
                 'stream_params': self.stream_params_attribute,
                 'stream_decorator': self.ap_engaged_dec
-                }
+                },
             'pitch_error': self.attribute_template_ranf(1),
             'heading_error': self.attribute_template_ranf(1),
             'roll_error': self.attribute_template_ranf(1),
@@ -171,20 +666,27 @@ class LoggableAutopilot(Loggable):
             'roll_pid_gains': self.attribute_template_ranf(3),
             'yaw_pid_gains': self.attribute_template_ranf(3),
         }
-        Loggable.__init__(self, connection, loggable_object, name)
+        self.derived_config = {
+            'pitch_error_smoothed': self.derived_template('pitch_error', derived.EMA, 2.0),
+            'pitch_error_rms': self.derived_template('pitch_error', derived.WindowedRMS, 10.0),
+            'min_pitch_error': self.derived_template('pitch_error', derived.RunningMin),
+        }
+        Loggable.__init__(self, connection, loggable_object, name, **options)
     
     def ap_engaged_dec(self, stream_fun):
+        # Only a krpc connection raises RPCError, and it has loaded krpc.error
+        error = getattr(sys.modules.get('krpc.error'), 'RPCError', ())
         def stream():
             try:
                 result = stream_fun()
-            # except TODOERROR as e:
-                # if e is "TODOSTR": return(None)
-                # else: raise
+            except error:
+                # The autopilot error is unavailable while it is disengaged
+                result = np.nan
             return(result)
         return(stream)
         
 class LoggableOrbit(Loggable):
-    def __init__(self, connection, loggable_object, name):
+    def __init__(self, connection, loggable_object, name, **options):
         self.attribute_config = {
             'apoapsis': self.attribute_template_ranf(1),
             'periapsis': self.attribute_template_ranf(1),
@@ -194,24 +696,24 @@ class LoggableOrbit(Loggable):
             'semi_minor_axis': self.attribute_template_ranf(1),
             'radius': self.attribute_template_ranf(1),
             'speed': self.attribute_template_ranf(1),
-            'period': self.attribute_template_ranf(1),
+            'period': self.attribute_template_ranf(1, sample_period=5.0),
             'time_to_apoapsis': self.attribute_template_ranf(1),
             'time_to_periapsis': self.attribute_template_ranf(1),
             'eccentricity': self.attribute_template_ranf(1),
-            'inclination': self.attribute_template_ranf(1),
-            'longitude_of_ascending_node': self.attribute_template_ranf(1),
+            'inclination': self.attribute_template_ranf(1, sample_period=5.0),
+            'longitude_of_ascending_node': self.attribute_template_ranf(1, sample_period=5.0),
             'argument_of_periapsis': self.attribute_template_ranf(1),
-            'epoch': self.attribute_template_ranf(1),
+            'epoch': self.attribute_template_ranf(1, sample_period=5.0),
             'mean_anomaly': self.attribute_template_ranf(1),
             'eccentric_anomaly': self.attribute_template_ranf(1),
             'true_anomaly': self.attribute_template_ranf(1),
             'orbital_speed': self.attribute_template_ranf(1),
             'time_to_soi_change': self.attribute_template_ranf(1),
         }
-        Loggable.__init__(self, connection, loggable_object, name)
+        Loggable.__init__(self, connection, loggable_object, name, **options)
 
 class LoggableControl(Loggable):
-    def __init__(self, connection, loggable_object, name):
+    def __init__(self, connection, loggable_object, name, **options):
         self.attribute_config = {
             'throttle': self.attribute_template_ranf(1),
             'pitch': self.attribute_template_ranf(1),
@@ -224,28 +726,28 @@ class LoggableControl(Loggable):
             'wheel_steering': self.attribute_template_ranf(1),
             'current_stage': self.attribute_template_ranf(1),
         }
-        Loggable.__init__(self, connection, loggable_object, name)
+        Loggable.__init__(self, connection, loggable_object, name, **options)
 
 class LoggableCommunications(Loggable):
-    def __init__(self, connection, loggable_object, name):
+    def __init__(self, connection, loggable_object, name, **options):
         self.attribute_config = {
             'signal_strength': self.attribute_template_ranf(1),
             'signal_delay': self.attribute_template_ranf(1),
             'power': self.attribute_template_ranf(1),
         }
-        Loggable.__init__(self, connection, loggable_object, name)
+        Loggable.__init__(self, connection, loggable_object, name, **options)
         
 class LoggableResource(Loggable):
-    def __init__(self, connection, loggable_object, name):
+    def __init__(self, connection, loggable_object, name, **options):
         self.attribute_config = {
             'amount': self.attribute_template_ranf(1),
             'max': self.attribute_template_ranf(1),
             'density': self.attribute_template_ranf(1),
         }
-        Loggable.__init__(self, connection, loggable_object, name)
+        Loggable.__init__(self, connection, loggable_object, name, **options)
 
 class LoggableNode(Loggable):
-    def __init__(self, connection, loggable_object, name):
+    def __init__(self, connection, loggable_object, name, **options):
         self.attribute_config = {
             'prograde': self.attribute_template_ranf(1),
             'normal': self.attribute_template_ranf(1),
@@ -254,4 +756,4 @@ class LoggableNode(Loggable):
             'remaining_delta_v': self.attribute_template_ranf(1),
             'time_to': self.attribute_template_ranf(1),
         }
-        Loggable.__init__(self, connection, loggable_object, name)
\ No newline at end of file
+        Loggable.__init__(self, connection, loggable_object, name, **options)
\ No newline at end of file
@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+KRPC Simulator
+A deterministic stand-in for a krpc connection. A seeded point-mass vessel model flies a gravity turn from Kerbin's surface into orbit, and the simulated objects expose the same attribute names as the krpc SpaceCenter classes, so the Loggable classes stream coherent, reproducible values through add_stream() without running KSP.
+"""
+
+import math
+import krpc_logger
+import numpy as np
+
+G0 = 9.80665
+
+class Body:
+    # Kerbin
+    name = 'Kerbin'
+    equatorial_radius = 600000.0
+    gravitational_parameter = 3.5316e12
+    rotational_period = 21549.425
+    atmosphere_depth = 70000.0
+    scale_height = 5600.0
+    sea_level_pressure = 101325.0
+    sea_level_density = 1.225
+    # Simulated vectors are all in the body's frame anyway
+    reference_frame = property(lambda self: SimReferenceFrame(None, 'body'))
+
+    def rotational_speed(self):
+        return(2*math.pi/self.rotational_period)
+
+    def pressure(self, altitude):
+        if altitude >= self.atmosphere_depth:
+            return(0.0)
+        return(self.sea_level_pressure*math.exp(-max(altitude, 0)/self.scale_height))
+
+    def density(self, altitude):
+        if altitude >= self.atmosphere_depth:
+            return(0.0)
+        return(self.sea_level_density*math.exp(-max(altitude, 0)/self.scale_height))
+
+    def temperature(self, altitude):
+        return(max(288.15 - 0.0065*max(altitude, 0), 216.65))
+
+def unit(v):
+    norm = np.linalg.norm(v)
+    return(v/norm if norm > 0 else v)
+
+class VesselModel:
+    """
+    Point-mass vessel flying an ascent profile: vertical climb, gravity turn,
+    coast to apoapsis and a circularization burn. The state only changes in
+    step(), which also draws all of the seeded noise, so the values read
+    between steps don't depend on which attributes are streamed or how often.
+    """
+    def __init__(self, seed=0, body=None):
+        self.body = Body() if body is None else body
+        self.rng = np.random.default_rng(seed)
+
+        self.dry_mass = 6000.0
+        self.mass = 20000.0
+        self.max_vacuum_thrust = 400000.0
+        self.vacuum_specific_impulse = 320.0
+        self.sea_level_specific_impulse = 280.0
+        self.drag_area = 2.0
+        self.turn_start_altitude = 500.0
+        self.turn_end_altitude = 45000.0
+        self.target_apoapsis_altitude = 80000.0
+
+        self.ut = 0.0
+        self.met = 0.0
+        self.position = np.array([self.body.equatorial_radius + 70.0, 0.0, 0.0])
+        self.velocity = np.cross([0.0, 0.0, self.body.rotational_speed()], self.position)
+        self.throttle = 1.0
+        self.phase = 'ascent'
+        self.target_pitch = 90.0
+        self.target_heading = 90.0
+        self.target_roll = 0.0
+        self.pitch = 90.0
+        self.heading = 90.0
+        self.roll = 0.0
+        self.thrust = 0.0
+        self.drag = np.zeros(3)
+        self.acceleration = np.zeros(3)
+        self.noise = np.zeros(8)
+        self._elements = None
+
+    # Derived state
+    def altitude(self):
+        return(np.linalg.norm(self.position) - self.body.equatorial_radius)
+
+    def surface_velocity(self):
+        return(self.velocity - np.cross([0.0, 0.0, self.body.rotational_speed()], self.position))
+
+    def direction(self):
+        x, y, z = self.position
+        r = math.sqrt(x*x + y*y + z*z)
+        rho = math.sqrt(x*x + y*y)
+        up = (x/r, y/r, z/r)
+        east = (-y/rho, x/rho, 0.0)
+        north = (-z*x/(r*rho), -z*y/(r*rho), rho/r)
+        pitch, heading = math.radians(self.pitch), math.radians(self.heading)
+        horizontal = math.cos(pitch)
+        return(np.array([
+            math.sin(pitch)*u + horizontal*(math.sin(heading)*e + math.cos(heading)*n)
+            for u, e, n in zip(up, east, north)
+        ]))
+
+    def specific_impulse(self):
+        fraction = self.body.pressure(self.altitude())/self.body.sea_level_pressure
+        return(self.vacuum_specific_impulse - (self.vacuum_specific_impulse - self.sea_level_specific_impulse)*fraction)
+
+    def max_thrust(self):
+        return(self.max_vacuum_thrust*self.specific_impulse()/self.vacuum_specific_impulse)
+
+    def available_thrust(self):
+        return(self.max_thrust() if self.mass > self.dry_mass else 0.0)
+
+    def elements(self):
+        # Keplerian elements are cached until the next step
+        if self._elements is None:
+            self._elements = OrbitalElements(self.position, self.velocity, self.body.gravitational_parameter)
+        return(self._elements)
+
+    # Guidance
+    def guide(self):
+        # Runs every integration step, so it works from the state vectors in
+        # scalars rather than building full orbital elements
+        x, y, z = self.position
+        vx, vy, vz = self.velocity
+        mu = self.body.gravitational_parameter
+        r = math.sqrt(x*x + y*y + z*z)
+        altitude = r - self.body.equatorial_radius
+        energy = (vx*vx + vy*vy + vz*vz)/2 - mu/r
+        h2 = (y*vz - z*vy)**2 + (z*vx - x*vz)**2 + (x*vy - y*vx)**2
+        e = math.sqrt(max(1 + 2*energy*h2/mu**2, 0.0))
+        a = -mu/(2*energy)
+        apoapsis_altitude = a*(1 + e) - self.body.equatorial_radius
+        periapsis_altitude = a*(1 - e) - self.body.equatorial_radius
+        # Near apoapsis the radial speed falls off at gravity less the
+        # centrifugal term
+        time_to_apoapsis = ((x*vx + y*vy + z*vz)/r)/max(mu/r**2 - h2/r**3, 1e-3)
+
+        if self.phase == 'ascent':
+            if altitude < self.turn_start_altitude:
+                self.target_pitch = 90.0
+            else:
+                fraction = min((altitude - self.turn_start_altitude)/(self.turn_end_altitude - self.turn_start_altitude), 1.0)
+                self.target_pitch = 90.0*(1 - math.sqrt(fraction))
+            if apoapsis_altitude >= self.target_apoapsis_altitude:
+                self.phase = 'coast'
+                self.throttle = 0.0
+        elif self.phase == 'coast':
+            self.target_pitch = 0.0
+            if time_to_apoapsis < 15.0 and altitude > self.body.atmosphere_depth:
+                self.phase = 'circularize'
+                self.throttle = 1.0
+        elif self.phase == 'circularize':
+            self.target_pitch = 0.0
+            if periapsis_altitude >= self.body.atmosphere_depth + 5000.0:
+                self.phase = 'orbit'
+                self.throttle = 0.0
+        if self.mass <= self.dry_mass:
+            self.throttle = 0.0
+
+    def step(self, duration, max_dt=0.05):
+        n = max(int(math.ceil(duration/max_dt)), 1)
+        dt = duration/n
+        for _ in range(n):
+            self._step(dt)
+        self.noise = self.rng.normal(size=len(self.noise))
+        self._elements = None
+
+    def _step(self, dt):
+        # Hot loop, written out in scalars since numpy is slow on 3-vectors
+        self.guide()
+
+        # Attitude follows the autopilot targets with a short lag
+        lag = min(dt/0.5, 1.0)
+        noise = self.rng.normal(size=3)
+        self.pitch += (self.target_pitch - self.pitch)*lag + 0.05*noise[0]
+        self.heading += (self.target_heading - self.heading)*lag + 0.05*noise[1]
+        self.roll += (self.target_roll - self.roll)*lag + 0.05*noise[2]
+
+        x, y, z = self.position
+        vx, vy, vz = self.velocity
+        r = math.sqrt(x*x + y*y + z*z)
+        altitude = r - self.body.equatorial_radius
+        omega = self.body.rotational_speed()
+
+        self.thrust = self.throttle*self.available_thrust()
+        mass_flow = self.throttle*self.max_vacuum_thrust/(self.vacuum_specific_impulse*G0) if self.thrust > 0 else 0.0
+        sx, sy, sz = vx + omega*y, vy - omega*x, vz
+        k = -0.5*self.body.density(altitude)*math.sqrt(sx*sx + sy*sy + sz*sz)*self.drag_area
+        dx, dy, dz = self.direction()
+        self.drag = np.array([k*sx, k*sy, k*sz])
+        ax = (self.thrust*dx + k*sx)/self.mass
+        ay = (self.thrust*dy + k*sy)/self.mass
+        az = (self.thrust*dz + k*sz)/self.mass
+        self.acceleration = np.array([ax, ay, az])
+        g = -self.body.gravitational_parameter/r**3
+
+        vx, vy, vz = vx + (ax + g*x)*dt, vy + (ay + g*y)*dt, vz + (az + g*z)*dt
+        x, y, z = x + vx*dt, y + vy*dt, z + vz*dt
+        self.mass = max(self.mass - mass_flow*dt, self.dry_mass)
+
+        # Sitting on the pad until thrust exceeds weight
+        r = math.sqrt(x*x + y*y + z*z)
+        if r - self.body.equatorial_radius < 70.0:
+            scale = (self.body.equatorial_radius + 70.0)/r
+            x, y, z = x*scale, y*scale, z*scale
+            vx, vy, vz = -omega*y, omega*x, 0.0
+        self.position = np.array([x, y, z])
+        self.velocity = np.array([vx, vy, vz])
+
+        self.ut += dt
+        self.met += dt
+
+class OrbitalElements:
+    def __init__(self, position, velocity, mu):
+        self.mu = mu
+        r = np.linalg.norm(position)
+        self.radius = r
+        self.speed = np.linalg.norm(velocity)
+        h = np.cross(position, velocity)
+        e_vec = np.cross(velocity, h)/mu - position/r
+        self.eccentricity = min(np.linalg.norm(e_vec), 0.999999)
+        energy = self.speed**2/2 - mu/r
+        self.semi_major_axis = -mu/(2*energy)
+        self.semi_minor_axis = self.semi_major_axis*math.sqrt(1 - self.eccentricity**2)
+        self.apoapsis = self.semi_major_axis*(1 + self.eccentricity)
+        self.periapsis = self.semi_major_axis*(1 - self.eccentricity)
+        self.period = 2*math.pi*math.sqrt(self.semi_major_axis**3/mu)
+        self.mean_motion = 2*math.pi/self.period
+
+        h_norm = np.linalg.norm(h)
+        self.inclination = math.acos(max(min(h[2]/h_norm, 1.0), -1.0))
+        node = np.cross([0.0, 0.0, 1.0], h)
+        if np.linalg.norm(node) < 1e-9:
+            # Equatorial: measure from the reference direction instead
+            self.longitude_of_ascending_node = 0.0
+            self.argument_of_periapsis = math.atan2(e_vec[1], e_vec[0]) % (2*math.pi)
+        else:
+            self.longitude_of_ascending_node = math.atan2(node[1], node[0]) % (2*math.pi)
+            cos_w = np.dot(node, e_vec)/(np.linalg.norm(node)*np.linalg.norm(e_vec))
+            w = math.acos(max(min(cos_w, 1.0), -1.0))
+            self.argument_of_periapsis = w if e_vec[2] >= 0 else 2*math.pi - w
+
+        cos_nu = np.dot(e_vec, position)/(np.linalg.norm(e_vec)*r) if np.linalg.norm(e_vec) > 0 else 1.0
+        nu = math.acos(max(min(cos_nu, 1.0), -1.0))
+        if np.dot(position, velocity) < 0:
+            nu = 2*math.pi - nu
+        self.true_anomaly = nu
+        e = self.eccentricity
+        self.eccentric_anomaly = (2*math.atan(math.sqrt((1 - e)/(1 + e))*math.tan(nu/2))) % (2*math.pi)
+        self.mean_anomaly = (self.eccentric_anomaly - e*math.sin(self.eccentric_anomaly)) % (2*math.pi)
+
+    def time_to_periapsis(self):
+        return(((2*math.pi - self.mean_anomaly) % (2*math.pi))/self.mean_motion)
+
+    def time_to_apoapsis(self):
+        return(((math.pi - self.mean_anomaly) % (2*math.pi))/self.mean_motion)
+
+##############################################
+# Simulated krpc objects, by krpc class name #
+##############################################
+
+class SimObject:
+    def __init__(self, model):
+        self.model = model
+
+class SimReferenceFrame(SimObject):
+    # Vectors are always given in the body's inertial frame
+    def __init__(self, model, name):
+        SimObject.__init__(self, model)
+        self.name = name
+
+class SimSpaceCenter(SimObject):
+    def __init__(self, model):
+        SimObject.__init__(self, model)
+        self.active_vessel = SimVessel(model)
+        self.vessels = [self.active_vessel]
+
+    def add_vessel(self, model, name):
+        vessel = SimVessel(model, name)
+        self.vessels.append(vessel)
+        return(vessel)
+
+    def remove_vessel(self, vessel):
+        self.vessels.remove(vessel)
+
+    @property
+    def ut(self):
+        return(self.model.ut)
+
+class SimVessel(SimObject):
+    def __init__(self, model, name='Simulated Vessel'):
+        SimObject.__init__(self, model)
+        self.name = name
+        self.orbit = SimOrbit(model)
+        self.auto_pilot = SimAutoPilot(model)
+        self.control = SimControl(model)
+        self.comms = SimCommunications(model)
+        self.resources = SimResources(model)
+        self.orbital_reference_frame = SimReferenceFrame(model, 'orbital')
+        self.surface_reference_frame = SimReferenceFrame(model, 'surface')
+
+    def flight(self, reference_frame=None):
+        return(SimFlight(self.model))
+
+    met = property(lambda self: self.model.met)
+    mass = property(lambda self: self.model.mass)
+    dry_mass = property(lambda self: self.model.dry_mass)
+    thrust = property(lambda self: self.model.thrust)
+    available_thrust = property(lambda self: self.model.available_thrust())
+    max_thrust = property(lambda self: self.model.max_thrust())
+    max_vacuum_thrust = property(lambda self: self.model.max_vacuum_thrust)
+    specific_impulse = property(lambda self: self.model.specific_impulse())
+    vacuum_specific_impulse = property(lambda self: self.model.vacuum_specific_impulse)
+    moment_of_inertia = property(lambda self: (self.model.mass*8.0, self.model.mass*1.5, self.model.mass*8.0))
+
+class SimOrbit(SimObject):
+    def __init__(self, model):
+        SimObject.__init__(self, model)
+        self.body = model.body
+        self.epoch = model.ut
+
+    def __getattr__(self, name):
+        # Remaining Keplerian elements come straight from the cached elements
+        return(getattr(self.model.elements(), name))
+
+    apoapsis_altitude = property(lambda self: self.model.elements().apoapsis - self.body.equatorial_radius)
+    periapsis_altitude = property(lambda self: self.model.elements().periapsis - self.body.equatorial_radius)
+    orbital_speed = property(lambda self: self.model.elements().speed)
+    time_to_apoapsis = property(lambda self: self.model.elements().time_to_apoapsis())
+    time_to_periapsis = property(lambda self: self.model.elements().time_to_periapsis())
+    time_to_soi_change = property(lambda self: float('nan'))
+
+class SimFlight(SimObject):
+    def _air(self):
+        model = self.model
+        altitude = model.altitude()
+        airspeed = np.linalg.norm(model.surface_velocity())
+        temperature = model.body.temperature(altitude)
+        speed_of_sound = 20.05*math.sqrt(temperature)
+        return(altitude, airspeed, temperature, speed_of_sound)
+
+    g_force = property(lambda self: abs(np.linalg.norm(self.model.acceleration)/G0 + 0.01*self.model.noise[0]))
+    mean_altitude = property(lambda self: self.model.altitude())
+    surface_altitude = property(lambda self: self.model.altitude())
+    elevation = property(lambda self: 0.0)
+    latitude = property(lambda self: math.degrees(math.asin(self.model.position[2]/np.linalg.norm(self.model.position))))
+    longitude = property(lambda self: (math.degrees(math.atan2(self.model.position[1], self.model.position[0]) - self.model.body.rotational_speed()*self.model.ut) + 180) % 360 - 180)
+    velocity = property(lambda self: tuple(self.model.velocity))
+    speed = property(lambda self: np.linalg.norm(self.model.velocity))
+    horizontal_speed = property(lambda self: np.linalg.norm(self.model.velocity - np.dot(self.model.velocity, unit(self.model.position))*unit(self.model.position)))
+    vertical_speed = property(lambda self: np.dot(self.model.velocity, unit(self.model.position)))
+    center_of_mass = property(lambda self: (0.0, 0.0, 0.0))
+    direction = property(lambda self: tuple(self.model.direction()))
+    pitch = property(lambda self: self.model.pitch)
+    heading = property(lambda self: self.model.heading)
+    roll = property(lambda self: self.model.roll)
+    prograde = property(lambda self: tuple(unit(self.model.velocity)))
+    retrograde = property(lambda self: tuple(-unit(self.model.velocity)))
+    normal = property(lambda self: tuple(unit(np.cross(self.model.position, self.model.velocity))))
+    anti_normal = property(lambda self: tuple(-unit(np.cross(self.model.position, self.model.velocity))))
+    radial = property(lambda self: tuple(unit(self.model.position)))
+    anti_radial = property(lambda self: tuple(-unit(self.model.position)))
+    atmosphere_density = property(lambda self: self.model.body.density(self.model.altitude()))
+    dynamic_pressure = property(lambda self: 0.5*self.atmosphere_density*self._air()[1]**2)
+    static_pressure = property(lambda self: self.model.body.pressure(self.model.altitude()))
+    static_pressure_at_msl = property(lambda self: self.model.body.sea_level_pressure)
+    aerodynamic_force = property(lambda self: tuple(self.model.drag))
+    lift = property(lambda self: (0.0, 0.0, 0.0))
+    drag = property(lambda self: tuple(self.model.drag))
+    speed_of_sound = property(lambda self: self._air()[3])
+    mach = property(lambda self: self._air()[1]/self._air()[3])
+    true_air_speed = property(lambda self: self._air()[1])
+    equivalent_air_speed = property(lambda self: self._air()[1]*math.sqrt(self.atmosphere_density/self.model.body.sea_level_density))
+    angle_of_attack = property(lambda self: 0.5*self.model.noise[1])
+    sideslip_angle = property(lambda self: 0.5*self.model.noise[2])
+    total_air_temperature = property(lambda self: self._air()[2]*(1 + 0.2*self.mach**2))
+    static_air_temperature = property(lambda self: self._air()[2])
+
+    @property
+    def rotation(self):
+        # Quaternion (x, y, z, w) for the pitch/heading/roll attitude
+        pitch, heading, roll = (math.radians(a)/2 for a in (self.model.pitch, self.model.heading, self.model.roll))
+        cp, sp = math.cos(pitch), math.sin(pitch)
+        ch, sh = math.cos(heading), math.sin(heading)
+        cr, sr = math.cos(roll), math.sin(roll)
+        return((cr*sp*ch + sr*cp*sh, cr*cp*sh - sr*sp*ch, sr*cp*ch - cr*sp*sh, cr*cp*ch + sr*sp*sh))
+
+    @property
+    def terminal_velocity(self):
+        density = self.atmosphere_density
+        if density == 0:
+            return(float('inf'))
+        return(math.sqrt(2*self.model.mass*G0/(density*self.model.drag_area)))
+
+class SimAutoPilot(SimObject):
+    pitch_error = property(lambda self: self.model.pitch - self.model.target_pitch)
+    heading_error = property(lambda self: self.model.heading - self.model.target_heading)
+    roll_error = property(lambda self: self.model.roll - self.model.target_roll)
+    error = property(lambda self: math.sqrt(self.pitch_error**2 + self.heading_error**2))
+    target_pitch = property(lambda self: self.model.target_pitch)
+    target_heading = property(lambda self: self.model.target_heading)
+    target_roll = property(lambda self: self.model.target_roll)
+    target_direction = property(lambda self: tuple(self.model.direction()))
+    roll_threshold = property(lambda self: 5.0)
+    stopping_time = property(lambda self: (0.5, 0.5, 0.5))
+    deceleration_time = property(lambda self: (5.0, 5.0, 5.0))
+    attenuation_angle = property(lambda self: (1.0, 1.0, 1.0))
+    time_to_peak = property(lambda self: (3.0, 3.0, 3.0))
+    overshoot = property(lambda self: (0.01, 0.01, 0.01))
+    pitch_pid_gains = property(lambda self: (1.0, 0.1, 0.05))
+    roll_pid_gains = property(lambda self: (1.0, 0.1, 0.05))
+    yaw_pid_gains = property(lambda self: (1.0, 0.1, 0.05))
+
+class SimControl(SimObject):
+    throttle = property(lambda self: self.model.throttle)
+    pitch = property(lambda self: 0.1*self.model.noise[3])
+    yaw = property(lambda self: 0.1*self.model.noise[4])
+    roll = property(lambda self: 0.1*self.model.noise[5])
+    forward = property(lambda self: 0.0)
+    up = property(lambda self: 0.0)
+    right = property(lambda self: 0.0)
+    wheel_throttle = property(lambda self: 0.0)
+    wheel_steering = property(lambda self: 0.0)
+    current_stage = property(lambda self: 0 if self.model.mass <= self.model.dry_mass else 1)
+    nodes = property(lambda self: [])
+
+class SimCommunications(SimObject):
+    signal_strength = property(lambda self: max(1.0 - self.model.altitude()/1e7, 0.0))
+    signal_delay = property(lambda self: np.linalg.norm(self.model.position)/299792458.0)
+    power = property(lambda self: 1.5e9)
+
+class SimResources(SimObject):
+    names = property(lambda self: list(SimResource.fractions))
+
+    def with_resource(self, name):
+        return([SimResource(self.model, name)])
+
+class SimResource(SimObject):
+    densities = {'LiquidFuel': 5.0, 'Oxidizer': 5.0}
+    fractions = {'LiquidFuel': 0.45, 'Oxidizer': 0.55}
+
+    def __init__(self, model, name):
+        SimObject.__init__(self, model)
+        self.name = name
+        self.density = self.densities.get(name, 5.0)
+        self.max = (20000.0 - model.dry_mass)*self.fractions.get(name, 1.0)/self.density
+
+    amount = property(lambda self: (self.model.mass - self.model.dry_mass)*self.fractions.get(self.name, 1.0)/self.density)
+
+class SimSynthetic(SimObject):
+    """Any number of smooth, noisy channels for load testing: channel_0, channel_1, ..."""
+    def __init__(self, model, n_attributes, seed=0):
+        SimObject.__init__(self, model)
+        rng = np.random.default_rng(seed)
+        self.frequencies = rng.uniform(0.01, 1.0, n_attributes)
+        self.phases = rng.uniform(0, 2*math.pi, n_attributes)
+
+    def __getattr__(self, name):
+        if not name.startswith('channel_'):
+            raise AttributeError(name)
+        i = int(name[len('channel_'):])
+        return(math.sin(self.frequencies[i]*self.model.met + self.phases[i]) + 0.01*self.model.noise[i % len(self.model.noise)])
+
+class SimStream:
+    """
+    A simulated stream. Like a krpc stream it can have callbacks, which the
+    connection calls after each step with the new value of every watched
+    stream that changed, at most at the stream's rate in simulated time.
+    """
+    def __init__(self, connection, fun, args):
+        self.connection = connection
+        self.fun = fun
+        self.args = args
+        self.callbacks = []
+        self.rate = 0
+        self.value = None
+        self.updated = -np.inf
+
+    def __call__(self):
+        return(self.fun(*self.args))
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+        self.connection.watched[self] = None
+
+    def remove_callback(self, callback):
+        self.callbacks.remove(callback)
+        if not self.callbacks:
+            self.connection.watched.pop(self, None)
+
+    def update(self, ut):
+        if self.rate and ut - self.updated < 1/self.rate:
+            return
+        value = self()
+        if value != self.value:
+            self.value = value
+            self.updated = ut
+            for callback in list(self.callbacks):
+                callback(value)
+
+class SimulatedConnection:
+    """
+    Quacks like a krpc connection. advance() is an AcquisitionScheduler tick
+    hook; each tick steps the model by a fixed amount of simulated time, so
+    runs with the same seed are identical as long as the ticks keep up. A
+    tick that stands in for missed ones catches up the steps they would have
+    taken, so overruns don't slow simulated time.
+    """
+    def __init__(self, seed=0, step=0.1):
+        self.seed = seed
+        self.step = step
+        # Steps taken, and the scheduler clock at the first one
+        self.steps = 0
+        self._start = None
+        self.model = VesselModel(seed)
+        self.models = [self.model]
+        self.space_center = SimSpaceCenter(self.model)
+        # Streams with callbacks, in the order they were watched
+        self.watched = {}
+
+    def add_stream(self, fun, *args):
+        return(SimStream(self, fun, args))
+
+    def advance(self, now=None):
+        # One step per tick, or as many as the scheduler clock has gone on by
+        steps = 1
+        if now is not None:
+            if self._start is None:
+                self._start = now
+            steps = max(int(round((now - self._start)/self.step)) + 1 - self.steps, 1)
+        self.steps += steps
+        for model in self.models:
+            model.step(steps*self.step)
+        for stream in list(self.watched):
+            stream.update(self.model.ut)
+
+    def launch(self, name=None):
+        """Add another vessel, flying its own seeded ascent from the current time."""
+        model = VesselModel(self.seed + len(self.models))
+        model.ut = self.model.ut
+        self.models.append(model)
+        return(self.space_center.add_vessel(model, name or "Simulated Vessel {}".format(len(self.models))))
+
+    def destroy(self, vessel):
+        self.space_center.remove_vessel(vessel)
+        self.models.remove(vessel.model)
+
+    def synthetic(self, n_attributes, seed=0):
+        return(SimSynthetic(self.model, n_attributes, self.seed + seed))
+
+class LoggableSynthetic(krpc_logger.Loggable):
+    def __init__(self, connection, loggable_object, name, n_attributes, **options):
+        self.attribute_config = {
+            'channel_{}'.format(i): self.attribute_template_ranf(1) for i in range(n_attributes)
+        }
+        krpc_logger.Loggable.__init__(self, connection, loggable_object, name, **options)
+
+def synthetic_loggers(connection, n_loggers, n_attributes, **options):
+    return([
+        LoggableSynthetic(connection, connection.synthetic(n_attributes, i), "synthetic{}".format(i), n_attributes, **options)
+        for i in range(n_loggers)
+    ])
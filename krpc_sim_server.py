@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+# A local stand-in for the kRPC server mod, backed by the krpc_sim vessel model.
+# It speaks enough of the kRPC protocol for krpc.connect(), property and method
+# calls on the SpaceCenter classes, and streams, so the live code paths can be
+# benchmarked without KSP.
+
+# Ian Dahlke, 2020
+
+import argparse
+import inspect
+import os
+import socket
+import threading
+import time
+
+import krpc_sim
+import krpc.services.spacecenter
+import krpc.schema.KRPC_pb2 as KRPC
+
+from krpc.decoder import Decoder
+from krpc.encoder import Encoder
+from krpc.types import Types, ClassType, ListType, TupleType
+
+# kRPC classes that krpc_sim has a stand-in for
+SIM_CLASSES = ['Vessel', 'Flight', 'Orbit', 'AutoPilot', 'Control', 'Comms', 'Resources', 'Resource', 'ReferenceFrame']
+
+class StubClient:
+    """Enough of a krpc client for the pregenerated stubs to describe their calls."""
+    _types = Types()
+
+    def _build_call(self, service, procedure, args, param_names, param_types, return_type):
+        return((service, procedure, list(param_types), return_type))
+
+def procedure_table():
+    """Map (service, procedure) to (attribute name, parameter types, return type, service level) using the krpc stubs."""
+    client = StubClient()
+    table = {}
+    stubs = [krpc.services.spacecenter.SpaceCenter] + [getattr(krpc.services.spacecenter, name) for name in SIM_CLASSES]
+    for cls in stubs:
+        stub = cls.__new__(cls)
+        stub._client = client
+        stub._object_id = 0
+        for name in dir(cls):
+            if not name.startswith('_build_call_'):
+                continue
+            builder = getattr(stub, name)
+            # Static methods are wrapped so the signature over-counts by one
+            n_params = len(inspect.signature(builder).parameters)
+            try:
+                service, procedure, param_types, return_type = builder(*([None]*n_params))
+            except TypeError:
+                service, procedure, param_types, return_type = builder(*([None]*(n_params - 1)))
+            service_level = cls is krpc.services.spacecenter.SpaceCenter
+            table[(service, procedure)] = (name[len('_build_call_'):], param_types, return_type, service_level)
+    return(table)
+
+class ObjectRef:
+    def __init__(self, object_id):
+        self._object_id = object_id
+
+class StreamEntry:
+    def __init__(self, stream_id, call):
+        self.id = stream_id
+        self.call = call
+        self.started = False
+        self.rate = 0.0
+        self.last_sent = 0.0
+        self.last_value = None
+
+class ClientSession:
+    def __init__(self, identifier, name):
+        self.identifier = identifier
+        self.name = name
+        self.streams = {}
+        self.stream_socket = None
+        self.lock = threading.Lock()
+
+class FakeKRPCServer:
+    def __init__(self, address='127.0.0.1', rpc_port=50000, stream_port=50001, seed=0,
+                 update_rate=50.0, latency=0.0, wall_clock_ut=False):
+        self.address = address
+        self.rpc_port = rpc_port
+        self.stream_port = stream_port
+        # Stream updates per second, which is also how often the model steps
+        self.update_rate = update_rate
+        # Seconds added before every RPC response and stream update
+        self.latency = latency
+        # Serve UT as the server's wall clock so clients can measure latency
+        self.wall_clock_ut = wall_clock_ut
+
+        self.simulation = krpc_sim.SimulatedConnection(seed=seed, step=1.0/update_rate)
+        self.model_lock = threading.Lock()
+        self.tick = threading.Condition()
+        self.procedures = procedure_table()
+        self.types = Types()
+
+        self.objects = {}
+        self.object_ids = {}
+        self.sessions = {}
+        self.stream_ids = {}
+        self._stop = threading.Event()
+        self._threads = []
+
+    # Object registry, 0 is the null object as in kRPC
+    def object_id(self, obj):
+        if obj is None:
+            return(0)
+        key = id(obj)
+        if key not in self.object_ids:
+            self.object_ids[key] = len(self.objects) + 1
+            self.objects[self.object_ids[key]] = obj
+        return(self.object_ids[key])
+
+    def to_wire(self, value, typ):
+        if isinstance(typ, ClassType):
+            return(ObjectRef(self.object_id(value)))
+        if isinstance(typ, ListType):
+            return([self.to_wire(item, typ.value_type) for item in value])
+        if isinstance(typ, TupleType):
+            return(tuple(self.to_wire(item, t) for item, t in zip(value, typ.value_types)))
+        return(value)
+
+    def decode_argument(self, data, typ):
+        if isinstance(typ, ClassType):
+            return(self.objects.get(Decoder.decode(None, data, self.types.uint64_type)))
+        return(Decoder.decode(None, data, typ))
+
+    # Procedure calls
+    def evaluate(self, call):
+        key = (call.service, call.procedure)
+        if key not in self.procedures:
+            raise RuntimeError("Procedure not available: {}.{}".format(*key))
+        name, param_types, return_type, service_level = self.procedures[key]
+        args = [None]*len(param_types)
+        for argument in call.arguments:
+            args[argument.position] = self.decode_argument(argument.value, param_types[argument.position])
+
+        if service_level:
+            target = self.simulation.space_center
+        else:
+            target, args = args[0], args[1:]
+        if self.wall_clock_ut and call.procedure == 'get_UT':
+            value = time.time()
+        else:
+            value = getattr(target, name)
+            if callable(value):
+                value = value(*args)
+        return(Encoder.encode(self.to_wire(value, return_type), return_type) if return_type is not None else b'')
+
+    def call_result(self, call):
+        result = KRPC.ProcedureResult()
+        try:
+            with self.model_lock:
+                result.value = self.evaluate(call)
+        except Exception as e:
+            result.error.description = "{}: {}".format(type(e).__name__, e)
+        return(result)
+
+    def krpc_call(self, session, call):
+        result = KRPC.ProcedureResult()
+        procedure = call.procedure
+        args = {argument.position: argument.value for argument in call.arguments}
+        if procedure == 'GetStatus':
+            status = KRPC.Status()
+            status.version = 'ktydid-sim'
+            result.value = Encoder.encode(status, self.types.status_type)
+        elif procedure == 'GetServices':
+            services = KRPC.Services()
+            for name in ['KRPC', 'SpaceCenter']:
+                services.services.add().name = name
+            result.value = Encoder.encode(services, self.types.services_type)
+        elif procedure == 'GetClientID':
+            result.value = Encoder.encode(session.identifier, self.types.bytes_type)
+        elif procedure == 'AddStream':
+            stream_call = Decoder.decode(None, args[0], self.types.procedure_call_type)
+            start = Decoder.decode(None, args[1], self.types.bool_type) if 1 in args else True
+            # Identical calls share a stream, like the real server
+            key = stream_call.SerializeToString()
+            if key not in self.stream_ids:
+                self.stream_ids[key] = len(self.stream_ids) + 1
+            entry = StreamEntry(self.stream_ids[key], stream_call)
+            with session.lock:
+                entry = session.streams.setdefault(entry.id, entry)
+                entry.started = entry.started or start
+            stream = KRPC.Stream()
+            stream.id = entry.id
+            result.value = Encoder.encode(stream, self.types.stream_type)
+        elif procedure in ('StartStream', 'RemoveStream', 'SetStreamRate'):
+            stream_id = Decoder.decode(None, args[0], self.types.uint64_type)
+            with session.lock:
+                entry = session.streams.get(stream_id)
+                if procedure == 'StartStream' and entry is not None:
+                    entry.started = True
+                elif procedure == 'RemoveStream':
+                    session.streams.pop(stream_id, None)
+                elif procedure == 'SetStreamRate' and entry is not None:
+                    entry.rate = Decoder.decode(None, args[1], self.types.float_type)
+        else:
+            result.error.description = "Procedure not available: KRPC.{}".format(procedure)
+        return(result)
+
+    # Connections
+    def listen(self, port):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.address, port))
+        server.listen()
+        server.settimeout(0.2)
+        return(server)
+
+    def start(self):
+        self._rpc_server = self.listen(self.rpc_port)
+        self._stream_server = self.listen(self.stream_port)
+        self.rpc_port = self._rpc_server.getsockname()[1]
+        self.stream_port = self._stream_server.getsockname()[1]
+        for target in [self.accept_rpc, self.accept_streams, self.run_clock]:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return(self)
+
+    def stop(self):
+        self._stop.set()
+        with self.tick:
+            self.tick.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._rpc_server.close()
+        self._stream_server.close()
+
+    def accept(self, server, handler):
+        while not self._stop.is_set():
+            try:
+                sock, _ = server.accept()
+            except socket.timeout:
+                continue
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(None)
+            threading.Thread(target=handler, args=(sock,), daemon=True).start()
+
+    def accept_rpc(self):
+        self.accept(self._rpc_server, self.serve_rpc)
+
+    def accept_streams(self):
+        self.accept(self._stream_server, self.serve_streams)
+
+    def serve_rpc(self, sock):
+        request = receive_message(sock, KRPC.ConnectionRequest)
+        session = ClientSession(os.urandom(16), request.client_name)
+        self.sessions[session.identifier] = session
+        response = KRPC.ConnectionResponse()
+        response.status = KRPC.ConnectionResponse.OK
+        response.client_identifier = session.identifier
+        send_message(sock, response)
+        try:
+            while not self._stop.is_set():
+                request = receive_message(sock, KRPC.Request)
+                response = KRPC.Response()
+                for call in request.calls:
+                    if call.service == 'KRPC':
+                        response.results.append(self.krpc_call(session, call))
+                    else:
+                        response.results.append(self.call_result(call))
+                if self.latency:
+                    time.sleep(self.latency)
+                send_message(sock, response)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            sock.close()
+            self.sessions.pop(session.identifier, None)
+
+    def serve_streams(self, sock):
+        request = receive_message(sock, KRPC.ConnectionRequest)
+        session = self.sessions.get(request.client_identifier)
+        response = KRPC.ConnectionResponse()
+        if session is None:
+            response.status = KRPC.ConnectionResponse.WRONG_TYPE
+            response.message = "Unknown client identifier"
+            send_message(sock, response)
+            sock.close()
+            return
+        response.status = KRPC.ConnectionResponse.OK
+        send_message(sock, response)
+        try:
+            while not self._stop.is_set() and session.identifier in self.sessions:
+                with self.tick:
+                    self.tick.wait()
+                update = self.stream_update(session)
+                if update.results:
+                    if self.latency:
+                        time.sleep(self.latency)
+                    send_message(sock, update)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            sock.close()
+
+    def stream_update(self, session):
+        # Like kRPC, only streams whose value changed are sent
+        update = KRPC.StreamUpdate()
+        now = time.monotonic()
+        with session.lock:
+            entries = [entry for entry in session.streams.values() if entry.started]
+        for entry in entries:
+            if entry.rate and now - entry.last_sent < 1.0/entry.rate:
+                continue
+            result = self.call_result(entry.call)
+            value = result.SerializeToString()
+            if value == entry.last_value:
+                continue
+            entry.last_value = value
+            entry.last_sent = now
+            stream_result = update.results.add()
+            stream_result.id = entry.id
+            stream_result.result.CopyFrom(result)
+        return(update)
+
+    def run_clock(self):
+        period = 1.0/self.update_rate
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            with self.model_lock:
+                self.simulation.advance()
+            with self.tick:
+                self.tick.notify_all()
+            next_tick += period
+            self._stop.wait(max(next_tick - time.monotonic(), 0))
+
+def send_message(sock, message):
+    sock.sendall(Encoder.encode_message_with_size(message))
+
+def receive_message(sock, typ):
+    data = b''
+    while True:
+        byte = sock.recv(1)
+        if not byte:
+            raise ConnectionError("Connection closed")
+        data += byte
+        try:
+            size = Decoder.decode_message_size(data)
+            break
+        except IndexError:
+            pass
+    payload = b''
+    while len(payload) < size:
+        chunk = sock.recv(size - len(payload))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        payload += chunk
+    return(Decoder.decode_message(payload, typ))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-a", "--address", help="ip address to listen on", type=str, default="127.0.0.1")
+    parser.add_argument("--rpc_port", help="RPC port", type=int, default=50000)
+    parser.add_argument("--stream_port", help="Stream port", type=int, default=50001)
+    parser.add_argument("--seed", help="Random seed for the simulated vessel", type=int, default=0)
+    parser.add_argument("--rate", help="Stream updates per second", type=float, default=50.0)
+    parser.add_argument("--latency", help="Seconds of latency added to every response and update", type=float, default=0.0)
+    parser.add_argument("--wall_clock_ut", help="Serve UT as the server's wall clock time", action="store_true")
+    args = parser.parse_args()
+
+    server = FakeKRPCServer(args.address, args.rpc_port, args.stream_port, args.seed, args.rate, args.latency, args.wall_clock_ut)
+    server.start()
+    print("Simulated krpc server on {}, rpc port {}, stream port {}".format(args.address, server.rpc_port, server.stream_port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -4,143 +4,148 @@
 
 # Ian Dahlke, 2020
 
+import acquisition
 import argparse
-import datetime
-import krpc
-import krpc_logger
-import numpy as np
-import pandas as pd
-
-from bokeh.layouts import row, column, gridplot, layout
-from bokeh.plotting import curdoc, figure
+import dashboard
+import instrumentation
+import telemetry_config
+import telemetry_hub
+import telemetry_store
+
+from bokeh.layouts import layout
+from bokeh.plotting import curdoc
 from bokeh.models import ColumnDataSource
-from bokeh.driving import count
 
 # Parse Arguments
 parser = argparse.ArgumentParser()
+acquisition.add_arguments(parser)
 parser.add_argument(
-    "-s",
-    "--simulate_krpc",
-    help="simulate connection to KSP/krpc",
-    type=bool,
-    default=False
-)
-parser.add_argument(
-    "-p",
-    "--period",
-    help="Data polling period in seconds",
+    "-r",
+    "--refresh_period",
+    help="Dashboard refresh period in seconds (defaults to the polling period)",
     type=float,
-    default=1.0
+    default=None
 )
 
 parser.add_argument(
-    "-a",
-    "--address",
-    help="ip address",
+    "--hub",
+    help="Read telemetry from a running telemetry_hub.py at host:port instead of acquiring it",
+    type=str,
+    default=None
+)
+parser.add_argument(
+    "--hub_authkey",
+    help="The hub's key (default $KTYDID_HUB_AUTHKEY)",
     type=str,
-    default="localhost"
+    default=None
 )
 args = parser.parse_args()
 
-simulate_krpc = args.simulate_krpc
-period = args.period
-address = args.address
-
-#########################
-# Set Up KRPC streaming #
-#########################
-# Define/load logging items
-# This may only support property access right now
-
-# Set up krpc connection and objects
-if simulate_krpc:
-    print("Simulating krpc connection")
-    conn = None
-    space_center = None
-    vessel = None
-    orbit = None
-    flight = None
-    autopilot = None
-    
+# A hub does the acquisition once for every session, otherwise this session
+# runs its own. Either way the panels come from the profile.
+if args.hub is not None:
+    acquirer = None
+    hub = telemetry_hub.shared_subscriber(args.hub, args.hub_authkey)
+    store, registry, period = hub.store, hub, hub.period
+    profile = telemetry_config.load(args.config)
+    time_columns = profile.time_columns
 else:
-    print("Setting up krpc connection")
-    conn = krpc.connect(name='ksp_telemetry_server', address=address)
-    space_center = conn.space_center
-    vessel = space_center.active_vessel
-    orbit = vessel.orbit
-    flight = vessel.flight(vessel.orbital_reference_frame)
-    autopilot = vessel.auto_pilot
-
-sc_logger = krpc_logger.LoggableSpaceCenter(conn, space_center, "sc")
-vessel_logger = krpc_logger.LoggableVessel(conn, vessel, "vessel")
-orbit_logger = krpc_logger.LoggableOrbit(conn, orbit, "orbit")
-flight_logger = krpc_logger.LoggableFlight(conn, flight, "flight")
-autopilot_logger = krpc_logger.LoggableAutopilot(conn, autopilot, "autopilot")
-loggable_list = [sc_logger, autopilot_logger, vessel_logger, orbit_logger, flight_logger]
-
-def update_streams():
-    dfs_new = [loggable.update() for loggable in loggable_list]
-    df_new = pd.concat(dfs_new, axis=1)
-    df_new.sc_ut = pd.to_timedelta(df_new.sc_ut, unit='s')
-    df_new.vessel_met = pd.to_timedelta(df_new.vessel_met, unit='s')
-    return(df_new)
+    acquirer = acquisition.Acquisition(args)
+    store, registry, period = acquirer.store, acquirer.registry, acquirer.period
+    profile = acquirer.profile
+    time_columns = acquirer.time_columns
+refresh_period = args.refresh_period or period or profile.period
 
 ######################
 # Set up Bokeh plots #
 ######################
-df = update_streams()
-source = ColumnDataSource(df)
-tools = "xpan,xwheel_zoom,xbox_zoom,reset"
-
-p = figure(tools=tools, x_axis_type='datetime', title="Vehicle Attitude")
-p.xaxis.axis_label = "Time"
-p.x_range.follow = "end"
-p.x_range.follow_interval = pd.Timedelta(30, unit='s')
-p.x_range.range_padding = 0
-p.toolbar.logo = None
-p.toolbar.autohide = True
-p.line(x='vessel_met', y='flight_pitch', line_color='blue', source=source, legend_label="Pitch")
-p.line(x='vessel_met', y='flight_heading', line_color='red', source = source, legend_label="Heading")
-p.line(x='vessel_met', y='flight_roll', line_color='green', source = source, legend_label="Roll")
-p.line(x='vessel_met', y='autopilot_target_pitch', source=source, line_color='lightblue', legend_label="Pitch Target")
-p.line(x='vessel_met', y='autopilot_target_heading', source=source, line_color='orangered', legend_label="Heading Target")
-p.line(x='vessel_met', y='autopilot_target_roll', source=source, line_color='lightgreen', legend_label="Roll Target")
-p.legend.click_policy = 'hide'
-
-p2 = figure(x_range=(-180, 180), y_range=(-90,90), title="Vehicle Ground Coordinates")
-p2.xaxis.axis_label = "Longitude"
-p2.yaxis.axis_label = "Latitude"
-p2.x_range.bounds = (-180, 180)
-p2.y_range.bounds = (-90, 90)
-p2.toolbar.logo = None
-p2.toolbar.autohide = True
-p2.line(x='flight_longitude', y='flight_latitude', source=source, line_width=10, line_cap='square')
-
-p3 = figure(tools=tools, x_axis_type='datetime', title="Autopilot Performance")
-p3.xaxis.axis_label = "Time"
-p3.x_range.follow = "end"
-p3.x_range.follow_interval = pd.Timedelta(30, unit='s')
-p3.x_range.range_padding = 0
-p3.toolbar.logo = None
-p3.toolbar.autohide = True
-p3.line(x='vessel_met', y='autopilot_pitch_error', source=source, line_color='lightblue', legend_label="Pitch Error")
-p3.line(x='vessel_met', y='autopilot_heading_error', source=source, line_color='orangered', legend_label="Heading Error")
-p3.line(x='vessel_met', y='autopilot_roll_error', source=source, line_color='lightgreen', legend_label="Roll Error")
-
-p3.legend.click_policy="hide"
+follow_interval = 30
+figures = {}
+sources = {}
+for name, spec in profile.panels.items():
+    # Lines of columns this store does not have, e.g. from a profile meant
+    # for another vessel, are left out
+    missing = [line['y'] for line in spec.get('lines', []) if line['y'] not in store.column_index]
+    if spec['x'] not in store.column_index:
+        missing.insert(0, spec['x'])
+    if missing:
+        print("Panel {} leaves out unknown columns: {}".format(name, ", ".join(missing)))
+    lines = [line for line in spec.get('lines', []) if line['y'] in store.column_index]
+    if spec['x'] not in store.column_index or not lines:
+        continue
+    sources[name] = ColumnDataSource()
+    figures[name] = dashboard.panel_figure(dict(spec, lines=lines), sources[name], follow_interval)
+
+# Only the columns the glyphs use are sent to the browser.
+# Datetime axes expect milliseconds.
+pushers = {}
+for name, source in sources.items():
+    pusher = dashboard.SourcePusher(
+        source,
+        store,
+        dashboard.referenced_columns(list(figures.values()), source),
+        scales={label: 1000 for label in time_columns}
+    )
+    registry.subscribe(pusher, pusher.columns)
+    pushers[name] = pusher
+if acquirer is not None:
+    store.sample()
+for pusher in pushers.values():
+    pusher.source.data = pusher.initial_data()
+
+# Time series keep their full history on the server and only hold the
+# live window in the browser, zooming out is served at screen resolution.
+live_rows = int(2*follow_interval/period) + 1 if period else store.capacity
+histories = []
+for name, fig in figures.items():
+    if profile.panels[name].get('kind', 'time') != 'time':
+        continue
+    history = telemetry_store.HistoryStore(pushers[name].columns, profile.panels[name]['x'])
+    history.pull(store)
+    dashboard.LevelOfDetail(fig, pushers[name], history, follow_interval, live_rows)
+    histories.append(history)
+
+# Alerts raised by the acquisition are marked on the time series
+annotations = None
+if acquirer is not None and acquirer.alerts is not None:
+    x_columns = {name: profile.panels[name]['x'] for name in figures if profile.panels[name].get('kind', 'time') == 'time'}
+    annotations = dashboard.AlertAnnotations(
+        acquirer.alerts,
+        [(figures[name], x, 1000 if x in time_columns else 1) for name, x in x_columns.items()]
+    )
+
+# Dashboard stages are timed alongside the acquisition when it runs here
+metrics = acquirer.metrics if acquirer is not None else instrumentation.Metrics()
+health = dashboard.HealthFigure(metrics, period)
+figures['health'] = health.figure
 
 def update():
-    df_new = update_streams()
-    source.stream(df_new, 10000)
+    with metrics.time("history_pull"):
+        for history in histories:
+            history.pull(store)
+    with metrics.time("push"):
+        for pusher in pushers.values():
+            pusher.push()
+    if annotations is not None:
+        annotations.update()
 
 curdoc().add_root(
     layout(
-        [
-            [p3],
-            [p, p2]
-        ],
+        [[figures[name] for name in names if name in figures] for names in profile.layout],
         sizing_mode="stretch_both",
     )
 )
-curdoc().add_periodic_callback(update, period*1000)
+if acquirer is not None:
+    acquirer.start()
+
+def stop(session_context):
+    if acquirer is not None:
+        acquirer.stop()
+    else:
+        for pusher in pushers.values():
+            registry.unsubscribe(pusher)
+
+curdoc().on_session_destroyed(stop)
+curdoc().add_periodic_callback(update, refresh_period*1000)
+curdoc().add_periodic_callback(health.update, 1000)
 curdoc().title = "KTyDID: Kerbal Telemetry Dashboard from ID"
\ No newline at end of file
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+# A headless telemetry recorder: the acquisition side of ktydid.py without
+# the dashboard. It takes the same acquisition arguments and records until
+# Control-C, --duration or the end of a replay, to -o and to the recordings
+# the profile declares. Neither Bokeh nor pandas are
+# imported, and krpc only for a live connection, so it starts quickly on
+# small machines.
+#     python record.py -o flight.ktr -p 0.1
+#     python record.py -s 1 -o flight.parquet --duration 60
+#     python record.py -c profiles/lean_ascent.json
+
+# Ian Dahlke, 2020
+
+import acquisition
+import argparse
+import time
+
+parser = argparse.ArgumentParser()
+acquisition.add_arguments(parser)
+parser.add_argument(
+    "--duration",
+    help="Stop recording after this many seconds",
+    type=float,
+    default=None
+)
+args = parser.parse_args()
+
+acquirer = acquisition.Acquisition(args)
+# Alert checks are sinks too, but record nothing
+if not acquirer.recorders:
+    acquirer.stop()
+    parser.error("nothing to record to, give -o or a profile with sinks")
+if acquirer.alerts is not None:
+    acquirer.alerts.hooks.append(lambda event: print("{} {} alert {}: {} = {:g} (limit {:g})".format(
+        time.strftime("%H:%M:%S", time.localtime(event['time'])), event['severity'], event['state'], event['column'], event['value'], event['limit']
+    )))
+acquirer.start()
+print("Starting log. Please stop it by pressing Control-C")
+deadline = None if args.duration is None else time.monotonic() + args.duration
+try:
+    while acquirer.scheduler.running() and (deadline is None or time.monotonic() < deadline):
+        time.sleep(0.1)
+except KeyboardInterrupt:
+    pass
+acquirer.stop()
+print("Recorded", acquirer.store.total_rows, "rows")
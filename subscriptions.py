@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Subscriptions
+Sits between the consumers of a TelemetryStore (dashboard sources, recorders) and the loggers that fill it. Consumers subscribe to the column labels they read, the registry reference-counts the attributes behind them, and lazy loggers only stream attributes somebody is reading: streams are created on the first subscribe and removed on the last unsubscribe.
+"""
+
+class SubscriptionRegistry:
+    def __init__(self, store):
+        self.store = store
+        # Column label -> [(loggable, attribute), ...] it is computed from, for
+        # every column filled by a logger. Derived channels need all of their sources.
+        self.owners = {}
+        for loggable, columns in store.loggable_slices:
+            for attribute, stream, offset, width in loggable.slot_map:
+                for label in loggable.column_labels[offset:offset + (width or 1)]:
+                    self.owners[label] = [(loggable, attribute)]
+            for name, sources in loggable.derived_sources.items():
+                for label in loggable.column_labels[loggable.derived_columns[name]]:
+                    self.owners[label] = [(loggable, attribute) for attribute in sources]
+        # Consumer -> [(loggable, attribute), ...] it holds
+        self.consumers = {}
+
+    def attributes(self, labels):
+        # Grouped by loggable, each attribute once however many of its columns are asked for
+        attributes = {}
+        for label in labels:
+            for loggable, attribute in self.owners.get(label, []):
+                if attribute not in attributes.setdefault(loggable, []):
+                    attributes[loggable].append(attribute)
+        return(attributes)
+
+    def subscribe(self, consumer, labels):
+        """Subscribe any hashable consumer to some column labels. Labels not filled by a logger are ignored."""
+        attributes = self.attributes(labels)
+        # Held while streams are swapped so no row is sampled half way through
+        with self.store.lock:
+            for loggable, names in attributes.items():
+                loggable.subscribe(names)
+                self.consumers.setdefault(consumer, []).extend((loggable, name) for name in names)
+
+    def subscribe_all(self, consumer):
+        self.subscribe(consumer, self.store.column_labels)
+
+    def unsubscribe(self, consumer):
+        """Release everything a consumer subscribed to."""
+        held = self.consumers.pop(consumer, [])
+        attributes = {}
+        for loggable, name in held:
+            attributes.setdefault(loggable, []).append(name)
+        with self.store.lock:
+            for loggable, names in attributes.items():
+                loggable.unsubscribe(names)
+
+    def close(self):
+        for consumer in list(self.consumers):
+            self.unsubscribe(consumer)
+
+    def streamed_columns(self):
+        """Column labels that currently have at least one subscriber."""
+        return([label for label, owners in self.owners.items() if all(loggable.subscribers[attribute] > 0 for loggable, attribute in owners)])
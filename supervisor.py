@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Supervisor
+Keeps a krpc session going through dropped connections and vessel switches. A krpc client whose server has gone keeps serving the last stream values, so the supervisor polls the connection with one cheap call (the active vessel) every check period. When that call fails, or a stream read does, it reconnects with exponential backoff and has the loggers set up again on the new connection. When the active vessel changes they are set up again on the new vessel. The acquisition marks the outage in the store and its recordings with a gap row rather than stopping.
+"""
+
+import sys
+import numpy as np
+
+def connection_errors():
+    # What a dropped connection raises: socket errors, and krpc's connection
+    # and stream errors. Other krpc errors, e.g. an RPCError from a bad call,
+    # are not a lost connection. Only a krpc connection has loaded krpc.error.
+    error = sys.modules.get('krpc.error')
+    return((OSError, EOFError) + (() if error is None else (error.ConnectionError, error.StreamError)))
+
+class VesselChanged(Exception):
+    """Raised by Supervisor.check() when the watched object, e.g. the active vessel, is a different one."""
+
+class RebuildFailed(Exception):
+    """Raised by rebuild() when it cannot set up on a working connection, e.g. the new vessel's loggers have other columns. Retried without reconnecting."""
+
+class Supervisor:
+    """
+    connect() makes a new connection. rebuild(connection) sets everything up
+    on a connection and returns what watch(connection) should now give, e.g.
+    the active vessel.
+    """
+    def __init__(self, connection, connect, rebuild, watch, check_period=2.0, backoff=1.0, max_backoff=30.0):
+        self.connection = connection
+        self.connect = connect
+        self.rebuild = rebuild
+        self.watch = watch
+        self.check_period = check_period
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.watched = watch(connection)
+        self.next_check = -np.inf
+        self.reconnects = 0
+
+    def check(self, now):
+        """A tick hook: every check period, raise if the connection is gone or the watched object changed."""
+        if now < self.next_check:
+            return
+        self.next_check = now + self.check_period
+        watched = self.watch(self.connection)
+        if watched != self.watched:
+            raise VesselChanged("now logging {}".format(getattr(watched, 'name', watched)))
+
+    def failure(self, error):
+        # Whether recover() deals with an error
+        return(isinstance(error, (VesselChanged,) + connection_errors()))
+
+    def recover(self, error, stop):
+        """
+        Rebuild after a failure, reconnecting first unless only the vessel
+        changed. Failed attempts are retried with backoff doubling up to
+        max_backoff, until they succeed (True) or the threading.Event `stop`
+        is set (False).
+        """
+        reconnect = not isinstance(error, VesselChanged)
+        delay = self.backoff
+        while not stop.is_set():
+            try:
+                if reconnect:
+                    self.close()
+                    self.connection = self.connect()
+                    self.reconnects += 1
+                self.watched = self.rebuild(self.connection)
+                self.next_check = -np.inf
+                return(True)
+            except RebuildFailed as e:
+                # The connection works, e.g. wait for another vessel switch
+                print("Cannot log: {}. Retrying in {:.0f} s".format(e, delay))
+                reconnect = False
+            except connection_errors() as e:
+                print("Reconnect failed: {}. Retrying in {:.0f} s".format(e, delay))
+                reconnect = True
+            if stop.wait(delay):
+                break
+            delay = min(2*delay, self.max_backoff)
+        return(False)
+
+    def close(self):
+        try:
+            self.connection.close()
+        except connection_errors():
+            pass
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Telemetry Config
+Telemetry profiles: one JSON file that declares what to log and show. A profile lists the loggers with their attributes, per-attribute sample periods and derived channels, plus extra recording sinks and the dashboard panels and their layout. It is compiled and checked once at startup. Loggers then pick up their part of it as they are built, so a lean per-mission profile only ever streams, records and plots what it declares.
+
+    {
+        "period": 0.5,
+        "time_columns": ["sc_ut", "vessel_met"],
+        "loggers": {
+            "sc": {"class": "LoggableSpaceCenter", "object": "space_center"},
+            "flight": {
+                "class": "LoggableFlight",
+                "object": "flight",
+                "reference_frame": "orbital",
+                "attributes": ["pitch", "speed", {"mean_altitude": {"sample_period": 1.0}}],
+                "derived": {"acceleration": true, "climb": {"source": "mean_altitude", "operator": "Difference"}}
+            }
+        },
+        "sinks": [{"path": "ascent.parquet", "rotate": 600, "columns": ["sc_ut", "flight_mean_altitude"]}],
+        "panels": {
+            "attitude": {"title": "Attitude", "x": "vessel_met", "lines": [{"y": "flight_pitch", "line_color": "blue", "label": "Pitch"}]}
+        },
+        "layout": [["attitude", "health"]],
+        "alerts": [{"name": "high_g", "column": "flight_g_force", "above": 4.0, "hysteresis": 0.5, "severity": "critical"}]
+    }
+
+A logger without "attributes" streams all of its class's attributes, and one without "derived" keeps the class's derived channels whose sources it streams. Attributes its class does not know are streamed as plain properties of the object. Panels are "time" (the default, following the live end) or "xy" with fixed ranges. Each line takes a "y" column, an optional "label" and any other Bokeh line options. "health" in the layout places the pipeline health figure. "alerts" are limit checks on every row, see alerts.py.
+"""
+
+import json
+import os
+
+import alerts
+import derived
+import krpc_logger
+
+DEFAULT_PROFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles', 'default.json')
+
+# How each kind of logged object is found from the active vessel
+OBJECTS = {
+    'space_center': lambda space_center, vessel, frame: space_center,
+    'vessel': lambda space_center, vessel, frame: vessel,
+    'orbit': lambda space_center, vessel, frame: vessel.orbit,
+    'flight': lambda space_center, vessel, frame: vessel.flight(frame),
+    'autopilot': lambda space_center, vessel, frame: vessel.auto_pilot,
+    'control': lambda space_center, vessel, frame: vessel.control,
+    'comms': lambda space_center, vessel, frame: vessel.comms,
+}
+REFERENCE_FRAMES = {
+    'orbital': lambda vessel: vessel.orbital_reference_frame,
+    'surface': lambda vessel: vessel.surface_reference_frame,
+    'body': lambda vessel: vessel.orbit.body.reference_frame,
+}
+PANEL_KINDS = ['time', 'xy']
+
+class ProfileError(ValueError):
+    pass
+
+class LoggerSpec:
+    def __init__(self, name, spec, where):
+        self.name = name
+        unknown = set(spec) - {'class', 'object', 'reference_frame', 'sample_period', 'attributes', 'derived'}
+        if unknown:
+            raise ProfileError("{}: unknown logger keys {}".format(where, sorted(unknown)))
+
+        self.cls = getattr(krpc_logger, spec.get('class', ''), None)
+        if not (isinstance(self.cls, type) and issubclass(self.cls, krpc_logger.Loggable)):
+            raise ProfileError("{}: 'class' must name a krpc_logger Loggable class, not {!r}".format(where, spec.get('class')))
+        self.object = spec.get('object')
+        if self.object not in OBJECTS:
+            raise ProfileError("{}: 'object' must be one of {}".format(where, sorted(OBJECTS)))
+        self.reference_frame = spec.get('reference_frame', 'orbital')
+        if self.reference_frame not in REFERENCE_FRAMES:
+            raise ProfileError("{}: 'reference_frame' must be one of {}".format(where, sorted(REFERENCE_FRAMES)))
+        self.sample_period = spec.get('sample_period')
+
+        # Attribute -> options, None for all of the class's attributes
+        self.attributes = None
+        if 'attributes' in spec:
+            self.attributes = {}
+            entries = spec['attributes']
+            for entry in (entries.items() if isinstance(entries, dict) else entries):
+                if isinstance(entry, str):
+                    name, options = entry, {}
+                elif isinstance(entry, dict) and len(entry) == 1:
+                    name, options = next(iter(entry.items()))
+                else:
+                    name, options = entry
+                if set(options) - {'sample_period'}:
+                    raise ProfileError("{}: attribute {} takes only a sample_period".format(where, name))
+                self.attributes[name] = options
+
+        # Derived channel -> True for the class's own, or a derived_template
+        self.derived = None
+        if 'derived' in spec:
+            self.derived = {}
+            for name, channel in spec['derived'].items():
+                if channel is True:
+                    self.derived[name] = True
+                    continue
+                operator = getattr(derived, channel.get('operator', ''), None)
+                if not (isinstance(operator, type) and issubclass(operator, derived.Operator)) or operator is derived.Formula:
+                    raise ProfileError("{}: derived channel {} needs an 'operator' from derived.py other than Formula".format(where, name))
+                self.derived[name] = {
+                    'source': channel['source'],
+                    'operator': operator,
+                    'params': tuple(channel.get('params', ())),
+                }
+
+    def resolve(self, space_center, vessel):
+        """The krpc (or simulated) object this logger reads."""
+        frame = REFERENCE_FRAMES[self.reference_frame](vessel) if self.object == 'flight' else None
+        return(OBJECTS[self.object](space_center, vessel, frame))
+
+    def configure(self, loggable):
+        # Narrow a logger's class configuration down to the profile's
+        if self.sample_period is not None:
+            loggable.sample_period = self.sample_period
+        if self.attributes is not None:
+            catalogue = loggable.attribute_config
+            selected = {}
+            for name, options in self.attributes.items():
+                config = dict(catalogue[name]) if name in catalogue else loggable.attribute_template_ranf(1)
+                if 'sample_period' in options:
+                    config['sample_period'] = options['sample_period']
+                selected[name] = config
+            loggable.attribute_config = selected
+
+        available = set(loggable.attribute_config)
+        if self.derived is None:
+            channels = loggable.derived_config
+        else:
+            channels = {}
+            for name, channel in self.derived.items():
+                if channel is True and name not in loggable.derived_config:
+                    raise ProfileError("logger {}: {} has no derived channel {}".format(self.name, type(loggable).__name__, name))
+                channels[name] = loggable.derived_config[name] if channel is True else channel
+        # Channels whose sources are not streamed are dropped, sources may be
+        # channels declared before them
+        kept = {}
+        for name, channel in channels.items():
+            sources = channel['source'] if type(channel['source']) in (list, tuple) else [channel['source']]
+            if all(source in available or source in kept for source in sources):
+                kept[name] = channel
+            elif self.derived is not None:
+                raise ProfileError("logger {}: derived channel {} needs {}".format(self.name, name, sources))
+        loggable.derived_config = kept
+
+class Profile:
+    def __init__(self, spec, path='<profile>'):
+        self.path = path
+        unknown = set(spec) - {'period', 'time_columns', 'loggers', 'sinks', 'panels', 'layout', 'alerts'}
+        if unknown:
+            raise ProfileError("{}: unknown keys {}".format(path, sorted(unknown)))
+        self.period = spec.get('period', 1.0)
+        self.time_columns = list(spec.get('time_columns', ['sc_ut', 'vessel_met']))
+        self.loggers = {
+            name: LoggerSpec(name, logger, "{}: logger {}".format(path, name)) for name, logger in spec.get('loggers', {}).items()
+        }
+
+        self.sinks = list(spec.get('sinks', []))
+        for sink in self.sinks:
+            if 'path' not in sink or set(sink) - {'path', 'rotate', 'columns'}:
+                raise ProfileError("{}: sinks take a 'path' and optionally 'rotate' and 'columns'".format(path))
+
+        # Limit checks on every row, see alerts.py. Their columns are matched
+        # once the store is built, only their form is checked here.
+        self.alerts = list(spec.get('alerts', []))
+        alerts.compile_rules(self.alerts, [], path)
+
+        self.panels = dict(spec.get('panels', {}))
+        for name, panel in self.panels.items():
+            if panel.get('kind', 'time') not in PANEL_KINDS:
+                raise ProfileError("{}: panel {} kind must be one of {}".format(path, name, PANEL_KINDS))
+            if 'x' not in panel or not all('y' in line for line in panel.get('lines', [])):
+                raise ProfileError("{}: panel {} needs an 'x' column and a 'y' column for each line".format(path, name))
+        # Rows of panel names, by default two panels a row and the health figure last
+        names = list(self.panels) + ['health']
+        self.layout = spec.get('layout', [names[i:i + 2] for i in range(0, len(names), 2)])
+        for row in self.layout:
+            for name in row:
+                if name != 'health' and name not in self.panels:
+                    raise ProfileError("{}: layout names unknown panel {}".format(path, name))
+
+    def configure(self, loggable):
+        """Apply the profile to a logger before it sets up its streams. Loggers it does not declare are left as they are."""
+        spec = self.loggers.get(loggable.name)
+        if spec is not None:
+            spec.configure(loggable)
+
+    def build_loggers(self, connection, objects, executor=None, **options):
+        """
+        One logger per declared logger, in profile order. `objects(spec)`
+        gives the object each one reads. With an executor they set up their
+        streams concurrently. Options such as lazy and shape_cache go to
+        every logger.
+        """
+        specs = list(self.loggers.values())
+        build = lambda spec: spec.cls(connection, objects(spec), spec.name, profile=self, **options)
+        return(list(executor.map(build, specs) if executor is not None else map(build, specs)))
+
+def load(path=None):
+    """Compile a profile file, by default profiles/default.json."""
+    path = DEFAULT_PROFILE if path is None else path
+    with open(path) as f:
+        try:
+            spec = json.load(f)
+        except ValueError as e:
+            raise ProfileError("{}: {}".format(path, e))
+    return(Profile(spec, path))
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Telemetry Hub
+Shares one acquisition between any number of dashboard sessions. The hub process owns the krpc connection and samples once; a TelemetryPublisher sends new rows to every subscriber over a local multiprocessing connection. Each dashboard process keeps a single TelemetrySubscriber with its own replica TelemetryStore, so all of its Bokeh sessions read from memory without any extra krpc traffic. Subscribers forward their column subscriptions, so the hub still only streams what some session displays.
+
+Run the hub with the same acquisition arguments as ktydid.py, e.g.
+    python telemetry_hub.py -s 1 -p 0.1
+and point the dashboards at it:
+    bokeh serve ktydid.py --num-procs 4 --args --hub 127.0.0.1:50010
+
+Clients authenticate with a shared key, which also guards the pickled messages. It comes from --hub_authkey or the KTYDID_HUB_AUTHKEY environment variable. Without one the hub makes up a random key and prints it, and it only listens on a loopback address.
+"""
+
+import argparse
+import ipaddress
+import itertools
+import os
+import queue
+import secrets
+import socket
+import threading
+import time
+
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+import telemetry_store
+
+DEFAULT_ADDRESS = '127.0.0.1:50010'
+AUTHKEY_VARIABLE = 'KTYDID_HUB_AUTHKEY'
+
+def parse_address(address):
+    host, port = address.rsplit(':', 1)
+    return((host, int(port)))
+
+def is_loopback(host):
+    try:
+        return(ipaddress.ip_address(socket.gethostbyname(host)).is_loopback)
+    except (OSError, ValueError):
+        return(False)
+
+def hub_authkey(authkey=None):
+    """The hub key as bytes: `authkey`, else the KTYDID_HUB_AUTHKEY environment variable, else None."""
+    authkey = os.environ.get(AUTHKEY_VARIABLE) if authkey is None else authkey
+    return(authkey.encode('utf-8') if isinstance(authkey, str) else authkey)
+
+def shutdown(connection):
+    # Unlike close(), shutting the socket down wakes up threads blocked on
+    # it and tells the other end
+    try:
+        with socket.fromfd(connection.fileno(), socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+class HubClient:
+    """
+    A subscriber's connection at the hub. Messages queue up for a sender
+    thread of its own, so a slow subscriber holds up neither the others nor
+    the publisher. put() returns False once the queue is full, and the
+    subscriber is then disconnected.
+    """
+    def __init__(self, connection, queue_length=100):
+        self.connection = connection
+        self.queue = queue.Queue(queue_length)
+        self.sender = threading.Thread(target=self.send_queued, name="ktydid_hub_sender", daemon=True)
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+            return(True)
+        except queue.Full:
+            return(False)
+
+    def send_queued(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                break
+            try:
+                self.connection.send(message)
+            except OSError:
+                break
+
+    def disconnect(self):
+        # The receive thread then sees the connection end and cleans up
+        shutdown(self.connection)
+
+    def close(self):
+        self.disconnect()
+        self.put(None)
+        self.sender.join()
+        self.connection.close()
+
+class TelemetryPublisher:
+    def __init__(self, store, registry, address=DEFAULT_ADDRESS, period=None, publish_period=0.05, authkey=None, queue_length=100):
+        self.store = store
+        self.registry = registry
+        self.address = parse_address(address)
+        # The acquisition period, passed on to the dashboards
+        self.period = period
+        self.publish_period = publish_period
+        # Anyone with the key can have the hub unpickle their messages, so a
+        # made-up key is only good enough for this machine
+        self.authkey = hub_authkey(authkey)
+        self.generated_authkey = self.authkey is None
+        if self.generated_authkey:
+            if not is_loopback(self.address[0]):
+                raise ValueError("The telemetry hub only listens on {} with a key, see --hub_authkey".format(self.address[0]))
+            self.authkey = secrets.token_urlsafe(24).encode('ascii')
+
+        # Published blocks a client may have waiting before it is dropped
+        self.queue_length = queue_length
+
+        self.cursor = store.total_rows
+        self.clients = {}
+        self._client_ids = itertools.count()
+        # Held while queueing, so a new client's backlog ends where the next
+        # published block starts. Nothing is sent while it is held.
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.listener = Listener(self.address, authkey=self.authkey)
+        for target in [self.accept, self.publish]:
+            thread = threading.Thread(target=target, name="ktydid_hub", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self.listener.close()
+        with self.lock:
+            clients = list(self.clients.values())
+        for client in clients:
+            client.disconnect()
+
+    def accept(self):
+        while not self._stop.is_set():
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                # A client that hung up during the handshake or had the wrong
+                # key, or the listener was closed by stop()
+                if not self._stop.is_set():
+                    print("Telemetry hub connection refused: {!r}".format(e))
+                continue
+            client_id = next(self._client_ids)
+            # Room for the schema and the backlog as well
+            client = HubClient(connection, self.queue_length + 2)
+            with self.lock:
+                with self.store.lock:
+                    n = max(len(self.store) - (self.store.total_rows - self.cursor), 0)
+                    rows = self.store.view()[:n].copy()
+                    times = self.store.times()[:n].copy()
+                client.put({
+                    'columns': self.store.column_labels,
+                    'vectors': {name: (columns.start, columns.stop) for name, columns in self.store.vector_index.items()},
+                    'capacity': self.store.capacity,
+                    'period': self.period,
+                    'total_rows': self.cursor - n,
+                })
+                client.put(('rows', times, rows))
+                self.clients[client_id] = client
+            client.sender.start()
+            threading.Thread(target=self.receive, args=(client_id, client), daemon=True).start()
+
+    def receive(self, client_id, client):
+        # Column subscriptions forwarded from the client's dashboard sessions
+        consumers = set()
+        try:
+            while True:
+                message = client.connection.recv()
+                if message[0] == 'subscribe':
+                    consumers.add((client_id, message[1]))
+                    self.registry.subscribe((client_id, message[1]), message[2])
+                elif message[0] == 'unsubscribe':
+                    consumers.discard((client_id, message[1]))
+                    self.registry.unsubscribe((client_id, message[1]))
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self.lock:
+                self.clients.pop(client_id, None)
+            client.close()
+            for consumer in consumers:
+                self.registry.unsubscribe(consumer)
+
+    def publish(self):
+        while not self._stop.wait(self.publish_period):
+            with self.lock:
+                with self.store.lock:
+                    n = self.store.rows_since(self.cursor)
+                    rows = self.store.view(n).copy()
+                    times = self.store.times(n).copy()
+                    self.cursor = self.store.total_rows
+                if n == 0:
+                    continue
+                behind = [client for client in self.clients.values() if not client.put(('rows', times, rows))]
+            for client in behind:
+                print("Disconnecting a telemetry hub subscriber that fell behind")
+                client.disconnect()
+
+class TelemetrySubscriber:
+    """
+    A replica of the hub's store, kept up to date by a background thread. It
+    also stands in for a SubscriptionRegistry, forwarding subscriptions to the hub.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None):
+        authkey = hub_authkey(authkey)
+        if authkey is None:
+            raise ValueError("No telemetry hub key, pass --hub_authkey or set {}".format(AUTHKEY_VARIABLE))
+        self.connection = Client(parse_address(address), authkey=authkey)
+        schema = self.connection.recv()
+        self.period = schema['period']
+        self.store = telemetry_store.TelemetryStore(
+            schema['columns'], schema['capacity'], {name: slice(*columns) for name, columns in schema['vectors'].items()}
+        )
+        # Rows before the backlog that follows
+        self.store.total_rows = schema['total_rows']
+        self.send_lock = threading.Lock()
+        # Consumer -> the token it is known by at the hub. Holding the
+        # consumer, like a SubscriptionRegistry does, keeps its id from being
+        # reused by another object while it is subscribed.
+        self.tokens = {}
+        self.next_token = itertools.count()
+        self.closed = False
+        self._thread = threading.Thread(target=self.receive, name="ktydid_hub_subscriber", daemon=True)
+        self._thread.start()
+
+    def receive(self):
+        try:
+            while True:
+                message = self.connection.recv()
+                if message[0] == 'rows':
+                    _, times, rows = message
+                    with self.store.lock:
+                        self.store.extend(rows, times)
+        except (EOFError, OSError):
+            if not self.closed:
+                print("Telemetry hub connection closed")
+
+    def send(self, message):
+        with self.send_lock:
+            self.connection.send(message)
+
+    def subscribe(self, consumer, labels):
+        with self.send_lock:
+            if consumer not in self.tokens:
+                self.tokens[consumer] = next(self.next_token)
+            self.connection.send(('subscribe', self.tokens[consumer], list(labels)))
+
+    def subscribe_all(self, consumer):
+        self.subscribe(consumer, self.store.column_labels)
+
+    def unsubscribe(self, consumer):
+        with self.send_lock:
+            token = self.tokens.pop(consumer, None)
+            if token is not None:
+                self.connection.send(('unsubscribe', token))
+
+    def close(self):
+        self.closed = True
+        shutdown(self.connection)
+        self._thread.join()
+        self.connection.close()
+
+_subscribers = {}
+_subscribers_lock = threading.Lock()
+
+def shared_subscriber(address=DEFAULT_ADDRESS, authkey=None):
+    """One subscriber per process and hub, shared by all Bokeh sessions in the process."""
+    with _subscribers_lock:
+        if address not in _subscribers:
+            _subscribers[address] = TelemetrySubscriber(address, authkey)
+        return(_subscribers[address])
+
+if __name__ == '__main__':
+    import acquisition
+
+    parser = argparse.ArgumentParser()
+    acquisition.add_arguments(parser)
+    parser.add_argument("--hub_address", help="host:port the hub listens on", type=str, default=DEFAULT_ADDRESS)
+    parser.add_argument(
+        "--hub_authkey",
+        help="Key the dashboards authenticate with (default ${}, or a random key on a loopback address)".format(AUTHKEY_VARIABLE),
+        type=str,
+        default=None
+    )
+    args = parser.parse_args()
+
+    # Checked before connecting to KSP
+    authkey = hub_authkey(args.hub_authkey)
+    if authkey is None and not is_loopback(parse_address(args.hub_address)[0]):
+        parser.error("--hub_authkey or ${} is needed to listen on {}".format(AUTHKEY_VARIABLE, args.hub_address))
+    acquirer = acquisition.Acquisition(args)
+    publisher = TelemetryPublisher(acquirer.store, acquirer.registry, args.hub_address, acquirer.period, authkey=authkey)
+    acquirer.store.sample()
+    acquirer.start()
+    publisher.start()
+    print("Telemetry hub listening on", args.hub_address)
+    if publisher.generated_authkey:
+        print("Start the dashboards with its key, e.g. {}={} bokeh serve ktydid.py --args --hub {}".format(
+            AUTHKEY_VARIABLE, publisher.authkey.decode('ascii'), args.hub_address
+        ))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        publisher.stop()
+        acquirer.stop()
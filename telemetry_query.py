@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Telemetry Query
+One query interface for telemetry wherever it lives: the live TelemetryStore, a dashboard HistoryStore, a binary flight recording, a Parquet/Arrow recording, or a plain dict of column arrays such as a loaded CSV. A query takes a time range on a key column (sc_ut by default, or vessel_met), a column list and an optional resample interval.
+
+Vector channels, e.g. 'flight_velocity', can be asked for by name and come back as (rows, k) arrays.
+
+Rows are found by binary search on the key, so a query costs O(log n + k) for k matching rows, however long the flight. A key can go backwards, e.g. vessel_met at a vessel switch or sc_ut at a quickload, so it is checked first and, if it does, indexed through a sorted permutation instead. A recording is checked once, a live store on every query. Columnar recordings leave the range to the reader, which pushes it down to the files.
+"""
+
+import weakref
+import numpy as np
+
+import flight_recorder
+import telemetry_store
+import vectors
+
+RESAMPLE_METHODS = ['mean', 'first', 'last', 'min', 'max']
+
+class TimeIndex:
+    """A sorted view of a key column: the column itself when it never goes backwards, otherwise a stable argsort of it."""
+    def __init__(self, key):
+        # NaNs fail the comparison, so a key with gaps is sorted too (NaNs last)
+        self.order = None if np.all(key[1:] >= key[:-1]) else np.argsort(key, kind='stable')
+        self.key = key if self.order is None else key[self.order]
+
+    def range(self, start=None, end=None):
+        return(time_range(self.key, start, end))
+
+    def rows(self, i0, i1):
+        """Row numbers in the source for positions [i0, i1) of the index."""
+        return(slice(i0, i1) if self.order is None else self.order[i0:i1])
+
+def time_range(key, start=None, end=None):
+    """Positions [i0, i1) of a non-decreasing key with start <= key < end, by binary search."""
+    i0 = 0 if start is None else int(np.searchsorted(key, start, 'left'))
+    i1 = len(key) if end is None else int(np.searchsorted(key, end, 'left'))
+    return(i0, max(i0, i1))
+
+# Recordings are immutable, so their index is built once
+_indexes = weakref.WeakKeyDictionary()
+
+def recording_index(recording, key):
+    indexes = _indexes.setdefault(recording, {})
+    if key not in indexes:
+        indexes[key] = TimeIndex(np.asarray(recording.column(key)))
+    return(indexes[key])
+
+def query(source, columns=None, start=None, end=None, key='sc_ut', resample=None, how='mean'):
+    """
+    Columns (default all) of the rows of `source` with start <= key < end,
+    as a dict of arrays that always includes the key. With a resample
+    interval the rows are aggregated into bins of that width on the key,
+    labelled by the start of the bin. Vector channels are (rows, k) arrays.
+    """
+    column_labels = source.column_labels if hasattr(source, 'column_labels') else list(source)
+    if columns is None:
+        columns = column_labels
+    # Vector channels are read as their scalar columns and stacked at the end
+    vector_labels = {}
+    labels = []
+    layout = None
+    for label in columns:
+        if label not in vector_labels and label not in getattr(source, 'column_index', column_labels):
+            layout = vector_index(source, column_labels) if layout is None else layout
+            if label in layout:
+                vector_labels[label] = column_labels[layout[label]]
+                labels += [element for element in vector_labels[label] if element not in labels]
+                continue
+        if label not in labels:
+            labels.append(label)
+    if key not in labels:
+        labels.insert(0, key)
+
+    if isinstance(source, telemetry_store.TelemetryStore):
+        # Copied out under the lock, a compaction may move the rows afterwards
+        with source.lock:
+            data = source.view()
+            index = TimeIndex(data[:, source.column_index[key]])
+            rows = index.rows(*index.range(start, end))
+            result = {label: data[rows, source.column_index[label]].copy() for label in labels}
+    elif isinstance(source, telemetry_store.HistoryStore):
+        data = source.rows.view()
+        index = TimeIndex(data[:, source.column_index[key]])
+        rows = index.rows(*index.range(start, end))
+        result = {label: data[rows, source.column_index[label]].copy() for label in labels}
+    elif isinstance(source, flight_recorder.Recording):
+        index = recording_index(source, key)
+        rows = index.rows(*index.range(start, end))
+        data = np.asarray(source.data)
+        result = {label: data[rows, source.column_index[label]] for label in labels}
+    elif hasattr(source, 'dataset'):
+        # A columnar_recorder.ColumnarRecording, filtered by the reader. Rotated
+        # files are read in order, so only a quickload needs sorting.
+        result = source.columns(labels, start, end, key)
+        index = TimeIndex(result[key])
+        if index.order is not None:
+            result = {label: values[index.order] for label, values in result.items()}
+    else:
+        # A dict of equal length column arrays
+        index = TimeIndex(np.asarray(source[key]))
+        rows = index.rows(*index.range(start, end))
+        result = {label: np.asarray(source[label])[rows] for label in labels}
+
+    if resample is not None:
+        result = resample_columns(result, key, resample, how)
+    if vector_labels:
+        for name, elements in vector_labels.items():
+            result[name] = np.stack([result[element] for element in elements], axis=1)
+        for element in {element for elements in vector_labels.values() for element in elements}:
+            if element not in columns and element != key:
+                del result[element]
+    return(result)
+
+def vector_index(source, column_labels):
+    # Stores know their vector channels, other sources go by the labels
+    if isinstance(source, telemetry_store.TelemetryStore):
+        return(source.vector_index)
+    return(vectors.vector_layout(column_labels))
+
+def resample_columns(columns, key, interval, how='mean'):
+    """Aggregate sorted rows into bins of `interval` on the key, ignoring NaNs. One output row per non-empty bin."""
+    assert(how in RESAMPLE_METHODS), "Unknown resample method: {}".format(how)
+    bins = np.floor(columns[key]/interval)
+    valid = ~np.isnan(bins)
+    if not valid.all():
+        bins = bins[valid]
+        columns = {label: values[valid] for label, values in columns.items()}
+    if len(bins) == 0:
+        return({label: values[:0] for label, values in columns.items()})
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    ends = np.r_[starts[1:], len(bins)]
+
+    result = {}
+    for label, values in columns.items():
+        if label == key:
+            result[label] = bins[starts]*interval
+        elif how == 'first':
+            result[label] = values[starts]
+        elif how == 'last':
+            result[label] = values[ends - 1]
+        elif how == 'min':
+            result[label] = np.fmin.reduceat(values, starts)
+        elif how == 'max':
+            result[label] = np.fmax.reduceat(values, starts)
+        else:
+            finite = ~np.isnan(values)
+            totals = np.add.reduceat(np.where(finite, values, 0.0), starts)
+            counts = np.add.reduceat(finite, starts)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[label] = totals/counts
+    return(result)
+
+def query_dataframe(source, columns=None, start=None, end=None, key='sc_ut', resample=None, how='mean'):
+    """query() as a pandas DataFrame indexed by the key."""
+    import pandas as pd
+    return(pd.DataFrame(query(source, columns, start, end, key, resample, how)).set_index(key))
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Telemetry Store
+A preallocated, fixed-capacity columnar store for telemetry rows. Loggers write straight into a row of the store instead of building intermediate DataFrames, and the most recent rows are always available as zero-copy NumPy views for plotting and export.
+"""
+
+import threading
+import time
+import numpy as np
+import vectors
+
+class TelemetryStore:
+    def __init__(self, column_labels, capacity=10000, vector_index=None):
+        self.column_labels = list(column_labels)
+        self.column_index = {label: i for i, label in enumerate(self.column_labels)}
+        assert(len(self.column_index) == len(self.column_labels)), "Duplicate column labels"
+        self.capacity = capacity
+        # Vector channel -> its adjacent columns, see vector(). Loggers know
+        # their widths, otherwise they are read off the labels.
+        self.vector_index = vectors.vector_layout(self.column_labels) if vector_index is None else dict(vector_index)
+
+        # Twice the capacity is allocated so the newest `capacity` rows are
+        # always contiguous. When the end is reached, the newest half is
+        # copied back to the front, which costs O(1) amortized per row.
+        self._buffer = np.full((2*capacity, len(self.column_labels)), np.nan)
+        self._time = np.full(2*capacity, np.nan)
+        self._head = 0
+        self.total_rows = 0
+        self.loggable_slices = []
+        # Derived channels are computed against this column, falling back to
+        # the row timestamp
+        self.time_column = None
+        # An instrumentation.Metrics to time each logger's sampling, or None
+        self.metrics = None
+        # Held by writers for a whole row and by readers while copying views,
+        # since a compaction moves the retained rows.
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_loggables(cls, loggable_list, capacity=10000):
+        column_labels = [label for loggable in loggable_list for label in loggable.column_labels]
+        vector_index = {}
+        start = 0
+        for loggable in loggable_list:
+            for name, columns in loggable.vector_columns().items():
+                vector_index[name] = slice(start + columns.start, start + columns.stop)
+            start += len(loggable.column_labels)
+        store = cls(column_labels, capacity, vector_index)
+        start = 0
+        for loggable in loggable_list:
+            stop = start + len(loggable.column_labels)
+            store.loggable_slices.append((loggable, slice(start, stop)))
+            start = stop
+        if 'sc_ut' in store.column_index:
+            store.time_column = 'sc_ut'
+        return(store)
+
+    def __len__(self):
+        return(min(self.total_rows, self.capacity))
+
+    def next_row(self, hold=False):
+        """Return a writable view of the next row. It is not visible until commit() is called.
+        With hold=True the row starts out as a copy of the last committed row."""
+        if self._head == len(self._buffer):
+            self._buffer[:self.capacity] = self._buffer[self.capacity:]
+            self._time[:self.capacity] = self._time[self.capacity:]
+            self._head = self.capacity
+        row = self._buffer[self._head]
+        if hold and self._head > 0:
+            row[:] = self._buffer[self._head - 1]
+        else:
+            row[:] = np.nan
+        return(row)
+
+    def commit(self, timestamp=None):
+        self._time[self._head] = time.time() if timestamp is None else timestamp
+        self._head += 1
+        self.total_rows += 1
+
+    def append(self, values, timestamp=None):
+        self.next_row()[:] = values
+        self.commit(timestamp)
+
+    def extend(self, rows, times):
+        """Append a block of rows, e.g. received from a TelemetryPublisher. Only the newest `capacity` are kept."""
+        self.total_rows += len(rows) - min(len(rows), self.capacity)
+        rows, times = rows[-self.capacity:], times[-self.capacity:]
+        while len(rows):
+            if self._head == len(self._buffer):
+                self._buffer[:self.capacity] = self._buffer[self.capacity:]
+                self._time[:self.capacity] = self._time[self.capacity:]
+                self._head = self.capacity
+            n = min(len(rows), len(self._buffer) - self._head)
+            self._buffer[self._head:self._head + n] = rows[:n]
+            self._time[self._head:self._head + n] = times[:n]
+            self._head += n
+            self.total_rows += n
+            rows, times = rows[n:], times[n:]
+
+    def sample(self, timestamp=None):
+        """Have every bound loggable write its current values into a new row."""
+        with self.lock:
+            row = self.next_row()
+            for loggable, columns in self.loggable_slices:
+                loggable.update_into(row[columns])
+            timestamp = time.time() if timestamp is None else timestamp
+            self.update_derived(row, timestamp)
+            self.commit(timestamp)
+
+    def gap(self, timestamp=None, keep=()):
+        """
+        Commit a gap marker where data is missing, e.g. while reconnecting: a
+        row of NaNs, except the `keep` columns (e.g. the time columns), which
+        repeat the last row's values so they stay in order.
+        """
+        with self.lock:
+            row = self.next_row(hold=True)
+            keep = [self.column_index[label] for label in keep]
+            values = row[keep]
+            row[:] = np.nan
+            row[keep] = values
+            self.commit(timestamp)
+
+    def sample_from(self, values, timestamp=None):
+        """Like sample(), with the raw values given, e.g. the latest values of an EventLog."""
+        with self.lock:
+            row = self.next_row()
+            row[:] = values
+            timestamp = time.time() if timestamp is None else timestamp
+            self.update_derived(row, timestamp)
+            self.commit(timestamp)
+
+    def sample_due(self, now, timestamp=None):
+        """Like sample(), but only attributes whose sample period has elapsed are read.
+        The remaining columns hold their last values."""
+        with self.lock:
+            row = self.next_row(hold=True)
+            timestamp = time.time() if timestamp is None else timestamp
+            if self.metrics is None:
+                for loggable, columns in self.loggable_slices:
+                    loggable.update_due(row[columns], now)
+                self.update_derived(row, timestamp)
+            else:
+                # Per logger stream read times, then the derived channels
+                for loggable, columns in self.loggable_slices:
+                    start = time.perf_counter()
+                    loggable.update_due(row[columns], now)
+                    self.metrics.histogram("sample/" + loggable.name).record(time.perf_counter() - start)
+                start = time.perf_counter()
+                self.update_derived(row, timestamp)
+                self.metrics.histogram("derived").record(time.perf_counter() - start)
+            self.commit(timestamp)
+
+    def update_derived(self, row, timestamp):
+        t = timestamp if self.time_column is None else row[self.column_index[self.time_column]]
+        for loggable, columns in self.loggable_slices:
+            if loggable.derived_channels:
+                loggable.update_derived(row[columns], t)
+
+    def _start(self, n=None):
+        n = len(self) if n is None else min(n, len(self))
+        return(self._head - n)
+
+    def view(self, n=None):
+        """Zero-copy (rows, columns) view of the newest n rows (default all retained rows)."""
+        return(self._buffer[self._start(n):self._head])
+
+    def times(self, n=None):
+        return(self._time[self._start(n):self._head])
+
+    def column(self, label, n=None):
+        return(self._buffer[self._start(n):self._head, self.column_index[label]])
+
+    def columns(self, labels=None, n=None):
+        labels = self.column_labels if labels is None else labels
+        start = self._start(n)
+        return({label: self._buffer[start:self._head, self.column_index[label]] for label in labels})
+
+    def vector(self, name, n=None):
+        """Zero-copy (rows, k) view of the newest n samples of a vector channel, e.g. 'flight_velocity'."""
+        return(self._buffer[self._start(n):self._head, self.vector_index[name]])
+
+    def vectors(self, names=None, n=None):
+        names = self.vector_index if names is None else names
+        start = self._start(n)
+        return({name: self._buffer[start:self._head, self.vector_index[name]] for name in names})
+
+    def rows_since(self, total_rows):
+        """Number of retained rows committed after the store had seen `total_rows` rows."""
+        return(min(self.total_rows - total_rows, len(self)))
+
+    def to_dataframe(self, labels=None, n=None):
+        import pandas as pd
+        return(pd.DataFrame(self.columns(labels, n), copy=False))
+
+class EventLog:
+    """
+    Value changes of a store's columns as they arrive, e.g. from krpc stream
+    callbacks: (arrival time, column, value) events in arrival order. Nothing
+    is resampled as events come in. grid() builds regular rows for any time
+    range on demand, each column holding its last value at every grid time.
+    The newest `capacity` events are kept, older ones are folded into the
+    state the retained events start from.
+    """
+    def __init__(self, column_labels, capacity=1000000):
+        self.column_labels = list(column_labels)
+        self.column_index = {label: i for i, label in enumerate(self.column_labels)}
+        self.capacity = capacity
+        self._time = np.empty(capacity)
+        self._column = np.empty(capacity, dtype=np.intp)
+        self._value = np.empty(capacity)
+        self.total_events = 0
+        # The current value of every column, and the values before the oldest
+        # retained event
+        self.latest = np.full(len(self.column_labels), np.nan)
+        self._base = np.full(len(self.column_labels), np.nan)
+        self._last_time = -np.inf
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return(min(self.total_events, self.capacity))
+
+    def record(self, columns, values, timestamp=None):
+        """Record new values for some columns (an index, slice or index array) that arrived together."""
+        columns = np.arange(len(self.column_labels))[columns] if isinstance(columns, slice) else np.atleast_1d(columns)
+        values = np.broadcast_to(np.asarray(values, dtype=float), columns.shape)
+        with self.lock:
+            # Callbacks race for the lock, the arrival times are kept in order
+            timestamp = max(time.time() if timestamp is None else timestamp, self._last_time)
+            self._last_time = timestamp
+            self.latest[columns] = values
+            positions = (self.total_events + np.arange(len(columns))) % self.capacity
+            overwritten = self.total_events + len(columns) - self.capacity
+            if overwritten > 0:
+                self.fold(positions[:overwritten])
+            self._time[positions] = timestamp
+            self._column[positions] = columns
+            self._value[positions] = values
+            self.total_events += len(columns)
+
+    def fold(self, positions):
+        # The last of several events for one column wins
+        columns, last = np.unique(self._column[positions][::-1], return_index=True)
+        self._base[columns] = self._value[positions][::-1][last]
+
+    def watcher(self, offset):
+        """An on_change callback for a logger whose columns start at `offset`, see Loggable.watch()."""
+        def changed(columns, value):
+            if isinstance(columns, slice):
+                columns = slice(columns.start + offset, columns.stop + offset)
+            else:
+                columns = columns + offset
+            self.record(columns, value)
+        return(changed)
+
+    def latest_values(self):
+        with self.lock:
+            return(self.latest.copy())
+
+    def events(self):
+        """Copies of the retained events in arrival order: times, columns, values, and the values before them."""
+        with self.lock:
+            n = len(self)
+            order = (self.total_events - n + np.arange(n)) % self.capacity
+            return(self._time[order], self._column[order], self._value[order], self._base.copy())
+
+    def changes(self, label):
+        """Arrival times and values of every retained change of one column."""
+        times, columns, values, base = self.events()
+        mask = columns == self.column_index[label]
+        return(times[mask], values[mask])
+
+    def grid(self, interval, start=None, end=None, labels=None):
+        """
+        Regular rows every `interval` seconds from start to end (default the
+        first and last events), as a dict of columns with the grid times under
+        'time'. Each value is the column's last one at or before the grid time.
+        """
+        times, columns, values, base = self.events()
+        labels = self.column_labels if labels is None else labels
+        if start is None:
+            start = times[0] if len(times) else time.time()
+        if end is None:
+            end = times[-1] if len(times) else start
+        grid = start + interval*np.arange(int(np.floor((end - start)/interval)) + 1)
+
+        # Events grouped by column, each group still in arrival order
+        order = np.argsort(columns, kind='stable')
+        sorted_columns = columns[order]
+        out = {'time': grid}
+        for label in labels:
+            column = self.column_index[label]
+            group = order[np.searchsorted(sorted_columns, column, 'left'):np.searchsorted(sorted_columns, column, 'right')]
+            last = np.searchsorted(times[group], grid, 'right') - 1
+            out[label] = np.where(last >= 0, values[group][np.maximum(last, 0)] if len(group) else np.nan, base[column])
+        return(out)
+
+class GrowableArray:
+    def __init__(self, width, capacity=1024):
+        self._data = np.empty((capacity, width))
+        self.size = 0
+
+    def __len__(self):
+        return(self.size)
+
+    def extend(self, rows):
+        n = len(rows)
+        if self.size + n > len(self._data):
+            data = np.empty((max(2*len(self._data), self.size + n), self._data.shape[1]))
+            data[:self.size] = self._data[:self.size]
+            self._data = data
+        self._data[self.size:self.size + n] = rows
+        self.size += n
+
+    def view(self):
+        return(self._data[:self.size])
+
+class HistoryStore:
+    """
+    Unbounded, server-side history of a few columns with min/max decimation
+    pyramids keyed on a column such as vessel_met. Level k holds the minimum
+    and maximum of every fan**(k+1) rows, so any time range can be served at
+    roughly the resolution a figure can actually display. The key may go
+    backwards, e.g. vessel_met after a vessel switch. Each run where it does
+    not is a segment, queried on its own.
+    """
+    def __init__(self, column_labels, key, fan=8):
+        self.column_labels = list(column_labels)
+        self.column_index = {label: i for i, label in enumerate(self.column_labels)}
+        self.key = key
+        self.key_index = self.column_index[key]
+        self.fan = fan
+        self.rows = GrowableArray(len(self.column_labels))
+        self.levels = []
+        self.pulled_rows = 0
+        # First row of each segment, and the last key seen
+        self.segment_starts = [0]
+        self.last_key = -np.inf
+
+    def __len__(self):
+        return(len(self.rows))
+
+    def pull(self, store):
+        """Append rows committed to a TelemetryStore since the last pull."""
+        with store.lock:
+            n = store.rows_since(self.pulled_rows)
+            self.pulled_rows = store.total_rows
+            if n == 0:
+                return(0)
+            rows = store.view(n)[:, [store.column_index[label] for label in self.column_labels]]
+        self.extend(rows)
+        return(n)
+
+    def extend(self, rows):
+        # NaN keys, e.g. before the key is first sampled, start no segment
+        start = len(self.rows)
+        keys = np.asarray(rows)[:, self.key_index]
+        valid = np.flatnonzero(~np.isnan(keys))
+        if len(valid):
+            previous = np.concatenate([[self.last_key], keys[valid[:-1]]])
+            self.segment_starts.extend((start + valid[keys[valid] < previous]).tolist())
+            self.last_key = keys[valid[-1]]
+        self.rows.extend(rows)
+        lower_mins = lower_maxs = self.rows.view()
+        k = 0
+        while True:
+            complete = len(lower_mins) // self.fan
+            if k == len(self.levels):
+                if complete == 0:
+                    break
+                self.levels.append((GrowableArray(len(self.column_labels)), GrowableArray(len(self.column_labels))))
+            mins, maxs = self.levels[k]
+            done = len(mins)
+            if complete == done:
+                break
+            shape = (complete - done, self.fan, len(self.column_labels))
+            # fmin/fmax skip NaNs, which mark unavailable values
+            mins.extend(np.fmin.reduce(lower_mins[done*self.fan:complete*self.fan].reshape(shape), axis=1))
+            maxs.extend(np.fmax.reduce(lower_maxs[done*self.fan:complete*self.fan].reshape(shape), axis=1))
+            lower_mins, lower_maxs = mins.view(), maxs.view()
+            k += 1
+
+    def query(self, x0, x1, n_points):
+        """
+        Rows with key in [x0, x1], decimated to about 2*n_points rows: each bin
+        contributes its minimum row followed by its maximum row. Segments are
+        decimated separately and a NaN row separates them, so plotted lines
+        break between them.
+        """
+        rows = self.rows.view()
+        key = rows[:, self.key_index]
+        bounds = self.segment_starts + [len(rows)]
+        ranges = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            first = np.searchsorted(key[start:stop], x0, 'left')
+            last = np.searchsorted(key[start:stop], x1, 'right')
+            # Segments entirely outside the range are left out, the others
+            # keep a row either side of it
+            if last == 0 or first == stop - start:
+                continue
+            ranges.append((start + max(first - 1, 0), start + min(last + 1, stop - start)))
+        if not ranges:
+            return(np.empty((0, len(self.column_labels))))
+        total = sum(i1 - i0 for i0, i1 in ranges)
+        separator = np.full((1, len(self.column_labels)), np.nan)
+        blocks = []
+        for i0, i1 in ranges:
+            if blocks:
+                blocks.append(separator)
+            blocks.append(self.decimate(i0, i1, max(n_points*(i1 - i0)//total, 1)))
+        return(np.concatenate(blocks))
+
+    def decimate(self, i0, i1, n_points):
+        # Rows i0 to i1 in about n_points min/max bins
+        rows = self.rows.view()
+        # Pick the coarsest level that still gives at least n_points bins
+        level = -1
+        while level + 1 < len(self.levels) and (i1 - i0) // self.fan**(level + 2) >= n_points:
+            level += 1
+        if level < 0:
+            return(rows[i0:i1].copy())
+
+        size = self.fan**(level + 1)
+        b0 = -(-i0 // size)
+        b1 = max(i1 // size, b0)
+        mins, maxs = self.levels[level]
+        # Partial bins at either end are reduced straight from the raw rows
+        head, tail = rows[i0:min(b0*size, i1)], rows[max(b1*size, i0):i1]
+        bin_mins = [mins.view()[b0:b1]]
+        bin_maxs = [maxs.view()[b0:b1]]
+        if len(head):
+            bin_mins.insert(0, np.fmin.reduce(head, axis=0, keepdims=True))
+            bin_maxs.insert(0, np.fmax.reduce(head, axis=0, keepdims=True))
+        if len(tail):
+            bin_mins.append(np.fmin.reduce(tail, axis=0, keepdims=True))
+            bin_maxs.append(np.fmax.reduce(tail, axis=0, keepdims=True))
+        bin_mins = np.concatenate(bin_mins)
+        bin_maxs = np.concatenate(bin_maxs)
+        # The level gives between n_points and fan*n_points bins; merge
+        # neighbours to get close to n_points
+        group = len(bin_mins) // n_points
+        if group > 1:
+            starts = np.arange(0, len(bin_mins), group)
+            bin_mins = np.fmin.reduceat(bin_mins, starts, axis=0)
+            bin_maxs = np.fmax.reduceat(bin_maxs, starts, axis=0)
+
+        out = np.empty((2*len(bin_mins), len(self.column_labels)))
+        out[0::2] = bin_mins
+        out[1::2] = bin_maxs
+        return(out)
+
+    def tail(self, n):
+        return(self.rows.view()[-n:].copy())
@@ -0,0 +1,6 @@
+# The modules live at the top of the repository, like the scripts import them
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,42 @@
+# Ian Dahlke, 2020
+
+import time
+import acquisition
+import krpc_sim
+import telemetry_store
+
+def run_ticks(overrun, period, durations, run_for):
+    # Tick start times relative to the first tick, each tick taking the next of `durations`
+    store = telemetry_store.TelemetryStore(['x'], capacity=100)
+    scheduler = acquisition.AcquisitionScheduler(store, period, overrun=overrun)
+    starts = []
+    def hook(now):
+        starts.append(now)
+        time.sleep(durations[len(starts) - 1] if len(starts) <= len(durations) else 0.0)
+    scheduler.tick_hooks.append(hook)
+    scheduler.start()
+    time.sleep(run_for)
+    scheduler.stop()
+    return([t - starts[0] for t in starts])
+
+def test_skip_stays_on_grid():
+    period = 0.2
+    starts = run_ticks('skip', period, [0.35], 1.0)
+    # The first tick runs past the deadline at 0.2, the next one waits for 0.4
+    assert(starts[1] > 0.4 - 0.02)
+    for t in starts:
+        assert(abs(t/period - round(t/period)) < 0.1), starts
+
+def test_coalesce_runs_straight_away():
+    starts = run_ticks('coalesce', 0.2, [0.35], 0.8)
+    assert(0.35 <= starts[1] < 0.4)
+
+def test_simulation_keeps_pace_with_overruns():
+    # A tick that takes three periods under coalesce still moves the
+    # simulation on by the periods it stood in for
+    conn = krpc_sim.SimulatedConnection(seed=0, step=0.1)
+    scheduler_time = [0.0, 0.1, 0.4, 0.5]
+    for now in scheduler_time:
+        conn.advance(now)
+    assert(conn.steps == 6)
+    assert(abs(conn.model.ut - 0.6) < 1e-9)
@@ -0,0 +1,79 @@
+# Ian Dahlke, 2020
+
+import argparse
+import numpy as np
+import pytest
+import acquisition
+import alerts
+
+LABELS = ['sc_ut', 'flight_g_force', 'lf0_amount', 'lf1_amount']
+
+def run(engine, rows):
+    # (event name, column, state) of each event, in the order they happened
+    for i, row in enumerate(rows):
+        engine.write(np.array(row, dtype=float), 1000.0 + i)
+    return([(event['name'], event['column'], event['state']) for event in engine.events])
+
+def test_hysteresis_raises_once():
+    engine = alerts.AlertEngine([{'name': 'high_g', 'column': 'flight_g_force', 'above': 4.0, 'hysteresis': 0.5}], LABELS)
+    g = [3.0, 4.2, 3.9, 4.1, 3.8, 3.6, 3.4, 4.5]
+    events = run(engine, [[i, x, 0.0, 0.0] for i, x in enumerate(g)])
+    # Hovering between 3.5 and 4.0 neither clears nor raises it again
+    assert(events == [
+        ('high_g', 'flight_g_force', 'raised'),
+        ('high_g', 'flight_g_force', 'cleared'),
+        ('high_g', 'flight_g_force', 'raised'),
+    ])
+    assert([event['sc_ut'] for event in engine.events] == [1.0, 6.0, 7.0])
+    assert([check['name'] for check in engine.active_alerts()] == ['high_g'])
+
+def test_below_checks_expand_patterns():
+    engine = alerts.AlertEngine([{'name': 'fuel_low', 'column': '*_amount', 'below': 10.0, 'hysteresis': 2.0}], LABELS)
+    assert(engine.columns == ['lf0_amount', 'lf1_amount'])
+    events = run(engine, [[0, 1, 50, 50], [1, 1, 9, 50], [2, 1, 11, 5], [3, 1, 12.5, np.nan]])
+    assert(events == [
+        ('fuel_low', 'lf0_amount', 'raised'),
+        ('fuel_low', 'lf1_amount', 'raised'),
+        ('fuel_low', 'lf0_amount', 'cleared'),
+    ])
+
+def test_rate_uses_time_column():
+    engine = alerts.AlertEngine([{'name': 'g_rate', 'column': 'flight_g_force', 'rate_above': 1.0}], LABELS)
+    # 1.5 g over 2 s is under the limit, 1.5 g over 0.5 s is not
+    events = run(engine, [[0.0, 1.0, 0, 0], [2.0, 2.5, 0, 0], [2.5, 4.0, 0, 0], [3.5, 4.0, 0, 0]])
+    assert(events == [('g_rate', 'flight_g_force', 'raised'), ('g_rate', 'flight_g_force', 'cleared')])
+    assert(engine.events[0]['value'] == pytest.approx(3.0))
+
+def test_event_log(tmp_path):
+    path = alerts.log_path(str(tmp_path/'flight.ktr'))
+    engine = alerts.AlertEngine([{'name': 'high_g', 'column': 'flight_g_force', 'above': 4.0}], LABELS, log_path=path, vessel='Probe')
+    run(engine, [[0, 5.0, 0, 0], [1, 3.0, 0, 0]])
+    engine.close()
+    assert([(event['state'], event['vessel']) for event in alerts.read_log(path)] == [('raised', 'Probe'), ('cleared', 'Probe')])
+
+@pytest.mark.parametrize('rule', [
+    {'column': 'flight_g_force', 'above': 4.0},
+    {'name': 'x', 'column': 'flight_g_force'},
+    {'name': 'x', 'column': 'flight_g_force', 'above': 4.0, 'below': 1.0},
+    {'name': 'x', 'column': 'flight_g_force', 'above': 4.0, 'severity': 'dire'},
+])
+def test_bad_rules_are_rejected(rule):
+    with pytest.raises(alerts.AlertError):
+        alerts.compile_rules([rule], LABELS)
+
+def test_alert_engine_is_not_a_recorder(tmp_path):
+    parser = argparse.ArgumentParser()
+    acquisition.add_arguments(parser)
+    # The default profile checks some limits
+    acquirer = acquisition.Acquisition(parser.parse_args(['-s', '1']))
+    try:
+        assert(acquirer.alerts in acquirer.scheduler.sinks)
+        assert(acquirer.recorders == [])
+    finally:
+        acquirer.stop()
+    path = str(tmp_path/'flight.ktr')
+    acquirer = acquisition.Acquisition(parser.parse_args(['-s', '1', '-o', path]))
+    try:
+        assert([recorder.path for recorder in acquirer.recorders] == [path])
+    finally:
+        acquirer.stop()
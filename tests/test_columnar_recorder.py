@@ -0,0 +1,57 @@
+# Ian Dahlke, 2020
+
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip('pyarrow')
+import pyarrow.parquet as pq
+import columnar_recorder
+
+def recorded_rows(n):
+    rows = np.column_stack([np.arange(n, dtype=float), np.sin(np.arange(n))])
+    rows[3, 1] = np.nan
+    return(rows)
+
+@pytest.mark.parametrize('extension', ['.parquet', '.arrow'])
+def test_round_trip(tmp_path, extension):
+    path = str(tmp_path/('flight' + extension))
+    rows = recorded_rows(100)
+    with columnar_recorder.ColumnarRecorder(path, ['a', 'b'], batch_rows=32, metadata={'vessel': 'test'}) as recorder:
+        for i, row in enumerate(rows):
+            recorder.write(row, timestamp=1000.0 + i)
+    recording = columnar_recorder.open_columnar(path)
+    assert(recording.column_labels == ['host_time', 'a', 'b'])
+    assert(recording.metadata == {'vessel': 'test'})
+    assert(len(recording) == 100)
+    columns = recording.columns()
+    np.testing.assert_array_equal(columns['host_time'], 1000.0 + np.arange(100))
+    np.testing.assert_array_equal(np.column_stack([columns['a'], columns['b']]), rows)
+
+def test_rotation_and_pushdown_reads(tmp_path):
+    path = str(tmp_path/'flight.parquet')
+    with columnar_recorder.ColumnarRecorder(path, ['a', 'b'], batch_rows=16, rotate_interval=40.0) as recorder:
+        for i, row in enumerate(recorded_rows(100)):
+            recorder.write(row, timestamp=float(i))
+    assert([p.rsplit('.', 2)[1] for p in recorder.paths] == ['0000', '0001', '0002'])
+    # The base path finds the rotated files
+    recording = columnar_recorder.open_columnar(path)
+    assert(len(recording) == 100)
+    columns = recording.columns(['host_time', 'a'], start=35.0, end=45.0)
+    assert(sorted(columns) == ['a', 'host_time'])
+    assert(columns['a'].tolist() == list(range(35, 45)))
+
+def test_slow_rows_are_flushed_on_an_interval(tmp_path):
+    path = str(tmp_path/'flight.parquet')
+    recorder = columnar_recorder.ColumnarRecorder(path, ['a', 'b'], flush_interval=0.2)
+    for i in range(3):
+        recorder.write([i, i], timestamp=float(i))
+    assert(recorder.rows_written == 0)
+    time.sleep(0.25)
+    # A few rows a second still reach the file, not only once 4096 have built up
+    recorder.write([3, 3], timestamp=3.0)
+    assert(recorder.rows_written == 4)
+    recorder.write([4, 4], timestamp=4.0)
+    recorder.close()
+    assert(recorder.rows_written == 5)
+    assert(pq.ParquetFile(path).metadata.num_row_groups == 2)
@@ -0,0 +1,36 @@
+# Ian Dahlke, 2020
+
+import numpy as np
+import derived
+import krpc_logger
+import telemetry_store
+
+def test_running_extremes_skip_nan():
+    for operator, expected in [(derived.RunningMin(), 1.0), (derived.RunningMax(), 3.0)]:
+        results = [operator.update(t, np.array([x])) for t, x in enumerate([3.0, 1.0, np.nan])]
+        assert(np.isnan(results[-1]))
+        # The NaN left the extreme as it was
+        assert(operator.update(3, np.array([2.0]))[0] == expected)
+
+class LoggableRamp(krpc_logger.Loggable):
+    def __init__(self, connection, loggable_object, name, **options):
+        # The first value is read when the streams are probed
+        values = iter([0.0, 0.0, 4.0])
+        self.attribute_config = {
+            'x': {'sim_fun': lambda: next(values), 'stream_params': self.stream_params_attribute},
+        }
+        self.derived_config = {
+            'rate': self.derived_template('x', derived.Difference),
+        }
+        krpc_logger.Loggable.__init__(self, connection, loggable_object, name, **options)
+
+def test_update_uses_the_row_time():
+    # update() and the store compute the same rate for the same sample times
+    loggable = LoggableRamp(None, None, "ramp")
+    rates = [loggable.update(t)['ramp_rate'][0] for t in [10.0, 12.0]]
+
+    store = telemetry_store.TelemetryStore.from_loggables([LoggableRamp(None, None, "ramp")], capacity=10)
+    for t in [10.0, 12.0]:
+        store.sample(t)
+    assert(rates[-1] == 2.0)
+    assert(store.column('ramp_rate')[-1] == rates[-1])
@@ -0,0 +1,47 @@
+# Ian Dahlke, 2020
+
+import fleet
+import krpc_sim
+
+def test_attach_and_detach():
+    conn = krpc_sim.SimulatedConnection(seed=0, step=0.1)
+    vessel_fleet = fleet.Fleet(conn, conn.space_center, capacity=100, discovery_period=1.0)
+    attached = []
+    detached = []
+    vessel_fleet.on_attach.append(lambda telemetry: attached.append(telemetry.name))
+    vessel_fleet.on_detach.append(lambda telemetry: detached.append(telemetry.name))
+
+    vessel_fleet.tick(0.0)
+    assert(attached == ['Simulated Vessel'])
+    first = vessel_fleet.vessels[conn.space_center.active_vessel]
+    assert(len(first.store) == 1)
+
+    # A vessel with a name already logged gets a unique one, at the next discovery
+    debris = conn.launch('Simulated Vessel')
+    conn.advance()
+    vessel_fleet.tick(0.5)
+    assert(len(vessel_fleet) == 1)
+    conn.advance()
+    vessel_fleet.tick(1.0)
+    assert(attached == ['Simulated Vessel', 'Simulated Vessel (2)'])
+    assert(len(vessel_fleet.vessels[debris].store) == 1)
+    assert(len(first.store) == 3)
+
+    conn.destroy(debris)
+    conn.advance()
+    vessel_fleet.tick(2.0)
+    assert(detached == ['Simulated Vessel (2)'])
+    assert(list(vessel_fleet.vessels) == [conn.space_center.active_vessel])
+
+    vessel_fleet.close()
+    assert(len(vessel_fleet) == 0)
+    assert(detached == ['Simulated Vessel (2)', 'Simulated Vessel'])
+
+def test_ignored_vessels_are_not_attached():
+    conn = krpc_sim.SimulatedConnection(seed=0, step=0.1)
+    conn.launch()
+    vessel_fleet = fleet.Fleet(conn, conn.space_center, capacity=100, ignore=[conn.space_center.active_vessel])
+    vessel_fleet.tick(0.0)
+    assert(len(vessel_fleet) == 1)
+    assert(conn.space_center.active_vessel not in vessel_fleet.vessels)
+    vessel_fleet.close()
@@ -0,0 +1,67 @@
+# Ian Dahlke, 2020
+
+import numpy as np
+import pytest
+import flight_recorder
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path/'flight.ktyd')
+    rows = np.arange(300*3, dtype=float).reshape(300, 3)
+    rows[5, 1] = np.nan
+    # More rows than one batch, so both full and partial batches are written
+    with flight_recorder.FlightRecorder(path, ['a', 'b', 'c'], batch_rows=64, metadata={'vessel': 'test'}) as recorder:
+        for i, row in enumerate(rows):
+            recorder.write(row, timestamp=1000.0 + i)
+    assert(flight_recorder.is_recording(path))
+    recording = flight_recorder.open_recording(path)
+    assert(recording.column_labels == ['host_time', 'a', 'b', 'c'])
+    assert(recording.metadata == {'vessel': 'test'})
+    assert(len(recording) == 300)
+    np.testing.assert_array_equal(recording.data[:, 1:], rows)
+    np.testing.assert_array_equal(recording.column('host_time'), 1000.0 + np.arange(300))
+
+def test_partial_trailing_record_is_ignored(tmp_path):
+    path = str(tmp_path/'flight.ktyd')
+    with flight_recorder.FlightRecorder(path, ['a']) as recorder:
+        for i in range(3):
+            recorder.write([i], timestamp=i)
+    # An interrupted write leaves part of a record behind
+    with open(path, 'ab') as f:
+        f.write(b'\x00'*5)
+    recording = flight_recorder.open_recording(path)
+    assert(recording.column('a').tolist() == [0.0, 1.0, 2.0])
+
+def test_empty_recording(tmp_path):
+    path = str(tmp_path/'flight.ktyd')
+    flight_recorder.FlightRecorder(path, ['a', 'b']).close()
+    recording = flight_recorder.open_recording(path)
+    assert(len(recording) == 0)
+    assert(recording.data.shape == (0, 3))
+
+def test_replay_steps_through_every_record(tmp_path):
+    path = str(tmp_path/'flight.ktyd')
+    with flight_recorder.FlightRecorder(path, ['sc_ut']) as recorder:
+        for i in range(4):
+            recorder.write([10.0 + i], timestamp=100.0 + i)
+    replay = flight_recorder.ReplayConnection(flight_recorder.open_recording(path), speed=0)
+    stream = replay.add_stream(getattr, replay.object('sc'), 'ut')
+    replayed = []
+    # As fast as possible, the first tick gives the first record
+    with pytest.raises(StopIteration):
+        for tick in range(10):
+            replay.advance(float(tick))
+            replayed.append(stream())
+    assert(replayed == [10.0, 11.0, 12.0, 13.0])
+
+def test_replay_follows_recorded_time(tmp_path):
+    path = str(tmp_path/'flight.ktyd')
+    with flight_recorder.FlightRecorder(path, ['sc_ut']) as recorder:
+        for i in range(10):
+            recorder.write([10.0 + i], timestamp=100.0 + i)
+    replay = flight_recorder.ReplayConnection(flight_recorder.open_recording(path), speed=2.0)
+    stream = replay.add_stream(getattr, replay.object('sc'), 'ut')
+    replayed = []
+    for now in [50.0, 50.4, 51.0, 52.6]:
+        replay.advance(now)
+        replayed.append(stream())
+    assert(replayed == [10.0, 10.0, 12.0, 15.0])
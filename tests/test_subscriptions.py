@@ -0,0 +1,83 @@
+# Ian Dahlke, 2020
+
+import numpy as np
+import krpc_logger
+import subscriptions
+import telemetry_store
+
+class CountingStream:
+    def __init__(self, connection, fun, args):
+        self.connection = connection
+        self.fun = fun
+        self.args = args
+        connection.open_streams.append(self)
+
+    def __call__(self):
+        return(self.fun(*self.args))
+
+    def remove(self):
+        self.connection.open_streams.remove(self)
+
+class CountingConnection:
+    # Keeps track of the streams that have been added and not removed
+    def __init__(self):
+        self.open_streams = []
+
+    def add_stream(self, fun, *args):
+        return(CountingStream(self, fun, args))
+
+class Part:
+    a = 1.0
+    b = 2.0
+    c = (3.0, 4.0, 5.0)
+
+class LoggablePart(krpc_logger.Loggable):
+    def __init__(self, connection, loggable_object, name, **options):
+        self.attribute_config = {
+            'a': self.attribute_template_ranf(1),
+            'b': self.attribute_template_ranf(1),
+            'c': self.attribute_template_ranf(3),
+        }
+        krpc_logger.Loggable.__init__(self, connection, loggable_object, name, **options)
+
+def streamed(connection):
+    return(sorted(stream.args[1] for stream in connection.open_streams))
+
+def test_streams_follow_subscriber_counts():
+    conn = CountingConnection()
+    loggable = LoggablePart(conn, Part(), "part", lazy=True)
+    # The streams probed at setup are removed again
+    assert(streamed(conn) == [])
+    store = telemetry_store.TelemetryStore.from_loggables([loggable], capacity=10)
+    registry = subscriptions.SubscriptionRegistry(store)
+
+    registry.subscribe('plot', ['part_a'])
+    registry.subscribe('table', ['part_a', 'part_c_1', 'part_c_2'])
+    assert(streamed(conn) == ['a', 'c'])
+    assert(loggable.subscribers == {'a': 2, 'b': 0, 'c': 1})
+    assert(registry.streamed_columns() == ['part_a', 'part_c_0', 'part_c_1', 'part_c_2'])
+
+    # part_a still has a subscriber
+    registry.unsubscribe('plot')
+    assert(streamed(conn) == ['a', 'c'])
+    store.sample()
+    row = store.view(1)[0]
+    assert(row[0] == 1.0 and np.isnan(row[1]))
+    assert(row[2:].tolist() == [3.0, 4.0, 5.0])
+
+    registry.unsubscribe('table')
+    assert(streamed(conn) == [])
+    store.sample()
+    assert(np.isnan(store.view(1)[0]).all())
+
+def test_close_releases_every_consumer():
+    conn = CountingConnection()
+    loggable = LoggablePart(conn, Part(), "part", lazy=True)
+    store = telemetry_store.TelemetryStore.from_loggables([loggable], capacity=10)
+    registry = subscriptions.SubscriptionRegistry(store)
+    registry.subscribe_all('recorder')
+    registry.subscribe('plot', ['part_b'])
+    assert(streamed(conn) == ['a', 'b', 'c'])
+    registry.close()
+    assert(streamed(conn) == [])
+    assert(loggable.subscribers == {'a': 0, 'b': 0, 'c': 0})
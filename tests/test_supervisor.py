@@ -0,0 +1,92 @@
+# Ian Dahlke, 2020
+
+import pytest
+import supervisor
+
+class Connection:
+    def __init__(self, vessel):
+        self.vessel = vessel
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class Stop:
+    # Stands in for a threading.Event, keeping the delays waited for instead of waiting
+    def __init__(self):
+        self.delays = []
+
+    def is_set(self):
+        return(False)
+
+    def wait(self, delay):
+        self.delays.append(delay)
+        return(False)
+
+def flaky_connect(failures, vessel='Probe'):
+    attempts = []
+    def connect():
+        attempts.append(len(attempts))
+        if len(attempts) <= failures:
+            raise ConnectionRefusedError("Server not running")
+        return(Connection(vessel))
+    return(connect, attempts)
+
+def test_reconnect_backs_off():
+    connect, attempts = flaky_connect(5)
+    rebuilt = []
+    def rebuild(connection):
+        rebuilt.append(connection)
+        return(connection.vessel)
+    old = Connection('Probe')
+    watchdog = supervisor.Supervisor(old, connect, rebuild, lambda connection: connection.vessel, backoff=1.0, max_backoff=8.0)
+    stop = Stop()
+    assert(watchdog.failure(EOFError()))
+    assert(watchdog.recover(EOFError(), stop))
+    assert(stop.delays == [1.0, 2.0, 4.0, 8.0, 8.0])
+    assert(len(attempts) == 6)
+    assert(old.closed)
+    assert(watchdog.reconnects == 1)
+    assert(rebuilt == [watchdog.connection])
+
+def test_vessel_change_rebuilds_without_reconnecting():
+    connect, attempts = flaky_connect(0)
+    connection = Connection('Probe')
+    watchdog = supervisor.Supervisor(connection, connect, lambda connection: connection.vessel, lambda connection: connection.vessel, check_period=2.0)
+    watchdog.check(0.0)
+    connection.vessel = 'Lander'
+    # Not checked again until the check period is up
+    watchdog.check(1.0)
+    with pytest.raises(supervisor.VesselChanged) as error:
+        watchdog.check(2.0)
+    stop = Stop()
+    assert(watchdog.recover(error.value, stop))
+    assert(attempts == [])
+    assert(stop.delays == [])
+    assert(watchdog.watched == 'Lander')
+    watchdog.check(3.0)
+
+def test_stop_ends_retries():
+    connect, attempts = flaky_connect(100)
+    watchdog = supervisor.Supervisor(Connection('Probe'), connect, lambda connection: None, lambda connection: connection.vessel)
+    stop = Stop()
+    stop.wait = lambda delay: len(attempts) == 3
+    assert(not watchdog.recover(OSError(), stop))
+    assert(len(attempts) == 3)
+
+def test_only_connection_errors_are_recovered():
+    krpc_error = pytest.importorskip('krpc.error')
+    watchdog = supervisor.Supervisor(Connection('Probe'), None, None, lambda connection: connection.vessel)
+    for error in [ConnectionResetError(), EOFError(), krpc_error.ConnectionError(), krpc_error.StreamError(), supervisor.VesselChanged()]:
+        assert(watchdog.failure(error))
+    for error in [krpc_error.RPCError(), NotImplementedError(), RuntimeError(), ValueError()]:
+        assert(not watchdog.failure(error))
+
+def test_other_errors_stop_recovery():
+    def rebuild(connection):
+        raise NotImplementedError("Not supported by this server")
+    connect, attempts = flaky_connect(0)
+    watchdog = supervisor.Supervisor(Connection('Probe'), connect, rebuild, lambda connection: connection.vessel)
+    with pytest.raises(NotImplementedError):
+        watchdog.recover(OSError(), Stop())
+    assert(len(attempts) == 1)
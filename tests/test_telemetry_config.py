@@ -0,0 +1,50 @@
+# Ian Dahlke, 2020
+
+import glob
+import json
+import os
+import pytest
+import krpc_sim
+import telemetry_config
+
+PROFILES = sorted(glob.glob(os.path.join(os.path.dirname(telemetry_config.DEFAULT_PROFILE), '*.json')))
+
+@pytest.mark.parametrize('path', PROFILES)
+def test_shipped_profiles_load(path):
+    profile = telemetry_config.load(path)
+    assert(profile.loggers)
+
+def test_profile_narrows_loggers():
+    profile = telemetry_config.load(os.path.join(os.path.dirname(telemetry_config.DEFAULT_PROFILE), 'lean_ascent.json'))
+    conn = krpc_sim.SimulatedConnection(seed=0)
+    space_center = conn.space_center
+    loggers = {
+        loggable.name: loggable for loggable in profile.build_loggers(conn, lambda spec: spec.resolve(space_center, space_center.active_vessel))
+    }
+    assert(list(loggers) == ['sc', 'vessel', 'flight', 'orbit'])
+    assert(loggers['vessel'].column_labels == [
+        'vessel_met', 'vessel_thrust', 'vessel_mass', 'vessel_specific_impulse', 'vessel_mass_flow'
+    ])
+    assert(loggers['vessel'].attribute_config['specific_impulse']['sample_period'] == 1.0)
+    assert(loggers['orbit'].sample_period == 1.0)
+    assert(loggers['flight'].column_labels[-2:] == ['flight_acceleration', 'flight_climb_rate'])
+
+def write_profile(tmp_path, spec):
+    path = str(tmp_path/'profile.json')
+    with open(path, 'w') as f:
+        f.write(spec if isinstance(spec, str) else json.dumps(spec))
+    return(path)
+
+@pytest.mark.parametrize('spec', [
+    '{"period": ',
+    {'loggers': {}, 'colour': 'red'},
+    {'loggers': {'sc': {'class': 'LoggableNothing', 'object': 'space_center'}}},
+    {'loggers': {'sc': {'class': 'LoggableSpaceCenter', 'object': 'moon'}}},
+    {'loggers': {'flight': {'class': 'LoggableFlight', 'object': 'flight', 'derived': {'x': {'source': 'speed', 'operator': 'Formula'}}}}},
+    {'panels': {'p': {'lines': [{'y': 'flight_speed'}]}}},
+    {'panels': {}, 'layout': [['missing']]},
+    {'sinks': [{'rotate': 60}]},
+])
+def test_bad_profiles_are_rejected(tmp_path, spec):
+    with pytest.raises(telemetry_config.ProfileError):
+        telemetry_config.load(write_profile(tmp_path, spec))
@@ -0,0 +1,146 @@
+# Ian Dahlke, 2020
+
+import socket
+import time
+import numpy as np
+import pytest
+import telemetry_hub
+import telemetry_store
+
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+class RecordingRegistry:
+    # Stands in for a SubscriptionRegistry, keeping the consumers' labels
+    def __init__(self):
+        self.consumers = {}
+
+    def subscribe(self, consumer, labels):
+        self.consumers.setdefault(consumer, []).extend(labels)
+
+    def unsubscribe(self, consumer):
+        self.consumers.pop(consumer, None)
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert(time.monotonic() < deadline), "Timed out"
+        time.sleep(0.01)
+
+def start_publisher(store, registry):
+    publisher = telemetry_hub.TelemetryPublisher(store, registry, '127.0.0.1:0', period=0.1, publish_period=0.01)
+    publisher.start()
+    address = "{}:{}".format(*publisher.listener.address)
+    return(publisher, address)
+
+def test_backlog_then_live_rows():
+    store = telemetry_store.TelemetryStore(['x', 'y'], capacity=8)
+    publisher, address = start_publisher(store, RecordingRegistry())
+    try:
+        # More rows than the store keeps, only the newest 8 are sent
+        for i in range(12):
+            with store.lock:
+                store.append([i, 2*i], timestamp=100.0 + i)
+        wait_for(lambda: publisher.cursor == 12)
+        subscriber = telemetry_hub.TelemetrySubscriber(address, publisher.authkey)
+        assert(subscriber.period == 0.1)
+        wait_for(lambda: subscriber.store.total_rows == 12)
+        assert(subscriber.store.column('x').tolist() == list(range(4, 12)))
+        np.testing.assert_array_equal(subscriber.store.times(), store.times())
+
+        for i in range(12, 15):
+            with store.lock:
+                store.append([i, 2*i], timestamp=100.0 + i)
+        wait_for(lambda: subscriber.store.total_rows == 15)
+        np.testing.assert_array_equal(subscriber.store.view(), store.view())
+        subscriber.close()
+    finally:
+        publisher.stop()
+
+def test_reconnect_gets_backlog_and_releases_subscriptions():
+    store = telemetry_store.TelemetryStore(['x', 'y'], capacity=8)
+    registry = RecordingRegistry()
+    publisher, address = start_publisher(store, registry)
+    try:
+        subscriber = telemetry_hub.TelemetrySubscriber(address, publisher.authkey)
+        consumer = object()
+        subscriber.subscribe(consumer, ['y'])
+        wait_for(lambda: list(registry.consumers.values()) == [['y']])
+        for i in range(3):
+            with store.lock:
+                store.append([i, 2*i], timestamp=100.0 + i)
+        wait_for(lambda: subscriber.store.total_rows == 3)
+        # The hub lets go of a closed client's subscriptions
+        subscriber.close()
+        wait_for(lambda: registry.consumers == {})
+        assert(publisher.clients == {})
+
+        # A dashboard coming back, e.g. after a restart, starts from the backlog
+        for i in range(3, 5):
+            with store.lock:
+                store.append([i, 2*i], timestamp=100.0 + i)
+        replacement = telemetry_hub.TelemetrySubscriber(address, publisher.authkey)
+        wait_for(lambda: replacement.store.total_rows == 5)
+        assert(replacement.store.column('y').tolist() == [0, 2, 4, 6, 8])
+        replacement.close()
+    finally:
+        publisher.stop()
+
+def test_failed_handshakes_do_not_stop_the_hub():
+    store = telemetry_store.TelemetryStore(['x'], capacity=8)
+    publisher, address = start_publisher(store, RecordingRegistry())
+    try:
+        # One client hangs up before the handshake, one has the wrong key
+        socket.create_connection(publisher.listener.address).close()
+        with pytest.raises(AuthenticationError):
+            Client(publisher.listener.address, authkey=b'not the key')
+        subscriber = telemetry_hub.TelemetrySubscriber(address, publisher.authkey)
+        with store.lock:
+            store.append([1.0])
+        wait_for(lambda: subscriber.store.total_rows == 1)
+        subscriber.close()
+    finally:
+        publisher.stop()
+
+def test_slow_client_is_dropped():
+    store = telemetry_store.TelemetryStore(['x{}'.format(i) for i in range(1000)], capacity=100)
+    publisher = telemetry_hub.TelemetryPublisher(store, RecordingRegistry(), '127.0.0.1:0', publish_period=0.01, queue_length=2)
+    publisher.start()
+    address = "{}:{}".format(*publisher.listener.address)
+    try:
+        subscriber = telemetry_hub.TelemetrySubscriber(address, publisher.authkey)
+        # Connected but never reading, so its socket buffers fill up
+        stalled = Client(publisher.listener.address, authkey=publisher.authkey)
+        wait_for(lambda: len(publisher.clients) == 2)
+        rows = 0
+        while len(publisher.clients) == 2:
+            with store.lock:
+                for i in range(100):
+                    store.append(np.full(1000, float(rows)))
+                    rows += 1
+            # Slow enough for the other subscriber to keep up
+            time.sleep(0.05)
+            assert(rows < 100000), "The stalled client was never dropped"
+        # The other subscriber kept up all along
+        wait_for(lambda: subscriber.store.total_rows == rows)
+        assert(subscriber.store.view(1)[0, 0] == rows - 1)
+        subscriber.close()
+        stalled.close()
+    finally:
+        publisher.stop()
+
+def test_key_is_required_off_loopback(monkeypatch):
+    store = telemetry_store.TelemetryStore(['x'], capacity=8)
+    monkeypatch.delenv(telemetry_hub.AUTHKEY_VARIABLE, raising=False)
+    with pytest.raises(ValueError):
+        telemetry_hub.TelemetryPublisher(store, RecordingRegistry(), '0.0.0.0:0')
+    with pytest.raises(ValueError):
+        telemetry_hub.TelemetrySubscriber('127.0.0.1:0')
+    monkeypatch.setenv(telemetry_hub.AUTHKEY_VARIABLE, 'secret')
+    publisher = telemetry_hub.TelemetryPublisher(store, RecordingRegistry(), '0.0.0.0:0')
+    assert(publisher.authkey == b'secret')
+    assert(not publisher.generated_authkey)
+    # Each loopback hub makes up its own key
+    monkeypatch.delenv(telemetry_hub.AUTHKEY_VARIABLE)
+    keys = [telemetry_hub.TelemetryPublisher(store, RecordingRegistry(), '127.0.0.1:0').authkey for i in range(2)]
+    assert(keys[0] != keys[1])
@@ -0,0 +1,16 @@
+# Ian Dahlke, 2020
+
+import telemetry_query
+import telemetry_store
+
+def test_live_key_going_backwards():
+    # vessel_met starts over at a vessel switch
+    store = telemetry_store.TelemetryStore(['vessel_met', 'x'], capacity=20)
+    met = [0.0, 1.0, 2.0, 3.0, 0.5, 1.5, 2.5]
+    for i, t in enumerate(met):
+        store.append([t, i], timestamp=float(i))
+    result = telemetry_query.query(store, ['x'], start=1.0, end=2.0, key='vessel_met')
+    assert(list(result['vessel_met']) == [1.0, 1.5])
+    assert(list(result['x']) == [1.0, 5.0])
+    # A monotonic key is still found by binary search, with the same result
+    assert(list(telemetry_query.query(store, ['x'], start=1.0, end=3.0, key='x')['x']) == [1.0, 2.0])
@@ -0,0 +1,63 @@
+# Ian Dahlke, 2020
+
+import numpy as np
+import telemetry_store
+
+def test_wraparound_keeps_newest_rows():
+    store = telemetry_store.TelemetryStore(['x', 'y'], capacity=4)
+    for i in range(11):
+        store.append([i, -i], timestamp=100.0 + i)
+    assert(len(store) == 4)
+    assert(store.total_rows == 11)
+    assert(store.column('x').tolist() == [7, 8, 9, 10])
+    assert(store.column('y', 2).tolist() == [-9, -10])
+    assert(store.times().tolist() == [107.0, 108.0, 109.0, 110.0])
+
+def test_compaction_moves_newest_half_to_front():
+    store = telemetry_store.TelemetryStore(['x'], capacity=3)
+    for i in range(6):
+        store.append([i], timestamp=i)
+    assert(store._head == 6)
+    # The next row needs room, the newest three rows go to the front
+    store.append([6], timestamp=6)
+    assert(store._head == 4)
+    assert(store.column('x').tolist() == [4, 5, 6])
+    assert(np.shares_memory(store.view(), store._buffer))
+
+def test_rows_since_is_capped_by_capacity():
+    store = telemetry_store.TelemetryStore(['x'], capacity=5)
+    for i in range(3):
+        store.append([i])
+    seen = store.total_rows
+    for i in range(8):
+        store.append([i])
+    assert(store.rows_since(seen) == 5)
+    assert(store.rows_since(store.total_rows - 2) == 2)
+
+def test_history_query_decimates_to_min_max():
+    history = telemetry_store.HistoryStore(['met', 'x'], 'met', fan=4)
+    met = np.arange(1000.0)
+    history.extend(np.column_stack([met, np.sin(met/50)]))
+    block = history.query(100.0, 899.0, 50)
+    assert(50 <= len(block)//2 <= 4*50)
+    # Every bin keeps the extremes of the rows it stands for
+    assert(np.nanmin(block[:, 1]) == np.sin(met[99:901]/50).min())
+    assert(np.nanmax(block[:, 1]) == np.sin(met[99:901]/50).max())
+    # Zoomed in far enough the rows come back as they are
+    assert(history.query(10.0, 20.0, 50)[:, 0].tolist() == list(np.arange(9.0, 22.0)))
+
+def test_history_query_after_key_goes_backwards():
+    # vessel_met starts again after a switch to another vessel
+    history = telemetry_store.HistoryStore(['met', 'x'], 'met', fan=4)
+    history.extend(np.column_stack([np.arange(100.0), np.full(100, 1.0)]))
+    history.extend(np.column_stack([np.arange(60.0), np.full(60, 2.0)]))
+    assert(history.segment_starts == [0, 100])
+    block = history.query(10.0, 20.0, 100)
+    # Both vessels' rows, with a NaN row between them
+    first, second = np.split(block, np.flatnonzero(np.isnan(block[:, 0])))
+    assert(first[:, 0].tolist() == list(np.arange(9.0, 22.0)))
+    assert((first[:, 1] == 1.0).all())
+    assert(second[1:, 0].tolist() == list(np.arange(9.0, 22.0)))
+    assert((second[1:, 1] == 2.0).all())
+    # Only the first vessel reached 80 s
+    assert((history.query(80.0, 90.0, 100)[:, 1] == 1.0).all())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Ian Dahlke, 2020
+
+"""
+Vectors
+Vector channels and the math on them. An attribute that streams a tuple (velocity, rotation, aerodynamic_force, PID gains, ...) fills k adjacent columns of the store, so the newest N samples of it are a zero-copy (N, k) float array: TelemetryStore.vector('flight_velocity'). The functions here work on whole (N, k) arrays at once (or single k-vectors), so nothing is looped over or split into scalar columns until a CSV, a DataFrame or a plot needs it.
+
+Quaternions are krpc's (x, y, z, w). Rotating by a rotation quaternion such as Vessel.rotation(frame) takes a vector from the vessel's frame into `frame`; its conjugate takes it back.
+"""
+
+import re
+import numpy as np
+
+# name_0, name_1, ... as split by krpc_logger
+_ELEMENT = re.compile(r'^(.*)_(\d+)$')
+
+def vector_layout(column_labels):
+    """
+    {name: slice of columns} for every run of adjacent name_0 ... name_{k-1}
+    labels with k > 1, for column labels with no logger to say which are vectors,
+    e.g. a recording.
+    """
+    layout = {}
+    name, start = None, None
+    for i, label in enumerate(list(column_labels) + [None]):
+        match = _ELEMENT.match(label) if label is not None else None
+        if match is not None and match.group(1) == name and int(match.group(2)) == i - start:
+            continue
+        if name is not None and i - start > 1:
+            layout[name] = slice(start, i)
+        name, start = (match.group(1), i) if match is not None and match.group(2) == '0' else (None, None)
+    return(layout)
+
+def labels(name, width):
+    """The scalar column labels of a vector channel."""
+    return(["{}_{}".format(name, i) for i in range(width)])
+
+def split(name, values):
+    """An (N, k) vector as {name_i: column}, for the edges that want scalar columns."""
+    values = np.asarray(values)
+    return({label: values[..., i] for i, label in enumerate(labels(name, values.shape[-1]))})
+
+def norm(v):
+    return(np.sqrt(np.einsum('...i,...i->...', v, v)))
+
+def unit(v):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return(v/norm(v)[..., None])
+
+def dot(a, b):
+    return(np.einsum('...i,...i->...', a, b))
+
+def angle(a, b):
+    """Angle between vectors in degrees, like krpc's angles."""
+    cosine = dot(unit(a), unit(b))
+    return(np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0))))
+
+def conjugate(q):
+    return(np.asarray(q)*np.array([-1.0, -1.0, -1.0, 1.0]))
+
+def rotate(q, v):
+    """Rotate vectors v (..., 3) by unit quaternions q (..., 4), pairwise or broadcast."""
+    q = np.asarray(q, dtype=float)
+    u, w = q[..., :3], q[..., 3:]
+    # v + 2w(u x v) + 2u x (u x v)
+    t = 2*np.cross(u, v)
+    return(v + w*t + np.cross(u, t))
+
+def to_frame(v, rotation):
+    """Vectors given in a reference frame, in the frame of an object with that rotation, e.g. velocity in the vessel's frame."""
+    return(rotate(conjugate(rotation), v))
+
+def from_frame(v, rotation):
+    """The inverse of to_frame(): vectors in an object's frame, in the reference frame its rotation is given in."""
+    return(rotate(rotation, v))